@@ -13,6 +13,8 @@ import os
 
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 ENV = os.environ
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +32,13 @@ DEBUG = ENV.get('DJANGO_DEBUG', True)
 
 ALLOWED_HOSTS = ENV.get('DJANGO_ALLOWED_HOSTS', '').split(' ')
 
+# Process profile: `full` - everything (manage.py, admin), `api` - the JSON account API only,
+# `worker` - the Celery worker (models and tasks only). Slim profiles start faster and smaller,
+# see `manage.py benchmark_startup`.
+PROCESS_PROFILE = ENV.get('DJANGO_PROCESS_PROFILE', 'full')
+if PROCESS_PROFILE not in ('full', 'api', 'worker'):
+    raise ImproperlyConfigured('DJANGO_PROCESS_PROFILE should be one of full, api, worker')
+
 
 # Application definition
 
@@ -50,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +88,38 @@ TEMPLATES = [
     },
 ]
 
+# Reverse proxies in front of the app (nginx): the client address of the throttle buckets is
+# the hop they appended to X-Forwarded-For, so clients cannot pick it by sending the header.
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(ENV.get('DJANGO_NUM_PROXIES', 1)),
+}
+
+# The API profile drops admin, sessions, messages, static files, templates and the browsable API:
+# admins authenticate to import/export by HTTP Basic. The worker profile loads the models only.
+if PROCESS_PROFILE == 'api':
+    INSTALLED_APPS = [
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'rest_framework',
+        'core',
+    ]
+    MIDDLEWARE = [
+        'core.middleware.MetricsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+    TEMPLATES = []
+    REST_FRAMEWORK.update({
+        'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+        'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.BasicAuthentication'],
+    })
+elif PROCESS_PROFILE == 'worker':
+    INSTALLED_APPS = ['core']
+    MIDDLEWARE = []
+    TEMPLATES = []
+    # Celery runs the system checks at start, which import the URL configuration
+    ROOT_URLCONF = 'BankSubscriberAccount.worker_urls'
+
 WSGI_APPLICATION = 'BankSubscriberAccount.wsgi.application'
 
 
@@ -92,9 +134,34 @@ DATABASES = {
         'NAME': ENV.get('POSTGRES_DB', 'bankaccount'),
         'USER': ENV.get('POSTGRES_USER', 'postgres'),
         'PASSWORD': ENV['POSTGRES_PASSWORD'],
+        # Keep connections open between requests and tasks for this many seconds, 0 closes after each one
+        'CONN_MAX_AGE': int(ENV.get('DJANGO_DB_CONN_MAX_AGE', 60)),
+        # Required behind PgBouncer in transaction pooling mode
+        'DISABLE_SERVER_SIDE_CURSORS': ENV.get('DJANGO_DB_DISABLE_SERVER_SIDE_CURSORS', 'False').lower() in ('true', '1'),
     },
 }
 
+# Read replicas, one alias per host: `status` and `list` read from a replica in sync
+# with the primary, see `core.routers.ReplicaRouter`
+DATABASE_REPLICAS = []
+for number, host in enumerate(ENV.get('DJANGO_DATABASE_REPLICA_HOSTS', '').split(), start=1):
+    DATABASES[f'replica_{number}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+DATABASE_REPLICA_MAX_LAG = float(ENV.get('DJANGO_DATABASE_REPLICA_MAX_LAG', 1))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = float(ENV.get('DJANGO_DATABASE_REPLICA_LAG_CHECK_INTERVAL', 1))
+# Read accounts from the primary this long after a write, longer than the allowed lag
+DATABASE_REPLICA_STICKY_SECONDS = int(ENV.get('DJANGO_DATABASE_REPLICA_STICKY_SECONDS', 5))
+DATABASE_REPLICA_CACHE_ALIAS = ENV.get('DJANGO_DATABASE_REPLICA_CACHE_ALIAS', 'default')
+
+# Check persistent connections before every request and Celery task, see `core.db.check_connections`
+DATABASE_CONN_HEALTH_CHECKS = ENV.get('DJANGO_DB_CONN_HEALTH_CHECKS', 'False').lower() in ('true', '1')
+
+# Covering index columns (`Index.include`) need PostgreSQL 11+, other backends build plain indexes.
+# The check is not silenced on PostgreSQL, where it reports a server too old for them.
+if 'postgresql' not in DATABASES['default']['ENGINE']:
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -114,15 +181,165 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': ENV.get('DJANGO_CACHE_BACKEND', 'django_redis.cache.RedisCache'),
+        'LOCATION': ENV.get('DJANGO_CACHE_LOCATION', 'redis://redis:6379/1'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': 1,
+            'SOCKET_TIMEOUT': 1,
+        },
+    },
+}
+
+# Cache outage is served as a miss, not as an error
+DJANGO_REDIS_IGNORE_EXCEPTIONS = True
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+
+ACCOUNT_STATUS_CACHE_ALIAS = ENV.get('ACCOUNT_STATUS_CACHE_ALIAS', 'default')
+ACCOUNT_STATUS_CACHE_TIMEOUT = int(ENV.get('ACCOUNT_STATUS_CACHE_TIMEOUT', 60))
+# Version keys of the status cache expire too, not earlier than the payloads
+ACCOUNT_STATUS_CACHE_VERSION_TIMEOUT = max(
+    int(ENV.get('ACCOUNT_STATUS_CACHE_VERSION_TIMEOUT', 3600)),
+    ACCOUNT_STATUS_CACHE_TIMEOUT
+)
+
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_BROKER', 'redis://redis:6379/0')
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
+# Recycle pool processes after this many tasks, 0 never. Celery closes the connections
+# inherited from the parent in every new process.
+CELERY_WORKER_MAX_TASKS_PER_CHILD = int(ENV.get('CELERY_WORKER_MAX_TASKS_PER_CHILD', 0)) or None
+
+# Account change events: add/subtract/settlement write OutboxEvent records in their transaction,
+# `relay_events` publishes them to Redis Streams (the Celery broker by default)
+ACCOUNT_EVENTS_ENABLED = ENV.get('ACCOUNT_EVENTS_ENABLED', 'True').lower() in ('true', '1')
+ACCOUNT_EVENTS_REDIS_URL = ENV.get('ACCOUNT_EVENTS_REDIS_URL', CELERY_BROKER_URL)
+ACCOUNT_EVENTS_STREAM = ENV.get('ACCOUNT_EVENTS_STREAM', 'account-events')
+ACCOUNT_EVENTS_STREAM_PARTITIONS = int(ENV.get('ACCOUNT_EVENTS_STREAM_PARTITIONS', 1))
+# Approximate stream length cap, 0 keeps all entries
+ACCOUNT_EVENTS_STREAM_MAXLEN = int(ENV.get('ACCOUNT_EVENTS_STREAM_MAXLEN', 1000000))
+ACCOUNT_EVENTS_RELAY_BATCH_SIZE = int(ENV.get('ACCOUNT_EVENTS_RELAY_BATCH_SIZE', 1000))
+ACCOUNT_EVENTS_RELAY_IDLE_SECONDS = float(ENV.get('ACCOUNT_EVENTS_RELAY_IDLE_SECONDS', 0.5))
+
+# Hold settlement
+SUBTRACT_HOLD_CHUNK_SIZE = int(ENV.get('SUBTRACT_HOLD_CHUNK_SIZE', 10000))
+SUBTRACT_HOLD_PARTITIONS = int(ENV.get('SUBTRACT_HOLD_PARTITIONS', 1))
+SUBTRACT_HOLD_PARTITION_RETRIES = int(ENV.get('SUBTRACT_HOLD_PARTITION_RETRIES', 3))
+SUBTRACT_HOLD_PARTITION_RETRY_DELAY = int(ENV.get('SUBTRACT_HOLD_PARTITION_RETRY_DELAY', 10))
+# Settle only the accounts queued by subtract since the last run instead of scanning the table
+SUBTRACT_HOLD_QUEUE_ENABLED = ENV.get('SUBTRACT_HOLD_QUEUE_ENABLED', 'True').lower() in ('true', '1')
+# Settlement schedule: run every `SUBTRACT_HOLD_INTERVAL` seconds, down to a few seconds for
+# micro-batches. Per run budget of queued settlement, 0 is unlimited.
+SUBTRACT_HOLD_INTERVAL = int(ENV.get('SUBTRACT_HOLD_INTERVAL', 600))
+SUBTRACT_HOLD_RUN_MAX_ROWS = int(ENV.get('SUBTRACT_HOLD_RUN_MAX_ROWS', 0))
+SUBTRACT_HOLD_RUN_MAX_SECONDS = float(ENV.get('SUBTRACT_HOLD_RUN_MAX_SECONDS', 0))
+# Queued chunks are sized to take about `SUBTRACT_HOLD_CHUNK_SECONDS` by the measured time per row,
+# between `SUBTRACT_HOLD_MIN_CHUNK_SIZE` and `SUBTRACT_HOLD_CHUNK_SIZE`, 0 keeps the chunk size fixed
+SUBTRACT_HOLD_CHUNK_SECONDS = float(ENV.get('SUBTRACT_HOLD_CHUNK_SECONDS', 0.5))
+SUBTRACT_HOLD_MIN_CHUNK_SIZE = int(ENV.get('SUBTRACT_HOLD_MIN_CHUNK_SIZE', 100))
+# Single-runner lock of the settlement task, the cache must be shared by all workers. It expires
+# after `SUBTRACT_HOLD_LOCK_TIMEOUT` seconds if the run dies, which must be above the longest run:
+# the run budget of queued settlement, the retries of a partition with fan-out.
+SUBTRACT_HOLD_LOCK_CACHE_ALIAS = ENV.get('SUBTRACT_HOLD_LOCK_CACHE_ALIAS', 'default')
+SUBTRACT_HOLD_LOCK_TIMEOUT = int(ENV.get('SUBTRACT_HOLD_LOCK_TIMEOUT', 900))
+if SUBTRACT_HOLD_LOCK_TIMEOUT < max(
+    SUBTRACT_HOLD_RUN_MAX_SECONDS,
+    SUBTRACT_HOLD_PARTITION_RETRIES * SUBTRACT_HOLD_PARTITION_RETRY_DELAY if SUBTRACT_HOLD_PARTITIONS > 1 else 0
+):
+    raise ImproperlyConfigured('SUBTRACT_HOLD_LOCK_TIMEOUT should cover the longest settlement run')
+
+# Money amounts are stored as integer minor units, the API and files use decimal strings with
+# `ACCOUNT_CURRENCY_DECIMAL_PLACES` places. Stored amounts do not follow a change of it, the
+# conversion of the former decimal columns (migration 0009) needs at least 2.
+ACCOUNT_CURRENCY_DECIMAL_PLACES = int(ENV.get('ACCOUNT_CURRENCY_DECIMAL_PLACES', 2))
+
+# Account list endpoint
+ACCOUNT_LIST_PAGE_SIZE = int(ENV.get('ACCOUNT_LIST_PAGE_SIZE', 100))
+ACCOUNT_LIST_MAX_PAGE_SIZE = int(ENV.get('ACCOUNT_LIST_MAX_PAGE_SIZE', 1000))
+ACCOUNT_LIST_STREAM_CHUNK_SIZE = int(ENV.get('ACCOUNT_LIST_STREAM_CHUNK_SIZE', 2000))
+
+# Bulk import and export of accounts, rows per COPY, INSERT or `.iterator()` chunk
+ACCOUNT_TRANSFER_BATCH_SIZE = int(ENV.get('ACCOUNT_TRANSFER_BATCH_SIZE', 10000))
+
+# Render API responses with orjson (optional dependency)
+ACCOUNT_API_ORJSON = ENV.get('ACCOUNT_API_ORJSON', 'False').lower() in ('true', '1')
+
+# Database threads of async endpoints per ASGI worker
+ASYNC_DB_THREADS = int(ENV.get('ASYNC_DB_THREADS', 16))
+
+# Batch operations endpoint
+ACCOUNT_BATCH_MAX_ITEMS = int(ENV.get('ACCOUNT_BATCH_MAX_ITEMS', 10000))
+ACCOUNT_BATCH_WRITE_SIZE = int(ENV.get('ACCOUNT_BATCH_WRITE_SIZE', 1000))
+
+# Idempotency-Key support of add/subtract, empty cache alias disables the cache front
+ACCOUNT_IDEMPOTENCY_TTL = int(ENV.get('ACCOUNT_IDEMPOTENCY_TTL', 86400))
+ACCOUNT_IDEMPOTENCY_KEY_MAX_LENGTH = 255
+ACCOUNT_IDEMPOTENCY_CACHE_ALIAS = ENV.get('ACCOUNT_IDEMPOTENCY_CACHE_ALIAS', 'default')
+ACCOUNT_IDEMPOTENCY_PURGE_CHUNK_SIZE = int(ENV.get('ACCOUNT_IDEMPOTENCY_PURGE_CHUNK_SIZE', 10000))
+
+# Ledger mode: add/subtract/settlement append AccountLedgerEntry records,
+# balances are derived from AccountSnapshot plus the entries after it.
+ACCOUNT_LEDGER_ENABLED = ENV.get('ACCOUNT_LEDGER_ENABLED', 'False').lower() in ('true', '1')
+ACCOUNT_LEDGER_COMPACTION_LAG = int(ENV.get('ACCOUNT_LEDGER_COMPACTION_LAG', 60))
+ACCOUNT_LEDGER_COMPACTION_INTERVAL = int(ENV.get('ACCOUNT_LEDGER_COMPACTION_INTERVAL', 300))
+
+# Account totals of the `stats` action, kept in AccountRollup rows updated by every change.
+# Deltas are spread over `ACCOUNT_ROLLUP_SHARDS` rows per status, reconciled with a full
+# recomputation every `ACCOUNT_ROLLUP_RECONCILE_INTERVAL` seconds
+ACCOUNT_ROLLUP_ENABLED = ENV.get('ACCOUNT_ROLLUP_ENABLED', 'True').lower() in ('true', '1')
+ACCOUNT_ROLLUP_SHARDS = int(ENV.get('ACCOUNT_ROLLUP_SHARDS', 16))
+ACCOUNT_ROLLUP_RECONCILE_INTERVAL = int(ENV.get('ACCOUNT_ROLLUP_RECONCILE_INTERVAL', 3600))
+
+# Hot accounts: adds go to one of the account balance slots (set by `hot_account` command),
+# moved back to the account record every `ACCOUNT_HOT_SLOTS_CONSOLIDATE_INTERVAL` seconds
+ACCOUNT_HOT_SLOTS_MAX = int(ENV.get('ACCOUNT_HOT_SLOTS_MAX', 64))
+ACCOUNT_HOT_SLOTS_CONSOLIDATE_INTERVAL = int(ENV.get('ACCOUNT_HOT_SLOTS_CONSOLIDATE_INTERVAL', 60))
+
+# Hold reservations: every subtract hold is a reservation row, captured by the settlement or,
+# with `hold_seconds` (up to `ACCOUNT_RESERVATION_MAX_SECONDS`), captured or released by the
+# client and released once expired, swept every `ACCOUNT_RESERVATION_SWEEP_INTERVAL` seconds.
+# Not used in ledger mode. Settle the queued holds before turning it on.
+ACCOUNT_RESERVATIONS_ENABLED = ENV.get('ACCOUNT_RESERVATIONS_ENABLED', 'False').lower() in ('true', '1')
+ACCOUNT_RESERVATION_MAX_SECONDS = int(ENV.get('ACCOUNT_RESERVATION_MAX_SECONDS', 604800))
+ACCOUNT_RESERVATION_SWEEP_INTERVAL = int(ENV.get('ACCOUNT_RESERVATION_SWEEP_INTERVAL', 60))
+
+# Admission control of the account API, Redis token buckets of `*_RATE` tokens per second up to
+# `*_BURST` (rate 0 is unlimited): mutations per account and per client, reads (`status`, list)
+# per client. At most `ACCOUNT_MUTATION_CONCURRENCY` mutations in flight over all workers
+# (0 is unlimited). Refused requests get 429 with `Retry-After`, Redis errors let requests through.
+ACCOUNT_THROTTLE_ENABLED = ENV.get('ACCOUNT_THROTTLE_ENABLED', 'False').lower() in ('true', '1')
+ACCOUNT_THROTTLE_REDIS_URL = ENV.get('ACCOUNT_THROTTLE_REDIS_URL', CELERY_BROKER_URL)
+ACCOUNT_THROTTLE_REDIS_TIMEOUT = float(ENV.get('ACCOUNT_THROTTLE_REDIS_TIMEOUT', 0.05))
+ACCOUNT_THROTTLE_ACCOUNT_RATE = float(ENV.get('ACCOUNT_THROTTLE_ACCOUNT_RATE', 50))
+ACCOUNT_THROTTLE_ACCOUNT_BURST = float(ENV.get('ACCOUNT_THROTTLE_ACCOUNT_BURST', 100))
+ACCOUNT_THROTTLE_CLIENT_RATE = float(ENV.get('ACCOUNT_THROTTLE_CLIENT_RATE', 500))
+ACCOUNT_THROTTLE_CLIENT_BURST = float(ENV.get('ACCOUNT_THROTTLE_CLIENT_BURST', 1000))
+ACCOUNT_THROTTLE_READ_RATE = float(ENV.get('ACCOUNT_THROTTLE_READ_RATE', 2000))
+ACCOUNT_THROTTLE_READ_BURST = float(ENV.get('ACCOUNT_THROTTLE_READ_BURST', 4000))
+ACCOUNT_MUTATION_CONCURRENCY = int(ENV.get('ACCOUNT_MUTATION_CONCURRENCY', 0))
+# In-flight slots of workers died mid-request are dropped after `ACCOUNT_MUTATION_SLOT_TIMEOUT` seconds
+ACCOUNT_MUTATION_SLOT_TIMEOUT = float(ENV.get('ACCOUNT_MUTATION_SLOT_TIMEOUT', 30))
+ACCOUNT_MUTATION_RETRY_AFTER = float(ENV.get('ACCOUNT_MUTATION_RETRY_AFTER', 1))
+
+# Request and flow metrics, exposed for Prometheus at `/metrics` (internal, not proxied by nginx)
+METRICS_ENABLED = ENV.get('METRICS_ENABLED', 'True').lower() in ('true', '1')
+METRICS_CACHE_ALIAS = ENV.get('METRICS_CACHE_ALIAS', 'default')
+METRICS_FLUSH_INTERVAL = int(ENV.get('METRICS_FLUSH_INTERVAL', 5))
+METRICS_PROCESS_TTL = int(ENV.get('METRICS_PROCESS_TTL', 3600))
+# Log requests slower than this to `logs/slow.log` with their SQL, 0 disables
+METRICS_SLOW_REQUEST_SECONDS = float(ENV.get('METRICS_SLOW_REQUEST_SECONDS', 1))
+METRICS_SLOW_REQUEST_MAX_SQL = int(ENV.get('METRICS_SLOW_REQUEST_MAX_SQL', 100))
 
 
 LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 
+# File handlers open their files on the first record (`delay`), not at the process start
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -139,7 +356,8 @@ LOGGING = {
             'filename': os.path.join(LOGS_DIR, 'debug.log'),
             'maxBytes': 10000000,  # 10 Mb
             'backupCount': 10,
-            'formatter': 'default'
+            'formatter': 'default',
+            'delay': True
         },
         'warn_file': {
             'level': 'WARNING',
@@ -147,7 +365,8 @@ LOGGING = {
             'filename': os.path.join(LOGS_DIR, 'warn.log'),
             'maxBytes': 10000000,  # 10 Mb
             'backupCount': 10,
-            'formatter': 'default'
+            'formatter': 'default',
+            'delay': True
         },
         'error_file': {
             'level': "ERROR",
@@ -155,7 +374,17 @@ LOGGING = {
             'filename': os.path.join(LOGS_DIR, 'error.log'),
             'maxBytes': 10000000,  # 10 Mb
             'backupCount': 10,
-            'formatter': 'default'
+            'formatter': 'default',
+            'delay': True
+        },
+        'slow_file': {
+            'level': 'WARNING',
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(LOGS_DIR, 'slow.log'),
+            'maxBytes': 10000000,  # 10 Mb
+            'backupCount': 10,
+            'formatter': 'default',
+            'delay': True
         },
         'console': {
             'level': 'INFO',
@@ -167,6 +396,11 @@ LOGGING = {
             'handlers': ['file', 'error_file'],
             'level': 'DEBUG',
             'propagate': True,
+        },
+        'core.metrics': {
+            'handlers': ['slow_file'],
+            'level': 'WARNING',
+            'propagate': False,
         }
     },
 }
@@ -13,11 +13,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
 
+from core.views import metrics_view
+
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/', include('core.urls'))
+    path('api/', include('core.urls')),
+    # Internal, scraped from the web containers directly
+    path('metrics', metrics_view, name='metrics')
 ]
+
+# Not installed in the `api` process profile
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
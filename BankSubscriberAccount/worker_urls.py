@@ -0,0 +1,5 @@
+"""URL configuration of the `worker` process profile: the worker serves no requests,
+so the system checks run by Celery do not import the API views.
+"""
+
+urlpatterns = []
@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_started
+        from django.db.models.signals import post_delete
+
+        from core.db import check_connections
+        from core.models import BankAccount, account_deleted
+
+        # After `close_old_connections`, which Django connects first
+        request_started.connect(check_connections)
+        if settings.PROCESS_PROFILE != 'api':
+            # The API process runs no tasks and does not import Celery
+            from celery.signals import task_prerun
+
+            task_prerun.connect(check_connections)
+        post_delete.connect(account_deleted, sender=BankAccount)
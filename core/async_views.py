@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+from core.db import check_connections
+from core.views import BankAccountViewSet
+
+logger = logging.getLogger(__name__)
+
+# Django ORM and cache clients are synchronous. Every blocking action runs in
+# this bounded pool, each thread keeps its own database connection, so the
+# pool size caps the connections of an ASGI worker while the event loop keeps
+# accepting requests.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS,
+    thread_name_prefix='account-db'
+)
+
+
+def run_view(view, request, kwargs):
+    """Run sync view in a pool thread and render the response there."""
+    close_old_connections()
+    check_connections()
+    try:
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_action(actions: dict):
+    """Build async view of BankAccountViewSet `actions` running on `db_executor`."""
+    view = BankAccountViewSet.as_view(actions)
+
+    async def async_view(request, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(db_executor, run_view, view, request, kwargs)
+
+    async_view.csrf_exempt = True
+    return async_view
+
+
+account_add = async_action({'post': 'add'})
+account_subtract = async_action({'post': 'subtract'})
+account_status = async_action({'get': 'status'})
+_account_list = async_action({'get': 'list'})
+
+
+async def account_list(request, **kwargs):
+    """Cursor paginated accounts list. NDJSON streaming reads the database while
+    the response is sent, so it is served by the WSGI endpoint only.
+    """
+    if request.GET.get('stream', '').lower() in ('true', '1'):
+        return JsonResponse({'detail': 'Streaming is not available on async endpoints'}, status=400)
+    return await _account_list(request, **kwargs)
+
+account_list.csrf_exempt = True
@@ -0,0 +1,74 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.transaction import on_commit
+
+from core.metrics import metrics
+from core.routers import replica_router
+
+logger = logging.getLogger(__name__)
+
+
+class AccountStatusCache(object):
+    """Read-through cache of `status` action payload keyed by account id.
+
+    Every account has a version key, writers bump it after commit. A payload
+    is stored with the version read before the database query and served only
+    while that version is current, so a payload read before a write is never
+    served after it.
+
+    Version keys expire after `ACCOUNT_STATUS_CACHE_VERSION_TIMEOUT`, not before
+    the payloads. A version key is created with the current time in nanoseconds,
+    so a recreated version never matches a payload of an expired one. Hits and
+    misses are exported as `bank_cache_lookups_total`.
+    """
+    key_prefix = 'account:status'
+    metrics_name = 'account_status'
+
+    @property
+    def cache(self):
+        return caches[settings.ACCOUNT_STATUS_CACHE_ALIAS]
+
+    def data_key(self, pk) -> str:
+        return f'{self.key_prefix}:{pk}'
+
+    def version_key(self, pk) -> str:
+        return f'{self.key_prefix}:{pk}:version'
+
+    def get(self, pk):
+        """Return `(payload, version)`, payload is None on miss."""
+        data_key, version_key = self.data_key(pk), self.version_key(pk)
+        values = self.cache.get_many([data_key, version_key])
+        version = values.get(version_key)
+        cached = values.get(data_key)
+        hit = cached is not None and cached[0] == version
+        if settings.METRICS_ENABLED:
+            metrics.increment('cache', self.metrics_name, 'hit' if hit else 'miss')
+        return (cached[1] if hit else None), version
+
+    def set(self, pk, payload, version):
+        """Store payload read after `version` was fetched by `get`."""
+        self.cache.set(self.data_key(pk), (version, payload), settings.ACCOUNT_STATUS_CACHE_TIMEOUT)
+
+    def invalidate_now(self, pks):
+        timeout = settings.ACCOUNT_STATUS_CACHE_VERSION_TIMEOUT
+        for pk in pks:
+            version_key = self.version_key(pk)
+            self.cache.add(version_key, time.time_ns(), timeout)
+            try:
+                self.cache.incr(version_key)
+            except ValueError:
+                self.cache.set(version_key, time.time_ns(), timeout)
+        replica_router.stick(pks)
+        logger.debug(f'Invalidated status cache of {len(pks)} accounts.')
+
+    def invalidate(self, *pks):
+        """Invalidate cached payloads after the current transaction commits."""
+        pks = list(pks)
+        if pks:
+            on_commit(lambda: self.invalidate_now(pks))
+
+
+account_status_cache = AccountStatusCache()
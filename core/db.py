@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.db import connections
+
+
+def check_connections(**kwargs):
+    """Close persistent connections that are no longer usable (dropped by the server
+    or by a pooler restart), so the next query reconnects instead of failing.
+    Costs one `SELECT 1` per open connection, enabled by `DATABASE_CONN_HEALTH_CHECKS`.
+    """
+    if not settings.DATABASE_CONN_HEALTH_CHECKS:
+        return
+    for conn in connections.all():
+        if conn.connection is not None and not conn.in_atomic_block and not conn.is_usable():
+            conn.close()
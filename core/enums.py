@@ -18,5 +18,23 @@ class BankAccountOperationsEnum(Enum):
     ADD = 'balance ADDING'
     SUB = 'balance SUBTRACT'
     STATUS = 'get account STATUS'
+    BATCH = 'BATCH operations'
+    STATS = 'account STATISTICS'
+    CAPTURE = 'reservation CAPTURE'
+    RELEASE = 'reservation RELEASE'
 
 
+class LedgerOperationEnum(Enum):
+    ADD = 'ADD'
+    HOLD = 'HOLD'
+    SETTLE = 'SETTLE'
+    RELEASE = 'RELEASE'
+
+    @classmethod
+    def as_choices(cls):
+        return (
+            (cls.ADD.value, 'Add to balance'),
+            (cls.HOLD.value, 'Add to hold'),
+            (cls.SETTLE.value, 'Subtract hold from balance'),
+            (cls.RELEASE.value, 'Subtract released reservation from hold')
+        )
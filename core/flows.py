@@ -1,15 +1,58 @@
+import csv
+import io
 import logging
+import time
+import uuid
+import zlib
+from datetime import timedelta
 
+import redis
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
 from django.db.transaction import atomic
+from django.utils import timezone
 
-from core.models import BankAccount
+from core.cache import account_status_cache
+from core.enums import AccountStatusEnum, LedgerOperationEnum
+from core.metrics import observe_flow
+from core.money import DECIMAL_PLACES, MINOR_UNITS
+from core.transfer import COLUMNS, AccountRowCleaner, csv_header, render_rows
+from core.models import (
+    AccountLedgerEntry,
+    AccountReservation,
+    AccountRollup,
+    AccountSlot,
+    AccountSnapshot,
+    BankAccount,
+    IdempotencyRecord,
+    OutboxEvent,
+    PendingSettlement
+)
 
 logger = logging.getLogger(__name__)
 
 
+class SettlementReport(object):
+    """Result of a settlement run: settled rows and `(rows, seconds)` per chunk."""
+
+    def __init__(self):
+        self.settled = 0
+        self.chunks = []
+
+    def add_chunk(self, rows: int, seconds: float):
+        self.settled += rows
+        self.chunks.append((rows, seconds))
+
+    def __str__(self):
+        total = sum(seconds for _, seconds in self.chunks)
+        return f'settled {self.settled} records in {len(self.chunks)} chunks, {total:.3f}s'
+
+
 class SubtractHoldFlow(object):
     model = BankAccount
 
+    @observe_flow
     def run(self):
         logger.debug('Start SubtractHoldFlow service.')
         qs = self.model.objects.not_zero_hold()
@@ -17,7 +60,558 @@ class SubtractHoldFlow(object):
         for account in qs:
             with atomic():
                 account = BankAccount.objects.select_for_update().get(id=account.id)
+                OutboxEvent.objects.record([(LedgerOperationEnum.SETTLE, account.id, account.hold)])
                 account.balance -= account.hold
                 account.hold = 0
                 account.save()
+                account_status_cache.invalidate(account.id)
         logger.debug('Finished SubtractHoldFlow service.')
+
+
+class BulkSubtractHoldFlow(SubtractHoldFlow):
+    """Set-based SubtractHoldFlow.
+
+    Walks `not_zero_hold()` records in primary key order and settles every
+    chunk of selected ids by one `UPDATE ... SET balance = balance - hold, hold = 0`,
+    so a run costs two statements per `chunk_size` records instead of a
+    transaction per record.
+    `lower`/`upper` restrict the run to the `[lower, upper)` UUID key range,
+    see `partitions`.
+    """
+    chunk_size = settings.SUBTRACT_HOLD_CHUNK_SIZE
+
+    def __init__(self, chunk_size: int = None, lower: str = None, upper: str = None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.lower = lower
+        self.upper = upper
+        self.report = SettlementReport()
+
+    @staticmethod
+    def partitions(count: int) -> list:
+        """Split the UUID key space into `count` disjoint `[lower, upper)` ranges.
+        UUIDv4 keys are uniformly distributed, so equal ranges hold about
+        equal shares of `not_zero_hold()` records. Bounds are strings (JSON
+        serializable for Celery), `None` means unbounded.
+        """
+        step = 2 ** 128 // count
+        bounds = [None] + [str(uuid.UUID(int=step * i)) for i in range(1, count)] + [None]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def get_queryset(self):
+        qs = self.model.objects.not_zero_hold()
+        if self.lower is not None:
+            qs = qs.filter(id__gte=self.lower)
+        if self.upper is not None:
+            qs = qs.filter(id__lt=self.upper)
+        return qs.order_by('id')
+
+    def settle_chunk(self, qs) -> int:
+        """Settle selected records. With events or the rollup the settled holds are
+        read under the record locks and recorded in the transaction of the UPDATE.
+        """
+        if not settings.ACCOUNT_EVENTS_ENABLED and not settings.ACCOUNT_ROLLUP_ENABLED:
+            return qs.update(balance=F('balance') - F('hold'), hold=0)
+        with atomic():
+            held = list(qs.select_for_update().order_by('id').values_list('id', 'hold'))
+            rows = self.model.objects.filter(id__in=[pk for pk, _ in held]).update(
+                balance=F('balance') - F('hold'),
+                hold=0
+            )
+            OutboxEvent.objects.record([(LedgerOperationEnum.SETTLE, pk, hold) for pk, hold in held])
+            settled = sum(hold for _, hold in held)
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, -settled, -settled)})
+        return rows
+
+    @observe_flow
+    def run(self) -> SettlementReport:
+        logger.debug(f'Start BulkSubtractHoldFlow service, chunk size {self.chunk_size}.')
+        qs = self.get_queryset()
+        last_id = None
+        while True:
+            started = time.monotonic()
+            chunk = qs if last_id is None else qs.filter(id__gt=last_id)
+            ids = list(chunk.values_list('id', flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            rows = self.settle_chunk(qs.filter(id__in=ids))
+            account_status_cache.invalidate(*ids)
+            self.report.add_chunk(rows, time.monotonic() - started)
+            logger.debug(f'Settled chunk of {rows} records in {self.report.chunks[-1][1]:.3f}s.')
+            if len(ids) < self.chunk_size:
+                break
+            last_id = ids[-1]
+        logger.debug(f'Finished BulkSubtractHoldFlow service: {self.report}.')
+        return self.report
+
+
+class QueuedSubtractHoldFlow(BulkSubtractHoldFlow):
+    """Incremental SubtractHoldFlow: settles only the accounts queued in
+    PendingSettlement since the last run, so its cost follows the activity
+    rather than the table size.
+
+    Every chunk is dequeued and settled in one transaction: a worker dying
+    mid-run rolls the chunk back to the queue, and a settled account is never
+    left queued. Locked queue rows are skipped, so runs may overlap.
+
+    A run stops after `max_rows` rows or `max_seconds` (0 is unlimited), the
+    rest stays queued for the next run. With `chunk_seconds` the chunk size
+    follows the measured time per row, so a chunk takes about `chunk_seconds`.
+    """
+    max_rows = settings.SUBTRACT_HOLD_RUN_MAX_ROWS
+    max_seconds = settings.SUBTRACT_HOLD_RUN_MAX_SECONDS
+    chunk_seconds = settings.SUBTRACT_HOLD_CHUNK_SECONDS
+    min_chunk_size = settings.SUBTRACT_HOLD_MIN_CHUNK_SIZE
+    # Moving average of seconds per settled row, kept between runs of the process
+    seconds_per_row = None
+
+    def __init__(self, chunk_size: int = None, max_rows: int = None, max_seconds: float = None,
+                 chunk_seconds: float = None):
+        super(QueuedSubtractHoldFlow, self).__init__(chunk_size=chunk_size)
+        if max_rows is not None:
+            self.max_rows = max_rows
+        if max_seconds is not None:
+            self.max_seconds = max_seconds
+        if chunk_seconds is not None:
+            self.chunk_seconds = chunk_seconds
+
+    def next_chunk_size(self) -> int:
+        if not self.chunk_seconds or not QueuedSubtractHoldFlow.seconds_per_row:
+            return self.chunk_size
+        size = int(self.chunk_seconds / QueuedSubtractHoldFlow.seconds_per_row)
+        return max(min(self.min_chunk_size, self.chunk_size), min(size, self.chunk_size))
+
+    @staticmethod
+    def measure(rows: int, seconds: float):
+        if rows:
+            last = seconds / rows
+            previous = QueuedSubtractHoldFlow.seconds_per_row
+            QueuedSubtractHoldFlow.seconds_per_row = last if previous is None else (previous + last) / 2
+
+    @observe_flow
+    def run(self) -> SettlementReport:
+        logger.debug(f'Start QueuedSubtractHoldFlow service, chunk size {self.chunk_size}.')
+        queue = PendingSettlement.objects.select_for_update(skip_locked=True).order_by('account_id')
+        run_started, dequeued = time.monotonic(), 0
+        while True:
+            limit = self.next_chunk_size()
+            if self.max_rows:
+                limit = min(limit, self.max_rows - dequeued)
+            started = time.monotonic()
+            with atomic():
+                ids = list(queue.values_list('account_id', flat=True)[:limit])
+                if not ids:
+                    break
+                rows = self.settle_chunk(self.model.objects.not_zero_hold().filter(id__in=ids))
+                PendingSettlement.objects.filter(account_id__in=ids).delete()
+                account_status_cache.invalidate(*ids)
+            seconds = time.monotonic() - started
+            dequeued += len(ids)
+            self.measure(len(ids), seconds)
+            self.report.add_chunk(rows, seconds)
+            logger.debug(f'Settled queued chunk of {rows} records in {seconds:.3f}s.')
+            if len(ids) < limit:
+                break
+            if self.max_rows and dequeued >= self.max_rows or \
+                    self.max_seconds and time.monotonic() - run_started >= self.max_seconds:
+                logger.debug('QueuedSubtractHoldFlow run budget is exhausted, the rest stays queued.')
+                break
+        logger.debug(f'Finished QueuedSubtractHoldFlow service: {self.report}.')
+        return self.report
+
+
+class ReservationExpiryFlow(object):
+    """Release the expired reservations not captured by the client (reservation mode).
+    Walks the due reservations by the partial `expires_at` index, so a run costs the
+    expired rows only. Every chunk is locked, finished and deleted in one transaction,
+    reservations locked by a capture or release request are skipped.
+    """
+    model = AccountReservation
+    capture = False
+    chunk_size = settings.SUBTRACT_HOLD_CHUNK_SIZE
+
+    def __init__(self, chunk_size: int = None):
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+
+    @observe_flow
+    def run(self) -> SettlementReport:
+        name = type(self).__name__
+        logger.debug(f'Start {name} service, chunk size {self.chunk_size}.')
+        report = SettlementReport()
+        due = self.model.objects.due(self.capture).select_for_update(skip_locked=True).order_by('expires_at')
+        while True:
+            started = time.monotonic()
+            with atomic():
+                reservations = list(due.values_list('id', 'account_id', 'amount')[:self.chunk_size])
+                if reservations:
+                    self.model.objects.finish(reservations, capture=self.capture)
+            if not reservations:
+                break
+            report.add_chunk(len(reservations), time.monotonic() - started)
+            if len(reservations) < self.chunk_size:
+                break
+        logger.debug(f'Finished {name} service: {report}.')
+        return report
+
+
+class ReservationCaptureFlow(ReservationExpiryFlow):
+    """SubtractHoldFlow of reservation mode: capture the due reservations only,
+    the holds of the other reservations stay on the accounts.
+    """
+    capture = True
+
+
+class RollupReconcileFlow(object):
+    """Check the AccountRollup totals against a full recomputation and add the drift
+    (changes outside the API: direct SQL, queryset updates, bulk loads) as a delta.
+    Both totals are read in one snapshot (REPEATABLE READ on PostgreSQL) without locks,
+    so writers are not blocked by the scan. Their later deltas stay correct on top.
+    """
+    model = AccountRollup
+
+    def snapshot(self) -> tuple:
+        """Return `(recomputed, current)` totals read in one snapshot. The isolation level
+        is set only by the outermost transaction, before its first query.
+        """
+        outermost = not connection.in_atomic_block
+        with atomic():
+            if outermost and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            return self.model.objects.recompute(), self.model.objects.totals()
+
+    @observe_flow
+    def run(self) -> dict:
+        """Return `{status: (accounts, balance, hold)}` drift of the rollup, empty if it matched."""
+        logger.debug('Start RollupReconcileFlow service.')
+        expected, current = self.snapshot()
+        drift = {
+            status: tuple(value - current_value for value, current_value in zip(state, current[status]))
+            for status, state in expected.items()
+            if state != current[status]
+        }
+        if drift:
+            logger.warning(f'Account rollup drift {drift}, apply it to the totals.')
+            with atomic():
+                self.model.objects.apply(drift)
+        logger.debug('Finished RollupReconcileFlow service.')
+        return drift
+
+
+class SlotConsolidationFlow(object):
+    """Move the balance slots of hot accounts back to the account records,
+    one account per transaction.
+    """
+    model = AccountSlot
+
+    @observe_flow
+    def run(self) -> int:
+        """Return consolidated accounts count."""
+        logger.debug('Start SlotConsolidationFlow service.')
+        account_ids = list(self.model.objects.exclude(balance=0).order_by().values_list('account_id', flat=True).distinct())
+        for account_id in account_ids:
+            self.model.objects.consolidate(account_id)
+        logger.debug(f'Finished SlotConsolidationFlow service: consolidated {len(account_ids)} accounts.')
+        return len(account_ids)
+
+
+class LedgerCompactionFlow(object):
+    """Roll ledger entries into new AccountSnapshot records and copy the
+    compacted state to the BankAccount record.
+    Only entries older than `lag` seconds are compacted, so a snapshot never
+    passes over an append that is not committed yet.
+
+    A run compacts all accounts in one transaction: the watermark is global,
+    so it must not pass accounts left out by a run failing midway.
+    """
+    model = AccountLedgerEntry
+    lag = settings.ACCOUNT_LEDGER_COMPACTION_LAG
+
+    def __init__(self, lag: int = None):
+        if lag is not None:
+            self.lag = lag
+
+    @staticmethod
+    def watermark() -> int:
+        """Last ledger entry id compacted by the previous run."""
+        last = AccountSnapshot.objects.order_by('-last_entry_id').values_list('last_entry_id', flat=True).first()
+        return last or 0
+
+    @observe_flow
+    def run(self) -> int:
+        logger.debug('Start LedgerCompactionFlow service.')
+        horizon = timezone.now() - timedelta(seconds=self.lag)
+        upto_id = self.model.objects.filter(
+            created_at__lt=horizon
+        ).order_by('-id').values_list('id', flat=True).first()
+        compacted = 0
+        if upto_id is not None:
+            with atomic():
+                entries = self.model.objects.filter(id__gt=self.watermark(), id__lte=upto_id)
+                for account in BankAccount.objects.filter(id__in=entries.values('account_id')).iterator():
+                    balance, hold, last_entry_id = self.model.objects.state_with_position(account, upto_id)
+                    AccountSnapshot.objects.create(
+                        account=account,
+                        balance=balance,
+                        hold=hold,
+                        last_entry_id=last_entry_id
+                    )
+                    BankAccount.objects.filter(id=account.id).update(balance=balance, hold=hold)
+                    compacted += 1
+        logger.debug(f'Finished LedgerCompactionFlow service: compacted {compacted} accounts.')
+        return compacted
+
+
+class LedgerSubtractHoldFlow(object):
+    """SubtractHoldFlow for ledger mode: append `SETTLE` entry for every OPEN
+    account with non-zero derived hold.
+    """
+    model = AccountLedgerEntry
+
+    def get_account_ids(self) -> set:
+        """Accounts with compacted hold plus accounts with holds after the last compaction."""
+        held = set(BankAccount.objects.not_zero_hold().values_list('id', flat=True))
+        held.update(self.model.objects.filter(
+            id__gt=LedgerCompactionFlow.watermark(),
+            operation=LedgerOperationEnum.HOLD.value
+        ).values_list('account_id', flat=True))
+        return held
+
+    @observe_flow
+    def run(self) -> SettlementReport:
+        logger.debug('Start LedgerSubtractHoldFlow service.')
+        report = SettlementReport()
+        LedgerCompactionFlow().run()
+        started = time.monotonic()
+        settled = sum(self.model.objects.append_settle(pk) for pk in self.get_account_ids())
+        report.add_chunk(settled, time.monotonic() - started)
+        logger.debug(f'Finished LedgerSubtractHoldFlow service: {report}.')
+        return report
+
+
+class IdempotencyPurgeFlow(object):
+    """Delete idempotency records older than `ttl` seconds in chunks by the `created_at` index."""
+    model = IdempotencyRecord
+    ttl = settings.ACCOUNT_IDEMPOTENCY_TTL
+    chunk_size = settings.ACCOUNT_IDEMPOTENCY_PURGE_CHUNK_SIZE
+
+    @observe_flow
+    def run(self) -> int:
+        logger.debug('Start IdempotencyPurgeFlow service.')
+        expired = self.model.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=self.ttl))
+        purged = 0
+        while True:
+            ids = list(expired.order_by('created_at').values_list('id', flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            purged += self.model.objects.filter(id__in=ids).delete()[0]
+        logger.debug(f'Finished IdempotencyPurgeFlow service: purged {purged} records.')
+        return purged
+
+
+class OutboxRelayFlow(object):
+    """Publish OutboxEvent records to Redis Streams in `id` order, `batch_size`
+    events per pipeline, and delete them in the transaction that selected them.
+
+    Events of an account are written under its record lock (add/subtract UPDATE,
+    settlement, ledger holds), so their ids follow the account commit order and
+    an account's events are never published out of order. Plain ledger `ADD`
+    entries are not locked, concurrent adds of one account may swap, they commute.
+    The batch is locked by `SELECT ... FOR UPDATE`: a second relay waits for the
+    first one instead of publishing the events after it.
+
+    Delivery is at least once, a relay dying between the publish and the commit
+    publishes the batch again. Consumers deduplicate by `event_id`.
+    With `ACCOUNT_EVENTS_STREAM_PARTITIONS` > 1 the events are spread over
+    `<stream>:<n>` streams by account, so an account always lands in one stream.
+    """
+    model = OutboxEvent
+    batch_size = settings.ACCOUNT_EVENTS_RELAY_BATCH_SIZE
+
+    def __init__(self, client=None, batch_size: int = None):
+        self.client = client or redis.Redis.from_url(settings.ACCOUNT_EVENTS_REDIS_URL)
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    @staticmethod
+    def stream(account_id: uuid.UUID) -> str:
+        partitions = settings.ACCOUNT_EVENTS_STREAM_PARTITIONS
+        if partitions <= 1:
+            return settings.ACCOUNT_EVENTS_STREAM
+        return f'{settings.ACCOUNT_EVENTS_STREAM}:{zlib.crc32(account_id.bytes) % partitions}'
+
+    def publish(self, events: list):
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(
+                self.stream(event.account_id),
+                event.as_message(),
+                maxlen=settings.ACCOUNT_EVENTS_STREAM_MAXLEN or None,
+                approximate=True
+            )
+        pipeline.execute()
+
+    @observe_flow
+    def run(self) -> int:
+        logger.debug('Start OutboxRelayFlow service.')
+        queue = self.model.objects.select_for_update().order_by('id')
+        published = 0
+        while True:
+            with atomic():
+                events = list(queue[:self.batch_size])
+                if not events:
+                    break
+                self.publish(events)
+                self.model.objects.filter(id__in=[event.id for event in events]).delete()
+            published += len(events)
+            if len(events) < self.batch_size:
+                break
+        logger.debug(f'Finished OutboxRelayFlow service: published {published} events.')
+        return published
+
+
+class AccountImportFlow(object):
+    """Create accounts from `(line, row)` pairs of `core.transfer.read_rows` in one transaction.
+    Rows are validated and written by `batch_size` chunks: `COPY ... FROM STDIN` on
+    PostgreSQL, `bulk_create` otherwise, so memory does not grow with the input.
+    The first invalid row or existing id rolls the whole import back.
+    OPEN accounts with hold are queued for settlement. The rollup deltas are summed over
+    the batches and applied once before the commit, so the import locks rollup rows
+    only at its end.
+    """
+    model = BankAccount
+    batch_size = settings.ACCOUNT_TRANSFER_BATCH_SIZE
+
+    def __init__(self, rows, batch_size: int = None, copy: bool = None, progress=None):
+        self.rows = rows
+        if batch_size is not None:
+            self.batch_size = batch_size
+        self.copy = connection.vendor == 'postgresql' if copy is None else copy
+        self.progress = progress
+        self.deltas = {}
+
+    def copy_batch(self, batch: list):
+        buffer = io.StringIO()
+        # imported accounts are not hot, COPY does not apply the model field defaults
+        csv.writer(buffer).writerows(row + (0,) for row in batch)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {self.model._meta.db_table} ({", ".join(COLUMNS)}, hot_slots) FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+
+    def insert_batch(self, batch: list):
+        self.model.objects.bulk_create([
+            self.model(id=pk, owner_name=owner_name, balance=balance, hold=hold, status=status)
+            for pk, owner_name, balance, hold, status in batch
+        ])
+
+    def write(self, batch: list):
+        (self.copy_batch if self.copy else self.insert_batch)(batch)
+        PendingSettlement.objects.enqueue([
+            pk for pk, _, _, hold, status in batch if hold and status == AccountStatusEnum.OPEN.value
+        ])
+        for _, _, balance, hold, status in batch:
+            accounts_total, balance_total, hold_total = self.deltas.get(status, (0, 0, 0))
+            self.deltas[status] = (accounts_total + 1, balance_total + balance, hold_total + hold)
+
+    @observe_flow
+    def run(self) -> int:
+        logger.debug(f'Start AccountImportFlow service, batch size {self.batch_size}.')
+        clean = AccountRowCleaner()
+        imported, batch = 0, []
+        with atomic():
+            for line, row in self.rows:
+                batch.append(clean(line, row))
+                if len(batch) == self.batch_size:
+                    self.write(batch)
+                    imported, batch = imported + len(batch), []
+                    if self.progress:
+                        self.progress(imported)
+            if batch:
+                self.write(batch)
+                imported += len(batch)
+            AccountRollup.objects.apply(self.deltas)
+        logger.debug(f'Finished AccountImportFlow service: imported {imported} accounts.')
+        return imported
+
+
+class AccountExportFlow(object):
+    """Dump all accounts in `id` order as CSV (with header) or NDJSON text chunks,
+    read by `.iterator()` chunks of `chunk_size` rows. Hot account balances include the slots.
+    `copy_to` writes CSV by `COPY ... TO STDOUT` on PostgreSQL instead.
+    """
+    model = BankAccount
+    chunk_size = settings.ACCOUNT_TRANSFER_BATCH_SIZE
+
+    def __init__(self, file_format: str = 'csv', chunk_size: int = None, progress=None):
+        self.file_format = file_format
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.progress = progress
+        self.exported = 0
+
+    def chunks(self):
+        if self.file_format == 'csv':
+            yield csv_header()
+        rows = self.model.objects.order_by('id').annotate(
+            slot_balance=AccountSlot.objects.balance_expression()
+        ).values_list(*COLUMNS, 'slot_balance').iterator(chunk_size=self.chunk_size)
+        balance = COLUMNS.index('balance')
+        batch = []
+        for row in rows:
+            if row[-1]:
+                row = row[:balance] + (row[balance] + row[-1],) + row[balance + 1:]
+            batch.append(row[:-1])
+            if len(batch) == self.chunk_size:
+                yield self.render(batch)
+                batch = []
+        if batch:
+            yield self.render(batch)
+
+    def render(self, batch: list) -> str:
+        self.exported += len(batch)
+        if self.progress:
+            self.progress(self.exported)
+        return render_rows(batch, self.file_format)
+
+    @staticmethod
+    def decimal_sql(minor_sql: str) -> str:
+        """SQL of the exact decimal amount of minor units."""
+        return f'ROUND(({minor_sql})::numeric / {MINOR_UNITS}, {DECIMAL_PLACES})'
+
+    def copy_to(self, output) -> int:
+        slots = AccountSlot._meta.db_table
+        amounts = {
+            'balance': self.decimal_sql(
+                f'balance + CASE WHEN hot_slots > 0 THEN COALESCE((SELECT SUM(s.balance) FROM {slots} s '
+                f'WHERE s.account_id = a.id), 0) ELSE 0 END'
+            ),
+            'hold': self.decimal_sql('hold'),
+        }
+        columns = ', '.join(
+            f'{amounts[column]} AS {column}' if column in amounts else column
+            for column in COLUMNS
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY (SELECT {columns} FROM {self.model._meta.db_table} a ORDER BY id) '
+                f'TO STDOUT WITH (FORMAT csv, HEADER)',
+                output
+            )
+            self.exported = cursor.rowcount
+        return self.exported
+
+    @observe_flow
+    def run(self, output) -> int:
+        """Write the dump to the `output` text file, return exported accounts count."""
+        logger.debug(f'Start AccountExportFlow service, {self.file_format}.')
+        if self.file_format == 'csv' and connection.vendor == 'postgresql':
+            self.copy_to(output)
+        else:
+            for chunk in self.chunks():
+                output.write(chunk)
+        logger.debug(f'Finished AccountExportFlow service: exported {self.exported} accounts.')
+        return self.exported
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError
+from django.db.transaction import atomic, on_commit
+
+from core.models import IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore(object):
+    """Deduplication store of mutation results keyed by `Idempotency-Key`.
+
+    The record is inserted before the mutation in the same transaction, so a
+    concurrent duplicate blocks on the unique key until the first request
+    commits and then replays its result. Stored results are optionally
+    fronted by the cache.
+    """
+    model = IdempotencyRecord
+    key_prefix = 'idempotency'
+
+    @property
+    def cache(self):
+        alias = settings.ACCOUNT_IDEMPOTENCY_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    @staticmethod
+    def fingerprint(action_name: str, pk, data) -> str:
+        payload = json.dumps([action_name, str(pk), data], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def cache_key(self, key: str) -> str:
+        return f'{self.key_prefix}:{hashlib.sha256(key.encode()).hexdigest()}'
+
+    def lookup(self, key: str):
+        """Return stored `(fingerprint, status_code, response)` or None."""
+        cache = self.cache
+        if cache is not None:
+            stored = cache.get(self.cache_key(key))
+            if stored is not None:
+                return stored
+        record = self.model.objects.filter(key=key).exclude(status_code=0).first()
+        if record is None:
+            return None
+        stored = record.fingerprint, record.status_code, record.response
+        self.remember(key, stored)
+        return stored
+
+    def remember(self, key: str, stored: tuple):
+        cache = self.cache
+        if cache is not None:
+            cache.set(self.cache_key(key), stored, settings.ACCOUNT_IDEMPOTENCY_TTL)
+
+    def execute(self, key: str, fingerprint: str, call) -> tuple:
+        """Return `(fingerprint, status_code, response, replayed)`.
+        `call` runs only for the first request with `key` and returns the response dict.
+        """
+        stored = self.lookup(key)
+        if stored is not None:
+            return stored + (True,)
+        try:
+            with atomic():
+                record = self.model.objects.create(key=key, fingerprint=fingerprint)
+                response = call()
+                record.status_code = response['status']
+                record.response = json.loads(json.dumps(response, default=str))
+                record.save(update_fields=['status_code', 'response'])
+                stored = record.fingerprint, record.status_code, record.response
+                on_commit(lambda: self.remember(key, stored))
+        except IntegrityError:
+            logger.debug(f'Concurrent request with idempotency key {key}, replaying.')
+            stored = self.lookup(key)
+            if stored is None:
+                raise
+            return stored + (True,)
+        return stored + (False,)
+
+
+idempotency_store = IdempotencyStore()
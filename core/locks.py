@@ -0,0 +1,39 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class CacheLock(object):
+    """Single-runner lock on the shared cache. `add` is atomic (`SET NX` on Redis),
+    the lock expires after `timeout` seconds if the holder dies. Only the holder
+    releases it. A per-process cache (locmem) locks within one process only.
+    With the `token` of a lock acquired elsewhere (i.e. passed to a chord callback)
+    the lock is held and can be released.
+    """
+    key_prefix = 'lock'
+
+    def __init__(self, name: str, timeout: int, token: str = None):
+        self.key = f'{self.key_prefix}:{name}'
+        self.timeout = timeout
+        self.token = token or uuid.uuid4().hex
+        self.acquired = token is not None
+
+    @property
+    def cache(self):
+        return caches[settings.SUBTRACT_HOLD_LOCK_CACHE_ALIAS]
+
+    def acquire(self) -> bool:
+        self.acquired = bool(self.cache.add(self.key, self.token, self.timeout))
+        return self.acquired
+
+    def release(self):
+        if self.acquired and self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+        self.acquired = False
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,55 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from core.enums import AccountStatusEnum
+from core.models import BankAccount
+from core.views import BankAccountViewSet
+
+
+class Command(BaseCommand):
+    """Compare per-item throughput of the `batch` action with single `add` calls.
+    Requests go through the view directly, without HTTP and server overhead.
+    """
+    help = 'Compare per-item throughput of the batch endpoint with single add requests'
+
+    amount = Decimal('0.01')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='Operations per method')
+        parser.add_argument('--accounts', type=int, default=100, help='Accounts to spread operations over')
+
+    def post(self, action_name: str, data, pk=None):
+        request = self.factory.post(
+            f'/account/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        view = BankAccountViewSet.as_view({'post': action_name})
+        return view(request, pk=pk) if pk else view(request)
+
+    def report(self, name: str, items: int, seconds: float):
+        self.stdout.write(f'{name}: {items} items, {seconds:.3f}s, {items / seconds:.0f} items/s')
+
+    def handle(self, *args, **options):
+        self.factory = APIRequestFactory()
+        accounts = BankAccount.objects.bulk_create([
+            BankAccount(owner_name=f'Batch benchmark {i}', status=AccountStatusEnum.OPEN.value)
+            for i in range(options['accounts'])
+        ])
+        ids = [str(account.id) for account in accounts]
+        items = [ids[i % len(ids)] for i in range(options['items'])]
+        try:
+            started = time.monotonic()
+            for pk in items:
+                self.post('add', {'add_value': str(self.amount)}, pk=pk)
+            self.report('single add', len(items), time.monotonic() - started)
+
+            started = time.monotonic()
+            self.post('batch', [{'id': pk, 'op': 'add', 'value': str(self.amount)} for pk in items])
+            self.report('batch', len(items), time.monotonic() - started)
+        finally:
+            BankAccount.objects.filter(id__in=ids).delete()
@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+
+from core.db import check_connections
+from core.management.commands.benchmark_suite import percentiles
+from core.models import BankAccount
+from core.views import BankAccountViewSet
+
+
+class Command(BaseCommand):
+    """Compare `status` latency with a new database connection per request
+    (`CONN_MAX_AGE=0`), a persistent connection and a persistent connection
+    with the health check. The status cache is bypassed so every request
+    queries the database. Requests go through the view directly, for the full
+    HTTP path run `loadtest` against deployments with different
+    `DJANGO_DB_CONN_MAX_AGE`.
+    """
+    help = 'Compare status latency with new, persistent and health checked database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per mode')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def measure(self, pk: str, requests: int, before_request) -> dict:
+        factory = APIRequestFactory()
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        latencies = []
+        for _ in range(requests):
+            started = time.monotonic()
+            before_request()
+            response = view(factory.get(f'/account/{pk}/status/'), pk=pk)
+            latencies.append(time.monotonic() - started)
+            if response.status_code != 200:
+                raise CommandError(f'status returned {response.status_code}')
+        return {'requests': requests, **percentiles(latencies)}
+
+    def handle(self, *args, **options):
+        pk = BankAccount.objects.values_list('id', flat=True).first()
+        if pk is None:
+            raise CommandError('No accounts, run generate_accounts first')
+        modes = (
+            ('new connection', connection.close),
+            ('persistent', lambda: None),
+            ('persistent, health check', check_connections),
+        )
+        caches = {**settings.CACHES, 'benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        report = {}
+        with override_settings(CACHES=caches, ACCOUNT_STATUS_CACHE_ALIAS='benchmark', DATABASE_CONN_HEALTH_CHECKS=True):
+            self.measure(str(pk), min(options['requests'], 100), lambda: None)  # warm up
+            for name, before_request in modes:
+                report[name] = self.measure(str(pk), options['requests'], before_request)
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        for name, result in report.items():
+            self.stdout.write(
+                f'{name}: p50 {result["p50_ms"]:.3f}ms, p90 {result["p90_ms"]:.3f}ms, p99 {result["p99_ms"]:.3f}ms'
+            )
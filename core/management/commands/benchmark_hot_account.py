@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.enums import AccountStatusEnum
+from core.models import AccountSlot, BankAccount
+
+
+class Command(BaseCommand):
+    """Measure add throughput of one contended account with different balance slot
+    counts, 0 adds to the account record. Runs against the configured database,
+    parallel workers need PostgreSQL.
+    """
+    help = 'Measure add throughput of one hot account by balance slots count'
+
+    amount = 1  # minor unit
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=2000, help='Adds per slots count')
+        parser.add_argument('--workers', type=int, default=16, help='Parallel writers')
+        parser.add_argument('--slots', default='0,4,16', help='Comma separated slots counts')
+
+    def measure(self, write, operations: int, workers: int) -> float:
+        def run(count):
+            try:
+                for _ in range(count):
+                    write()
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, [operations // workers] * workers))
+        return time.monotonic() - started
+
+    def add(self, pk, slots: int) -> bool:
+        if slots:
+            return AccountSlot.objects.add(pk, slots, self.amount)
+        return BankAccount.objects.add_balance(pk, self.amount)
+
+    def handle(self, *args, **options):
+        try:
+            slot_counts = [int(slots) for slots in options['slots'].split(',')]
+        except ValueError:
+            raise CommandError('--slots should be comma separated integers')
+        workers = options['workers']
+        operations = options['operations'] // workers * workers
+        for slots in slot_counts:
+            account = BankAccount.objects.create(
+                owner_name='Hot account benchmark',
+                balance=0,
+                hold=0,
+                status=AccountStatusEnum.OPEN.value
+            )
+            try:
+                if slots:
+                    AccountSlot.objects.consolidate(account.id, slots)
+                seconds = self.measure(lambda: self.add(account.id, slots), operations, workers)
+                AccountSlot.objects.consolidate(account.id)
+                balance = BankAccount.objects.values_list('balance', flat=True).get(id=account.id)
+                if balance != operations * self.amount:
+                    raise CommandError(f'{slots} slots: balance {balance}, expected {operations * self.amount}')
+                self.stdout.write(
+                    f'{slots} slots: {operations} adds, {workers} workers, '
+                    f'{seconds:.3f}s, {operations / seconds:.0f} adds/s'
+                )
+            finally:
+                account.delete()
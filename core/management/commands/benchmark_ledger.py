@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.enums import AccountStatusEnum
+from core.models import AccountLedgerEntry, BankAccount
+
+
+class Command(BaseCommand):
+    """Compare write throughput of ledger appends with in-place row updates.
+    Runs against the configured database, parallel workers need PostgreSQL.
+    """
+    help = 'Compare write throughput of ledger appends with row updates on one account'
+
+    amount = 1  # minor unit
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', type=int, default=2000, help='Writes per method')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel writers')
+
+    def measure(self, write, operations: int, workers: int) -> float:
+        def run(count):
+            try:
+                for _ in range(count):
+                    write()
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, [operations // workers] * workers))
+        return time.monotonic() - started
+
+    def handle(self, *args, **options):
+        operations, workers = options['operations'], options['workers']
+        account = BankAccount.objects.create(
+            owner_name='Ledger benchmark',
+            balance=0,
+            hold=0,
+            status=AccountStatusEnum.OPEN.value
+        )
+        methods = (
+            ('row update', lambda: BankAccount.objects.add_balance(account.id, self.amount)),
+            ('ledger append', lambda: AccountLedgerEntry.objects.append_add(account.id, self.amount)),
+        )
+        try:
+            for name, write in methods:
+                seconds = self.measure(write, operations, workers)
+                self.stdout.write(
+                    f'{name}: {operations} writes, {workers} workers, '
+                    f'{seconds:.3f}s, {operations / seconds:.0f} writes/s'
+                )
+        finally:
+            account.delete()
@@ -0,0 +1,69 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+
+from core.serializers import MoneyField
+
+
+class Command(BaseCommand):
+    """Compare money handling with `Decimal` amounts (before) and integer minor
+    units (after): settlement and hold availability arithmetic, rendering of
+    the API decimal strings and parsing of input amounts. Runs in memory,
+    the database is not used.
+    """
+    help = 'Compare Decimal and integer minor units arithmetic and serialization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200000, help='Amounts per measurement')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+
+    @staticmethod
+    def settle(accounts: list, value) -> int:
+        """Hold availability check and settlement of every `(balance, hold)` pair."""
+        available = 0
+        for balance, hold in accounts:
+            if balance >= hold + value:
+                available += 1
+            balance -= hold
+        return available
+
+    @staticmethod
+    def measure(function, *args) -> float:
+        started = time.perf_counter()
+        function(*args)
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        count = options['count']
+        minor = [(rng.randint(0, 999999), rng.randint(0, 99999)) for _ in range(count)]
+        decimal = [(Decimal(balance).scaleb(-2), Decimal(hold).scaleb(-2)) for balance, hold in minor]
+        texts = [f'{balance // 100}.{balance % 100:02d}' for balance, _ in minor]
+        decimal_field = serializers.DecimalField(max_digits=8, decimal_places=2)
+        money_field = MoneyField()
+
+        if [decimal_field.to_representation(balance) for balance, _ in decimal[:1000]] != \
+                [money_field.to_representation(balance) for balance, _ in minor[:1000]]:
+            self.stderr.write('rendered amounts differ')
+        cases = (
+            ('settle and check', (self.settle, decimal, Decimal('0.01')), (self.settle, minor, 1)),
+            (
+                'render',
+                (lambda: [decimal_field.to_representation(balance) for balance, _ in decimal],),
+                (lambda: [money_field.to_representation(balance) for balance, _ in minor],)
+            ),
+            (
+                'parse',
+                (lambda: [decimal_field.to_internal_value(text) for text in texts],),
+                (lambda: [money_field.to_internal_value(text) for text in texts],)
+            ),
+        )
+        for name, before, after in cases:
+            before_seconds, after_seconds = self.measure(*before), self.measure(*after)
+            self.stdout.write(
+                f'{name}: Decimal {before_seconds / count * 1e9:.0f} ns, '
+                f'minor units {after_seconds / count * 1e9:.0f} ns, x{before_seconds / after_seconds:.2f}'
+            )
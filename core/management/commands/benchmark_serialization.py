@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core.enums import AccountStatusEnum
+from core.models import BankAccount
+from core.renderers import ORJSONRenderer
+from core.serializers import BankAccountForListSerializer
+
+
+class Command(BaseCommand):
+    """Compare list page serialization: ModelSerializer over model instances
+    (before) with `.values()` rows and precomputed field accessors (after).
+    """
+    help = 'Report list page requests/sec of the serializer and the fast serialization path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Page sizes')
+        parser.add_argument('--repeat', type=int, default=5, help='Pages rendered per measurement')
+
+    @staticmethod
+    def serializer_page(size: int, renderer) -> bytes:
+        queryset = BankAccount.objects.order_by('id')[:size]
+        return renderer.render(BankAccountForListSerializer(queryset, many=True).data)
+
+    @staticmethod
+    def values_page(size: int, renderer) -> bytes:
+        serializer_class = BankAccountForListSerializer
+        queryset = BankAccount.objects.order_by('id').values(*serializer_class.value_fields())[:size]
+        return renderer.render([serializer_class.represent(row) for row in queryset])
+
+    def measure(self, page, size: int, renderer, repeat: int) -> float:
+        started = time.monotonic()
+        for _ in range(repeat):
+            page(size, renderer)
+        return repeat / (time.monotonic() - started)
+
+    def handle(self, *args, **options):
+        sizes, repeat = options['sizes'], options['repeat']
+        accounts = BankAccount.objects.bulk_create([
+            BankAccount(owner_name=f'Serialization benchmark {i}', balance=i % 9999, status=AccountStatusEnum.OPEN.value)
+            for i in range(max(sizes))
+        ], batch_size=1000)
+        ids = [account.id for account in accounts]
+        try:
+            for size in sizes:
+                if self.serializer_page(size, JSONRenderer()) != self.values_page(size, ORJSONRenderer()):
+                    self.stderr.write(f'page of {size}: outputs differ')
+                before = self.measure(self.serializer_page, size, JSONRenderer(), repeat)
+                after = self.measure(self.values_page, size, JSONRenderer(), repeat)
+                after_orjson = self.measure(self.values_page, size, ORJSONRenderer(), repeat)
+                self.stdout.write(
+                    f'page of {size}: serializer {before:.1f} req/s, '
+                    f'values {after:.1f} req/s, values+orjson {after_orjson:.1f} req/s'
+                )
+        finally:
+            BankAccount.objects.filter(id__in=ids).delete()
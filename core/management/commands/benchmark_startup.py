@@ -0,0 +1,77 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: start as a `web` or `worker` process (argv[1]) and report
+# the import time, the peak RSS and the loaded apps and middleware.
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+django.setup()
+if sys.argv[1] == 'worker':
+    from BankSubscriberAccount.celery import app
+    app.loader.import_default_modules()  # runs the system checks as the worker start does
+else:
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import get_resolver
+    WSGIHandler()
+    get_resolver().url_patterns
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'apps': len(settings.INSTALLED_APPS),
+    'middleware': len(settings.MIDDLEWARE),
+}))
+"""
+
+
+class Command(BaseCommand):
+    """Measure the startup of web and worker processes by process profile
+    (`DJANGO_PROCESS_PROFILE`) in fresh interpreters: Django setup with the WSGI handler
+    and the URLs (web) or the Celery app with its tasks and system checks (worker).
+    Reports the median import time and peak RSS.
+    """
+    help = 'Measure import time and RSS of web and worker processes by process profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Processes per measurement')
+        parser.add_argument(
+            '--runs',
+            default='full:web,api:web,full:worker,worker:worker',
+            help='Comma separated profile:process pairs'
+        )
+
+    @staticmethod
+    def start(profile: str, process: str) -> dict:
+        env = {**os.environ, 'DJANGO_PROCESS_PROFILE': profile}
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'BankSubscriberAccount.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, process],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
+        if result.returncode:
+            raise CommandError(f'{process} process of {profile} profile failed to start:\n{result.stderr}')
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for pair in options['runs'].split(','):
+            profile, _, process = pair.partition(':')
+            if process not in ('web', 'worker'):
+                raise CommandError(f'`{pair}`: process should be web or worker')
+            runs = [self.start(profile, process) for _ in range(options['repeat'])]
+            self.stdout.write(
+                f'{process} ({profile} profile): {statistics.median(run["seconds"] for run in runs) * 1000:.0f} ms, '
+                f'RSS {statistics.median(run["rss_kb"] for run in runs) / 1024:.1f} MB, '
+                f'{runs[0]["apps"]} apps, {runs[0]["middleware"]} middleware'
+            )
@@ -0,0 +1,177 @@
+import json
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.test import APIRequestFactory
+
+from core.enums import AccountStatusEnum
+from core.flows import BulkSubtractHoldFlow, LedgerSubtractHoldFlow, QueuedSubtractHoldFlow, ReservationCaptureFlow
+from core.models import BankAccount
+from core.views import BankAccountViewSet
+
+
+def percentiles(latencies: list) -> dict:
+    """`p50`, `p90`, `p99` and `max` of latencies (seconds) in milliseconds."""
+    latencies = sorted(latencies)
+    if not latencies:
+        return {}
+    result = {
+        f'p{p}_ms': round(latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000, 3)
+        for p in (50, 90, 99)
+    }
+    result['max_ms'] = round(latencies[-1] * 1000, 3)
+    return result
+
+
+class Command(BaseCommand):
+    """Reproducible benchmark of the account API and the hold settlement on the
+    configured database, i.e. populated by `generate_accounts`. Requests go through
+    the views directly, without HTTP and server overhead. Mutates data: runs
+    add/subtract on sampled accounts and one settlement run of SubtractHoldTask
+    at the end. The same `--seed` samples the same accounts.
+    Writes a JSON report to compare between releases.
+    """
+    help = 'Benchmark list/status latency, add/subtract throughput and hold settlement, report as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per latency benchmark')
+        parser.add_argument('--operations', type=int, default=2000, help='add/subtract requests')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel add/subtract clients')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the sampled accounts')
+        parser.add_argument('--label', default='', help='Release or run label stored in the report')
+        parser.add_argument('--output', help='Report file, stdout by default')
+        parser.add_argument('--skip-settlement', action='store_true', help='Do not run the hold settlement')
+
+    def get_host(self) -> str:
+        """A host name passing ALLOWED_HOSTS, the list view builds absolute page links."""
+        for host in settings.ALLOWED_HOSTS:
+            if host == '*':
+                return 'localhost'
+            if host and '*' not in host:
+                return host.lstrip('.')
+        raise CommandError('Set DJANGO_ALLOWED_HOSTS, the list view needs a valid host')
+
+    def sample_ids(self, count: int, rng: random.Random) -> list:
+        """Ids of `count` random OPEN accounts, one index lookup each."""
+        ids = []
+        queryset = BankAccount.objects.filter(status=AccountStatusEnum.OPEN.value).order_by('id').values_list('id', flat=True)
+        for _ in range(count):
+            pk = queryset.filter(id__gte=uuid.UUID(int=rng.getrandbits(128))).first() or queryset.first()
+            if pk is None:
+                raise CommandError('No OPEN accounts, run generate_accounts first')
+            ids.append(str(pk))
+        return ids
+
+    def call(self, factory, method: str, action_name: str, pk=None, data=None):
+        if method == 'get':
+            request = factory.get(f'/account/{action_name}/')
+        else:
+            request = factory.post(f'/account/{action_name}/', data=json.dumps(data), content_type='application/json')
+        view = BankAccountViewSet.as_view({method: action_name})
+        return view(request, pk=pk) if pk else view(request)
+
+    def measure_latency(self, factory, method: str, action_name: str, ids: list) -> dict:
+        latencies, errors = [], 0
+        for pk in ids:
+            started = time.monotonic()
+            response = self.call(factory, method, action_name, pk=pk)
+            latencies.append(time.monotonic() - started)
+            errors += response.status_code >= 400
+        return {'requests': len(ids), 'errors': errors, **percentiles(latencies)}
+
+    def measure_mutations(self, ids: list, workers: int) -> dict:
+        """add and subtract `1.00` in turns from `workers` threads, one connection each."""
+        host = self.get_host()
+
+        def run(chunk):
+            factory, latencies, errors = APIRequestFactory(SERVER_NAME=host), [], 0
+            try:
+                for i, pk in enumerate(chunk):
+                    action_name, field = ('add', 'add_value') if i % 2 == 0 else ('subtract', 'sub_value')
+                    started = time.monotonic()
+                    response = self.call(factory, 'post', action_name, pk=pk, data={field: '1.00'})
+                    latencies.append(time.monotonic() - started)
+                    errors += response.status_code >= 400
+            finally:
+                connection.close()
+            return latencies, errors
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run, [ids[i::workers] for i in range(workers)]))
+        seconds = time.monotonic() - started
+        latencies = [latency for chunk_latencies, _ in results for latency in chunk_latencies]
+        return {
+            'requests': len(ids),
+            'workers': workers,
+            'errors': sum(errors for _, errors in results),
+            'seconds': round(seconds, 3),
+            'rps': round(len(ids) / seconds, 1),
+            **percentiles(latencies)
+        }
+
+    def settlement_flows(self) -> list:
+        """Flows of a SubtractHoldTask run with the current settings, partitions run one after another."""
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            return [LedgerSubtractHoldFlow()]
+        if settings.ACCOUNT_RESERVATIONS_ENABLED:
+            return [ReservationCaptureFlow()]
+        if settings.SUBTRACT_HOLD_QUEUE_ENABLED:
+            return [QueuedSubtractHoldFlow()]
+        if settings.SUBTRACT_HOLD_PARTITIONS > 1:
+            return [
+                BulkSubtractHoldFlow(lower=lower, upper=upper)
+                for lower, upper in BulkSubtractHoldFlow.partitions(settings.SUBTRACT_HOLD_PARTITIONS)
+            ]
+        return [BulkSubtractHoldFlow()]
+
+    def measure_settlement(self) -> dict:
+        flows = self.settlement_flows()
+        started = time.monotonic()
+        reports = [flow.run() for flow in flows]
+        seconds = time.monotonic() - started
+        settled = sum(report.settled for report in reports)
+        return {
+            'flow': type(flows[0]).__name__,
+            'settled': settled,
+            'chunks': sum(len(report.chunks) for report in reports),
+            'chunk_size': getattr(flows[0], 'chunk_size', None),
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(settled / seconds, 1) if seconds else None
+        }
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory(SERVER_NAME=self.get_host())
+        report = {
+            'label': options['label'],
+            'seed': options['seed'],
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'accounts': BankAccount.objects.count(),
+            'hold_accounts': BankAccount.objects.not_zero_hold().count(),
+            'results': {}
+        }
+        results = report['results']
+        rng = random.Random(options['seed'])
+        ids = self.sample_ids(options['requests'], rng)
+        results['status'] = self.measure_latency(factory, 'get', 'status', ids)
+        results['list'] = self.measure_latency(factory, 'get', 'list', [None] * options['requests'])
+        results['add_subtract'] = self.measure_mutations(self.sample_ids(options['operations'], rng), options['workers'])
+        if not options['skip_settlement']:
+            results['settlement'] = self.measure_settlement()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(f'Report written to {options["output"]}')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.flows import BulkSubtractHoldFlow
+from core.models import AccountLedgerEntry, AccountSnapshot, BankAccount
+from core.serializers import BankAccountForListSerializer, BankAccountForStatusSerializer
+
+
+class Command(BaseCommand):
+    """Print query plans of the hot queries: hold settlement scan, account list
+    page, account status and the ledger state reads. On PostgreSQL plans are
+    `EXPLAIN (ANALYZE, BUFFERS)`, so the queries are really executed.
+    """
+    help = 'Print EXPLAIN ANALYZE of the hot queries against the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', help='Account id for the per-account queries, default any account with hold')
+        parser.add_argument(
+            '--no-analyze',
+            action='store_true',
+            help='Print the planner estimates only, without executing the queries'
+        )
+
+    def get_queries(self, account_id) -> list:
+        chunk = BulkSubtractHoldFlow(chunk_size=settings.SUBTRACT_HOLD_CHUNK_SIZE).get_queryset()
+        return [
+            ('hold settlement chunk', chunk.values_list('id', flat=True)[:settings.SUBTRACT_HOLD_CHUNK_SIZE]),
+            (
+                'account list page',
+                BankAccount.objects.order_by('id').values(
+                    *BankAccountForListSerializer.value_fields()
+                )[:settings.ACCOUNT_LIST_PAGE_SIZE]
+            ),
+            (
+                'account status',
+                BankAccount.objects.filter(id=account_id).values(*BankAccountForStatusSerializer.value_fields())
+            ),
+            (
+                'ledger snapshot',
+                AccountSnapshot.objects.filter(account_id=account_id).order_by('-last_entry_id')[:1]
+            ),
+            (
+                'ledger tail',
+                AccountLedgerEntry.objects.filter(account_id=account_id, id__gt=0).values_list('operation', 'amount')
+            ),
+        ]
+
+    def handle(self, *args, **options):
+        account_id = options['account']
+        if account_id is None:
+            account_id = (
+                BankAccount.objects.not_zero_hold().values_list('id', flat=True).first()
+                or BankAccount.objects.values_list('id', flat=True).first()
+            )
+        if account_id is None:
+            raise CommandError('No accounts, generate data first')
+
+        explain_options = {}
+        if connection.vendor == 'postgresql' and not options['no_analyze']:
+            explain_options = {'analyze': True, 'buffers': True}
+        self.stdout.write(f'{BankAccount.objects.count()} accounts, account {account_id}')
+        for name, queryset in self.get_queries(account_id):
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            self.stdout.write(queryset.explain(**explain_options))
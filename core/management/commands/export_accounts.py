@@ -0,0 +1,37 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.flows import AccountExportFlow
+from core.transfer import FORMATS, format_by_name
+
+
+class Command(BaseCommand):
+    """Dump all accounts to a CSV or NDJSON file, i.e. for statement runs.
+    CSV is written by `COPY` on PostgreSQL, otherwise accounts are read by chunks.
+    """
+    help = 'Export accounts to CSV or NDJSON file, "-" writes stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, "-" for stdout')
+        parser.add_argument('--format', choices=FORMATS, help='File format, by the file extension by default')
+        parser.add_argument('--chunk-size', type=int, help='Rows per read chunk')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or format_by_name(options['path'])
+        to_stdout = options['path'] == '-'
+        started = time.monotonic()
+        output = sys.stdout if to_stdout else open(options['path'], 'w', newline='', encoding='utf-8')
+        try:
+            exported = AccountExportFlow(
+                file_format,
+                chunk_size=options['chunk_size'],
+                progress=None if to_stdout else lambda rows: self.stdout.write(f'{rows} accounts', ending='\r')
+            ).run(output)
+        finally:
+            if not to_stdout:
+                output.close()
+        if not to_stdout:
+            seconds = time.monotonic() - started
+            self.stdout.write(f'Exported {exported} accounts in {seconds:.3f}s, {exported / seconds:.0f} rows/s')
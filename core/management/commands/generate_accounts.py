@@ -0,0 +1,99 @@
+import io
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.enums import AccountStatusEnum
+from core.flows import RollupReconcileFlow
+from core.models import BankAccount, PendingSettlement
+
+
+class Command(BaseCommand):
+    """Bulk load a synthetic population of bank accounts.
+    Rows are inserted by `bulk_create` batches, or by `COPY ... FROM STDIN` on PostgreSQL
+    with `--copy`. The same `--seed` generates the same population.
+    """
+    help = 'Bulk load synthetic bank accounts with given OPEN and non zero hold ratios'
+
+    max_amount = 999999  # minor units, `balance` and `hold` are BigIntegerField of minor units
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Accounts to create')
+        parser.add_argument('--open-ratio', type=float, default=0.9, help='Share of OPEN accounts')
+        parser.add_argument('--hold-ratio', type=float, default=0.1, help='Share of accounts with non zero hold')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Rows per INSERT or COPY')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--copy', action='store_true', help='Load by COPY, PostgreSQL only')
+
+    def generate_rows(self, count: int, rng: random.Random, open_ratio: float, hold_ratio: float):
+        """Yield `(id, owner_name, balance, hold, status)` tuples, amounts in minor units."""
+        for i in range(count):
+            balance = rng.randint(0, self.max_amount)
+            hold = rng.randint(1, balance) if balance and rng.random() < hold_ratio else 0
+            status = AccountStatusEnum.OPEN.value if rng.random() < open_ratio else AccountStatusEnum.CLOSE.value
+            yield (
+                uuid.UUID(int=rng.getrandbits(128), version=4),
+                f'Synthetic account {i}',
+                balance,
+                hold,
+                status
+            )
+
+    def insert_batch(self, rows: list):
+        BankAccount.objects.bulk_create([
+            BankAccount(id=pk, owner_name=owner_name, balance=balance, hold=hold, status=status)
+            for pk, owner_name, balance, hold, status in rows
+        ])
+
+    def copy_batch(self, rows: list):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(str(value) for value in row) + '\t0\n')
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {BankAccount._meta.db_table} (id, owner_name, balance, hold, status, hot_slots) FROM STDIN',
+                buffer
+            )
+
+    def enqueue_held(self, rows: list):
+        """Queue OPEN accounts with hold for settlement, as the subtract action does."""
+        PendingSettlement.objects.enqueue([
+            pk for pk, _, _, hold, status in rows if hold and status == AccountStatusEnum.OPEN.value
+        ])
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs PostgreSQL')
+        for ratio in ('open_ratio', 'hold_ratio'):
+            if not 0 <= options[ratio] <= 1:
+                raise CommandError(f'--{ratio.replace("_", "-")} should be between 0 and 1')
+        write = self.copy_batch if options['copy'] else self.insert_batch
+        rows = self.generate_rows(
+            options['count'],
+            random.Random(options['seed']),
+            options['open_ratio'],
+            options['hold_ratio']
+        )
+
+        started, created, batch = time.monotonic(), 0, []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == options['batch_size']:
+                write(batch)
+                self.enqueue_held(batch)
+                created, batch = created + len(batch), []
+                self.stdout.write(f'{created} accounts', ending='\r')
+        if batch:
+            write(batch)
+            self.enqueue_held(batch)
+            created += len(batch)
+        seconds = time.monotonic() - started
+        self.stdout.write(f'Created {created} accounts in {seconds:.3f}s, {created / seconds:.0f} rows/s')
+        if settings.ACCOUNT_ROLLUP_ENABLED:
+            # Rows are loaded past the models, bring the stats totals up to date
+            RollupReconcileFlow().run()
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import AccountSlot, BankAccount
+
+
+class Command(BaseCommand):
+    """Turn the hot account mode on or off: adds to a hot account go to one of its
+    balance slots at random instead of queueing on the account record lock.
+    Changing the slots count consolidates the old slots first.
+    """
+    help = 'Spread adds to an account over N balance slots, 0 turns it off'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account_id', help='Bank account id')
+        parser.add_argument('--slots', type=int, required=True, help='Balance slots, 0 to turn off')
+
+    def handle(self, *args, **options):
+        slots = options['slots']
+        if not 0 <= slots <= settings.ACCOUNT_HOT_SLOTS_MAX:
+            raise CommandError(f'--slots should be between 0 and {settings.ACCOUNT_HOT_SLOTS_MAX}')
+        if slots and settings.ACCOUNT_LEDGER_ENABLED:
+            raise CommandError('Ledger mode adds do not lock the account record, hot accounts are not needed')
+        try:
+            exists = BankAccount.objects.filter(id=options['account_id']).exists()
+        except ValidationError:
+            exists = False
+        if not exists:
+            raise CommandError(f'Account {options["account_id"]} not found')
+        moved = AccountSlot.objects.consolidate(options['account_id'], slots)
+        self.stdout.write(f'Account {options["account_id"]}: {slots} slots, consolidated {moved}')
@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection
+
+from core.flows import AccountImportFlow
+from core.transfer import FORMATS, format_by_name, read_rows
+
+
+class Command(BaseCommand):
+    """Create accounts from a CSV (`id,owner_name,balance,hold,status` header, `id` may be
+    empty) or NDJSON file, i.e. onboarding a partner bank. The file is streamed, loaded by
+    `COPY` on PostgreSQL, in one transaction: an invalid row imports nothing.
+    """
+    help = 'Import accounts from CSV or NDJSON file, "-" reads stdin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, "-" for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='File format, by the file extension by default')
+        parser.add_argument('--batch-size', type=int, help='Rows per COPY or INSERT')
+        parser.add_argument('--no-copy', action='store_true', help='Insert by bulk_create on PostgreSQL too')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or format_by_name(options['path'])
+        started = time.monotonic()
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            imported = AccountImportFlow(
+                read_rows(stream, file_format),
+                batch_size=options['batch_size'],
+                copy=connection.vendor == 'postgresql' and not options['no_copy'],
+                progress=lambda rows: self.stdout.write(f'{rows} accounts', ending='\r')
+            ).run()
+        except ValidationError as e:
+            raise CommandError(f'Nothing imported: {e.messages[0]}')
+        except IntegrityError as e:
+            raise CommandError(f'Nothing imported, account already exists: {e}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        seconds = time.monotonic() - started
+        self.stdout.write(f'Imported {imported} accounts in {seconds:.3f}s, {imported / seconds:.0f} rows/s')
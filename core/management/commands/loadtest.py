@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """HTTP load test of one endpoint with many concurrent keep-alive connections.
+    Run it against the WSGI (`/api/account/...`) and the ASGI (`/api/async/account/...`)
+    deployments to compare connection capacity and latency percentiles.
+    """
+    help = 'Load test an endpoint with concurrent connections and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Endpoint url, i.e. http://localhost:8000/api/account/<pk>/status/')
+        parser.add_argument('--method', default='GET', choices=('GET', 'POST'))
+        parser.add_argument('--data', default='', help='JSON body of POST requests')
+        parser.add_argument('--concurrency', type=int, default=100, help='Concurrent connections')
+        parser.add_argument('--requests', type=int, default=5000, help='Total requests')
+        parser.add_argument('--timeout', type=float, default=30, help='Request timeout, seconds')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    async def request(self, reader, writer, payload: bytes) -> tuple:
+        """Send request, return `(status code, keep-alive)`."""
+        writer.write(payload)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed')
+        length, keep_alive = 0, True
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value == 'close':
+                keep_alive = False
+        await reader.readexactly(length)
+        return int(status_line.split()[1]), keep_alive
+
+    async def connection(self, url, payload: bytes, counter: list, latencies: list, errors: list, timeout: float):
+        reader = writer = None
+        while counter[0] > 0:
+            counter[0] -= 1
+            started = time.monotonic()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(url.hostname, url.port or 80), timeout
+                    )
+                code, keep_alive = await asyncio.wait_for(self.request(reader, writer, payload), timeout)
+                latencies.append(time.monotonic() - started)
+                if code >= 400:
+                    errors.append(code)
+                if not keep_alive:
+                    writer.close()
+                    reader = writer = None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+                errors.append(type(e).__name__)
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    async def run(self, options) -> dict:
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// urls are supported')
+        body = options['data'].encode()
+        path = url.path + (f'?{url.query}' if url.query else '')
+        headers = [
+            f'{options["method"]} {path} HTTP/1.1',
+            f'Host: {url.netloc}',
+            'Connection: keep-alive',
+            'Content-Type: application/json',
+            f'Content-Length: {len(body)}',
+        ]
+        payload = ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+        counter, latencies, errors = [options['requests']], [], []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            self.connection(url, payload, counter, latencies, errors, options['timeout'])
+            for _ in range(options['concurrency'])
+        ))
+        elapsed = time.monotonic() - started
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+        return {
+            'url': options['url'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'completed': len(latencies),
+            'errors': len(errors),
+            'seconds': round(elapsed, 3),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': percentile(0.5),
+            'p99_ms': percentile(0.99),
+            'max_ms': latencies[-1] * 1000 if latencies else None,
+        }
+
+    def handle(self, *args, **options):
+        report = asyncio.run(self.run(options))
+        if options['json']:
+            self.stdout.write(json.dumps(report))
+            return
+        for key, value in report.items():
+            self.stdout.write(f'{key}: {round(value, 2) if isinstance(value, float) else value}')
@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import check_connections
+from core.flows import OutboxRelayFlow
+
+
+class Command(BaseCommand):
+    """Relay process of account change events: publish the outbox to Redis Streams
+    until stopped, sleeping `ACCOUNT_EVENTS_RELAY_IDLE_SECONDS` when it is empty.
+    """
+    help = 'Publish account change events from the outbox to Redis Streams'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Publish the outbox once and exit')
+
+    def handle(self, *args, **options):
+        flow = OutboxRelayFlow()
+        while True:
+            check_connections()
+            published = flow.run()
+            if options['once']:
+                self.stdout.write(f'Published {published} events')
+                return
+            if published < flow.batch_size:
+                time.sleep(settings.ACCOUNT_EVENTS_RELAY_IDLE_SECONDS)
@@ -0,0 +1,219 @@
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCapture(object):
+    """`connection.execute_wrapper` counting queries, their time and rows affected by writes.
+    With `keep_sql` the parameterized SQL is kept, never the parameters (ids, amounts).
+    """
+
+    def __init__(self, keep_sql: bool = False):
+        self.keep_sql = keep_sql
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.monotonic() - started
+            self.queries += 1
+            self.seconds += elapsed
+            rowcount = context['cursor'].rowcount
+            if rowcount > 0 and not sql.lstrip()[:6].upper() == 'SELECT':
+                self.rows += rowcount
+            if self.keep_sql:
+                self.sql.append((elapsed, sql))
+
+
+@contextmanager
+def capture_queries(keep_sql: bool = False):
+    """Capture queries of the default connection in the current thread."""
+    capture = QueryCapture(keep_sql)
+    with connection.execute_wrapper(capture):
+        yield capture
+
+
+class MetricsRegistry(object):
+    """Per-process request and flow metrics, exposed in Prometheus text format.
+
+    Every process accumulates its counters in memory and, at most every
+    `METRICS_FLUSH_INTERVAL` seconds, stores the whole snapshot under its own
+    cache key. The endpoint renders the snapshots of all live processes as
+    series labelled by `process`, so nothing is incremented across processes.
+    """
+    key_prefix = 'metrics'
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    kinds = {
+        'http': ('bank_http_request', 'endpoint', 'HTTP requests'),
+        'flow': ('bank_flow_run', 'flow', 'flow runs'),
+    }
+    # Counter kinds: metric, label names, help
+    counters = {
+        'cache': ('bank_cache_lookups_total', ('cache', 'result'), 'Cache lookups by result.'),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.flushed_at = 0.0
+
+    @property
+    def cache(self):
+        return caches[settings.METRICS_CACHE_ALIAS]
+
+    @property
+    def process(self) -> str:
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def process_key(self, process: str) -> str:
+        return f'{self.key_prefix}:process:{process}'
+
+    @property
+    def index_key(self) -> str:
+        return f'{self.key_prefix}:processes'
+
+    def observe(self, kind: str, name: str, seconds: float, capture: QueryCapture):
+        with self.lock:
+            series = self.series.setdefault((kind, name), {
+                'count': 0,
+                'seconds': 0.0,
+                'db_queries': 0,
+                'db_seconds': 0.0,
+                'rows': 0,
+                'buckets': [0] * len(self.buckets)
+            })
+            series['count'] += 1
+            series['seconds'] += seconds
+            series['db_queries'] += capture.queries
+            series['db_seconds'] += capture.seconds
+            series['rows'] += capture.rows
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][i] += 1
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def increment(self, kind: str, *labels):
+        """Count one event of counter `kind` with values of its labels."""
+        with self.lock:
+            series = self.series.setdefault((kind, labels), {'count': 0})
+            series['count'] += 1
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Store the snapshot of this process and register it in the processes index."""
+        with self.lock:
+            snapshot = {
+                key: {field: list(value) if isinstance(value, list) else value for field, value in series.items()}
+                for key, series in self.series.items()
+            }
+            self.flushed_at = time.monotonic()
+        if not snapshot:
+            return
+        process = self.process
+        self.cache.set(self.process_key(process), snapshot, settings.METRICS_PROCESS_TTL)
+        processes = self.cache.get(self.index_key) or set()
+        if process not in processes:
+            self.cache.set(self.index_key, processes | {process}, None)
+
+    def collect(self) -> dict:
+        """Snapshots of live processes, expired processes are dropped from the index."""
+        processes = self.cache.get(self.index_key) or set()
+        keys = {self.process_key(process): process for process in processes}
+        snapshots = {keys[key]: snapshot for key, snapshot in self.cache.get_many(list(keys)).items()}
+        if len(snapshots) < len(processes):
+            self.cache.set(self.index_key, set(snapshots), None)
+        return snapshots
+
+    def render(self) -> str:
+        """All processes metrics in Prometheus text exposition format."""
+        self.flush()
+        snapshots = self.collect()
+        lines = []
+        for kind, (prefix, label_name, title) in self.kinds.items():
+            rows = sorted(
+                (name, process, series)
+                for process, snapshot in snapshots.items()
+                for (series_kind, name), series in snapshot.items()
+                if series_kind == kind
+            )
+            lines += [
+                f'# HELP {prefix}_duration_seconds Wall time of {title}.',
+                f'# TYPE {prefix}_duration_seconds histogram',
+            ]
+            for name, process, series in rows:
+                labels = f'{label_name}="{name}",process="{process}"'
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines += [
+                    f'{prefix}_duration_seconds_bucket{{{labels},le="+Inf"}} {series["count"]}',
+                    f'{prefix}_duration_seconds_sum{{{labels}}} {series["seconds"]}',
+                    f'{prefix}_duration_seconds_count{{{labels}}} {series["count"]}',
+                ]
+            for field, metric, help_text in (
+                ('db_queries', 'db_queries_total', 'Database queries'),
+                ('db_seconds', 'db_seconds_total', 'Database time'),
+                ('rows', 'rows_total', 'Rows affected by database writes'),
+            ):
+                lines += [f'# HELP {prefix}_{metric} {help_text} of {title}.', f'# TYPE {prefix}_{metric} counter']
+                lines += [
+                    f'{prefix}_{metric}{{{label_name}="{name}",process="{process}"}} {series[field]}'
+                    for name, process, series in rows
+                ]
+        for kind, (metric, label_names, help_text) in self.counters.items():
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for labels, process, series in sorted(
+                (labels, process, series)
+                for process, snapshot in snapshots.items()
+                for (series_kind, labels), series in snapshot.items()
+                if series_kind == kind
+            ):
+                values = ','.join(f'{name}="{value}"' for name, value in zip(label_names, labels))
+                lines.append(f'{metric}{{{values},process="{process}"}} {series["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def log_slow_request(request, name: str, seconds: float, capture: QueryCapture):
+    """Log timings and parameterized SQL only, the path and the values carry account data."""
+    statements = '\n'.join(
+        f'    {elapsed * 1000:.1f}ms {sql}'
+        for elapsed, sql in capture.sql[:settings.METRICS_SLOW_REQUEST_MAX_SQL]
+    )
+    logger.warning(
+        f'Slow request {request.method} {name}: {seconds:.3f}s, '
+        f'{capture.queries} queries, {capture.seconds:.3f}s in database\n{statements}'
+    )
+
+
+def observe_flow(run):
+    """Flow `run` decorator: record wall time, queries and affected rows as `flow` metrics."""
+    @wraps(run)
+    def wrapper(self, *args, **kwargs):
+        if not settings.METRICS_ENABLED:
+            return run(self, *args, **kwargs)
+        started = time.monotonic()
+        with capture_queries() as capture:
+            result = run(self, *args, **kwargs)
+        metrics.observe('flow', type(self).__name__, time.monotonic() - started, capture)
+        metrics.flush()
+        return result
+    return wrapper
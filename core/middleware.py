@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from django.conf import settings
+
+from core.metrics import QueryCapture, capture_queries, log_slow_request, metrics
+
+
+class MetricsMiddleware(object):
+    """Record wall time, database queries and affected rows of every request
+    as `http` metrics labelled by the url name, and log requests slower than
+    `METRICS_SLOW_REQUEST_SECONDS` with their parameterized SQL.
+    Async capable, so ASGI requests are not serialized on the sync thread. Queries of
+    async views run in the database thread pool and are not captured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # mark the instance as a coroutine function for the async middleware chain
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        slow_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+        started = time.monotonic()
+        with capture_queries(keep_sql=slow_seconds > 0) as capture:
+            response = self.get_response(request)
+        self.observe(request, time.monotonic() - started, capture)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self.observe(request, time.monotonic() - started, QueryCapture())
+        return response
+
+    @staticmethod
+    def observe(request, seconds: float, capture: QueryCapture):
+        match = request.resolver_match
+        name = match.url_name if match is not None and match.url_name else 'unmatched'
+        metrics.observe('http', name, seconds, capture)
+        slow_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+        if 0 < slow_seconds <= seconds:
+            log_slow_request(request, name, seconds, capture)
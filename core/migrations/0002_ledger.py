@@ -0,0 +1,51 @@
+# Generated by Django 3.2 on 2026-10-18 10:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Account balance')),
+                ('hold', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Account hold bankroll (cash)')),
+                ('last_entry_id', models.BigIntegerField(db_index=True, verbose_name='Last compacted ledger entry id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='core.bankaccount', verbose_name='Bank account')),
+            ],
+            options={
+                'verbose_name': 'Account snapshot',
+                'verbose_name_plural': 'Account snapshots',
+            },
+        ),
+        migrations.CreateModel(
+            name='AccountLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(choices=[('ADD', 'Add to balance'), ('HOLD', 'Add to hold'), ('SETTLE', 'Subtract hold from balance')], max_length=6, verbose_name='Operation')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Operation amount')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.bankaccount', verbose_name='Bank account')),
+            ],
+            options={
+                'verbose_name': 'Ledger entry',
+                'verbose_name_plural': 'Ledger entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accountsnapshot',
+            index=models.Index(fields=['account', '-last_entry_id'], name='snapshot_account_last_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountledgerentry',
+            index=models.Index(fields=['account', 'id'], name='ledger_account_id_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True, verbose_name='Idempotency key')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='Request fingerprint')),
+                ('status_code', models.PositiveSmallIntegerField(default=0, verbose_name='Response status code')),
+                ('response', models.JSONField(default=dict, verbose_name='Response body')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Idempotency record',
+                'verbose_name_plural': 'Idempotency records',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_idempotency_record'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='accountledgerentry',
+            name='ledger_account_id_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='accountsnapshot',
+            name='snapshot_account_last_idx',
+        ),
+        migrations.AddIndex(
+            model_name='accountledgerentry',
+            index=models.Index(fields=['account', 'id'], include=('operation', 'amount'), name='ledger_account_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountsnapshot',
+            index=models.Index(fields=['account', '-last_entry_id'], include=('balance', 'hold'), name='snapshot_account_last_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bankaccount',
+            index=models.Index(condition=models.Q(('hold__gt', 0), ('status', 'OPEN')), fields=['id'], name='account_hold_open_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-18 10:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSettlement',
+            fields=[
+                ('account', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pending_settlement', serialize=False, to='core.bankaccount', verbose_name='Bank account')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Pending settlement',
+                'verbose_name_plural': 'Pending settlements',
+            },
+        ),
+        # Queue the accounts already holding something
+        migrations.RunSQL(
+            sql=(
+                "INSERT INTO core_pendingsettlement (account_id, created_at) "
+                "SELECT id, CURRENT_TIMESTAMP FROM core_bankaccount WHERE hold > 0 AND status = 'OPEN'"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_pending_settlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.UUIDField(verbose_name='Bank account id')),
+                ('operation', models.CharField(choices=[('ADD', 'Add to balance'), ('HOLD', 'Add to hold'), ('SETTLE', 'Subtract hold from balance')], max_length=6, verbose_name='Operation')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Operation amount')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Outbox event',
+                'verbose_name_plural': 'Outbox events',
+            },
+        ),
+    ]
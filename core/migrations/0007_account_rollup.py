@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('CLOSE', 'Close')], max_length=5, verbose_name='Account status')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Shard')),
+                ('accounts', models.BigIntegerField(default=0, verbose_name='Accounts count')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Balance total')),
+                ('hold', models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Hold total')),
+            ],
+            options={
+                'verbose_name': 'Account rollup',
+                'verbose_name_plural': 'Account rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountrollup',
+            constraint=models.UniqueConstraint(fields=('status', 'shard'), name='rollup_status_shard_uniq'),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "INSERT INTO core_accountrollup (status, shard, accounts, balance, hold) "
+                "SELECT status, 0, COUNT(*), SUM(balance), SUM(hold) FROM core_bankaccount GROUP BY status"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-18 11:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_account_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankaccount',
+            name='hot_slots',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Balance slots of hot account (0 - not hot)'),
+        ),
+        migrations.CreateModel(
+            name='AccountSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='Slot')),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Slot balance')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='core.bankaccount', verbose_name='Bank account')),
+            ],
+            options={
+                'verbose_name': 'Account slot',
+                'verbose_name_plural': 'Account slots',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accountslot',
+            constraint=models.UniqueConstraint(fields=('account', 'slot'), name='slot_account_slot_uniq'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 3.2 on 2026-10-18 11:16
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.validators import MinValueValidator
+from django.db import migrations, models
+
+MINOR_UNITS = 10 ** settings.ACCOUNT_CURRENCY_DECIMAL_PLACES
+
+# (model, field, decimal field before, integer field after)
+MONEY_FIELDS = [
+    ('bankaccount', 'balance',
+     models.DecimalField(decimal_places=2, default=0, max_digits=6, verbose_name='Account balance'),
+     models.BigIntegerField(default=0, verbose_name='Account balance, minor units')),
+    ('bankaccount', 'hold',
+     models.DecimalField(decimal_places=2, default=0, max_digits=6, validators=[MinValueValidator(Decimal('0.01'))],
+                         verbose_name='Account hold bankroll (cash)'),
+     models.BigIntegerField(default=0, validators=[MinValueValidator(1)],
+                            verbose_name='Account hold bankroll (cash), minor units')),
+    ('accountslot', 'balance',
+     models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Slot balance'),
+     models.BigIntegerField(default=0, verbose_name='Slot balance, minor units')),
+    ('accountledgerentry', 'amount',
+     models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Operation amount'),
+     models.BigIntegerField(verbose_name='Operation amount, minor units')),
+    ('accountsnapshot', 'balance',
+     models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Account balance'),
+     models.BigIntegerField(verbose_name='Account balance, minor units')),
+    ('accountsnapshot', 'hold',
+     models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Account hold bankroll (cash)'),
+     models.BigIntegerField(verbose_name='Account hold bankroll (cash), minor units')),
+    ('outboxevent', 'amount',
+     models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Operation amount'),
+     models.BigIntegerField(verbose_name='Operation amount, minor units')),
+    ('accountrollup', 'balance',
+     models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Balance total'),
+     models.BigIntegerField(default=0, verbose_name='Balance total, minor units')),
+    ('accountrollup', 'hold',
+     models.DecimalField(decimal_places=2, default=0, max_digits=20, verbose_name='Hold total'),
+     models.BigIntegerField(default=0, verbose_name='Hold total, minor units')),
+]
+
+
+def check_decimal_places(apps, schema_editor):
+    """The source columns have 2 decimal places, fewer minor units would round the cents away."""
+    if settings.ACCOUNT_CURRENCY_DECIMAL_PLACES < 2:
+        raise ImproperlyConfigured(
+            'ACCOUNT_CURRENCY_DECIMAL_PLACES should be at least 2 to convert the amounts to minor units'
+        )
+
+
+def widened(field: models.DecimalField) -> models.DecimalField:
+    """The decimal field with room for the amounts multiplied to minor units."""
+    _, _, args, kwargs = field.deconstruct()
+    return models.DecimalField(*args, **{**kwargs, 'max_digits': 22})
+
+
+def scale_sql(reverse: bool = False) -> list:
+    """Multiply the amounts to minor units (or divide back), one UPDATE per table."""
+    columns = {}
+    for model_name, name, _, _ in MONEY_FIELDS:
+        columns.setdefault(f'core_{model_name}', []).append(name)
+    if reverse:
+        return [
+            f'UPDATE {table} SET ' + ', '.join(f'{name} = {name} / {MINOR_UNITS}.0' for name in names)
+            for table, names in columns.items()
+        ]
+    return [
+        f'UPDATE {table} SET ' + ', '.join(f'{name} = ROUND({name} * {MINOR_UNITS})' for name in names)
+        for table, names in columns.items()
+    ]
+
+
+class Migration(migrations.Migration):
+    """Store money amounts as integer minor units: widen the decimal columns,
+    multiply the amounts and convert the columns to bigint. Rewrites the tables.
+    """
+
+    dependencies = [
+        ('core', '0008_account_slot'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_decimal_places, migrations.RunPython.noop),
+    ] + [
+        migrations.AlterField(model_name=model_name, name=name, field=widened(before))
+        for model_name, name, before, _ in MONEY_FIELDS
+    ] + [
+        migrations.RunSQL(scale_sql(), reverse_sql=scale_sql(reverse=True)),
+    ] + [
+        migrations.AlterField(model_name=model_name, name=name, field=after)
+        for model_name, name, _, after in MONEY_FIELDS
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-18 11:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accountledgerentry',
+            name='operation',
+            field=models.CharField(choices=[('ADD', 'Add to balance'), ('HOLD', 'Add to hold'), ('SETTLE', 'Subtract hold from balance'), ('RELEASE', 'Subtract released reservation from hold')], max_length=7, verbose_name='Operation'),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='operation',
+            field=models.CharField(choices=[('ADD', 'Add to balance'), ('HOLD', 'Add to hold'), ('SETTLE', 'Subtract hold from balance'), ('RELEASE', 'Subtract released reservation from hold')], max_length=7, verbose_name='Operation'),
+        ),
+        migrations.CreateModel(
+            name='AccountReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(verbose_name='Reserved amount, minor units')),
+                ('expires_at', models.DateTimeField(verbose_name='Expires at')),
+                ('capture_on_expiry', models.BooleanField(verbose_name='Captured (not released) on expiry')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.bankaccount', verbose_name='Bank account')),
+            ],
+            options={
+                'verbose_name': 'Account reservation',
+                'verbose_name_plural': 'Account reservations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accountreservation',
+            index=models.Index(condition=models.Q(('capture_on_expiry', True)), fields=['expires_at'], name='reservation_capture_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountreservation',
+            index=models.Index(condition=models.Q(('capture_on_expiry', False)), fields=['expires_at'], name='reservation_release_idx'),
+        ),
+    ]
@@ -36,3 +36,36 @@ class GetSerializerClassMixin:
             return self.serializer_action_classes[self.action]
         except (KeyError, AttributeError):
             return super().get_serializer_class()
+
+
+class ValuesRepresentationMixin:
+    """Serializer mixin for a fast read path over `.values()` rows.
+    Field `to_representation` functions are collected once per class and
+    applied to the fetched columns directly, bypassing per-instance field
+    machinery. The result equals `.data` of the serializer for the same
+    record, so the rendered JSON is byte-identical.
+    Only flat, readable fields are supported.
+    """
+    @classmethod
+    def get_accessors(cls) -> tuple:
+        accessors = cls.__dict__.get('_accessors')
+        if accessors is None:
+            accessors = tuple(
+                (name, field.source, field.to_representation)
+                for name, field in cls().fields.items()
+                if not field.write_only
+            )
+            cls._accessors = accessors
+        return accessors
+
+    @classmethod
+    def value_fields(cls) -> list:
+        """Columns to pass to `.values()`."""
+        return [source for _, source, _ in cls.get_accessors()]
+
+    @classmethod
+    def represent(cls, row: dict) -> dict:
+        return {
+            name: None if row[source] is None else to_representation(row[source])
+            for name, source, to_representation in cls.get_accessors()
+        }
@@ -1,11 +1,18 @@
-from decimal import Decimal
+import random
+from datetime import timedelta
 
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Q
+from django.db import connection, models
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.db.transaction import atomic
+from django.utils import timezone
 
+from core.cache import account_status_cache
 from core.mixins import AbstractUUID
-from core.enums import AccountStatusEnum
+from core.enums import AccountStatusEnum, LedgerOperationEnum
+from core.money import MAX_BALANCE, format_minor
 
 
 # TODO: may be should remove it to celery task flow
@@ -14,39 +21,776 @@ class BankAccountManager(models.Manager):
     def not_zero_hold(self):
         return self.filter(Q(hold__gt=0) & Q(status=AccountStatusEnum.OPEN.value))
 
+    def add_balance(self, pk, value) -> bool:
+        """Add `value` to the balance of OPEN account by one conditional UPDATE,
+        only if the new balance is at most `MAX_BALANCE`. Return False if no record was updated.
+        """
+        with atomic():
+            updated = self.filter(
+                id=pk,
+                status=AccountStatusEnum.OPEN.value,
+                balance__lte=MAX_BALANCE - value
+            ).update(balance=F('balance') + value) == 1
+            if updated:
+                OutboxEvent.objects.record([(LedgerOperationEnum.ADD, pk, value)])
+                AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, value, 0)})
+                account_status_cache.invalidate(pk)
+        return updated
+
+    def add_hold(self, pk, value, hot: bool = False, enqueue: bool = True) -> bool:
+        """Add `value` to the hold of OPEN account by one conditional UPDATE,
+        only if the balance covers the new hold. Return False if no record was updated.
+        With `enqueue=False` the account is not queued for settlement (reservation mode).
+
+        Hot accounts keep a part of the balance in the slots: the record is locked,
+        the slots are summed and the hold is added if both together cover it.
+        """
+        with atomic():
+            accounts = self.filter(id=pk, status=AccountStatusEnum.OPEN.value)
+            if hot:
+                account = accounts.select_for_update().values_list('balance', 'hold').first()
+                updated = (
+                    account is not None
+                    and account[0] + AccountSlot.objects.balance(pk) >= account[1] + value
+                    and accounts.update(hold=F('hold') + value) == 1
+                )
+            else:
+                updated = accounts.filter(balance__gte=F('hold') + value).update(hold=F('hold') + value) == 1
+            if updated:
+                if enqueue:
+                    PendingSettlement.objects.enqueue([pk])
+                OutboxEvent.objects.record([(LedgerOperationEnum.HOLD, pk, value)])
+                AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, 0, value)})
+                account_status_cache.invalidate(pk)
+        return updated
+
 
 class BankAccount(AbstractUUID):
-    """Subscriber account model."""
+    """Subscriber account model. Amounts are integer minor units, see `core.money`."""
 
     owner_name = models.CharField(
         max_length=128,
         verbose_name='Account owner fullname'
     )
-    balance = models.DecimalField(
-        decimal_places=2,
-        max_digits=6,
+    balance = models.BigIntegerField(
         default=0,
-        verbose_name='Account balance'
+        verbose_name='Account balance, minor units'
     )
-    hold = models.DecimalField(
-        decimal_places=2,
-        max_digits=6,
+    hold = models.BigIntegerField(
         default=0,
-        verbose_name='Account hold bankroll (cash)',
-        validators=[MinValueValidator(Decimal('0.01'))]
+        verbose_name='Account hold bankroll (cash), minor units',
+        validators=[MinValueValidator(1)]
     )
     status = models.CharField(
         max_length=5,
         choices=AccountStatusEnum.as_choices(),
         verbose_name='Account status'
     )
+    hot_slots = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Balance slots of hot account (0 - not hot)'
+    )
 
     objects = BankAccountManager()
 
     def __str__(self):
         return f'{self.owner_name}: {self.status}'
 
+    def save(self, *args, **kwargs):
+        """Save and queue the account for settlement if it has hold (i.e. edited in admin).
+        The change of the saved record is added to the totals rollup.
+        """
+        with atomic():
+            previous = None
+            if settings.ACCOUNT_ROLLUP_ENABLED:
+                previous = BankAccount.objects.select_for_update().filter(
+                    id=self.id
+                ).values_list('status', 'balance', 'hold').first()
+            super(BankAccount, self).save(*args, **kwargs)
+            if self.hold and self.status == AccountStatusEnum.OPEN.value:
+                PendingSettlement.objects.enqueue([self.id])
+            AccountRollup.objects.change(previous, (self.status, self.balance, self.hold))
+
+    def current_state(self) -> tuple:
+        """Return actual `(balance, hold)`: derived from the ledger in ledger mode,
+        the record fields plus the slots of hot account otherwise.
+        """
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            return AccountLedgerEntry.objects.state(self)
+        if self.hot_slots:
+            return self.balance + AccountSlot.objects.balance(self.id), self.hold
+        return self.balance, self.hold
+
     class Meta:
         verbose_name = 'Bank account'
         verbose_name_plural = 'Bank accounts'
+        indexes = [
+            # Hold settlement scan: only accounts with something to settle, walked in `id` order.
+            models.Index(
+                fields=['id'],
+                name='account_hold_open_idx',
+                condition=Q(hold__gt=0) & Q(status=AccountStatusEnum.OPEN.value)
+            ),
+        ]
+
+
+class AccountSlotManager(models.Manager):
+    """AccountSlot model Manager. Adding to hot accounts and consolidating the slots."""
+    def balance(self, account_id) -> int:
+        """Sum of the account slots."""
+        return int(self.filter(account_id=account_id).aggregate(total=Sum('balance'))['total'] or 0)
+
+    def balances(self, account_ids) -> dict:
+        """`{account_id: sum of the slots}` of the accounts with slots."""
+        return {
+            account_id: int(total)
+            for account_id, total in self.filter(account_id__in=account_ids).values('account_id').annotate(
+                total=Sum('balance')
+            ).order_by().values_list('account_id', 'total')
+        }
+
+    @staticmethod
+    def balance_expression():
+        """Sum of the slots of the outer BankAccount row, the subquery runs for hot rows only."""
+        total = AccountSlot.objects.filter(account_id=OuterRef('id')).order_by().values('account_id').annotate(
+            total=Sum('balance')
+        ).values('total')
+        # PostgreSQL sums bigint as numeric
+        return Case(
+            When(hot_slots__gt=0, then=Cast(Coalesce(Subquery(total), Value(0)), models.BigIntegerField())),
+            default=Value(0),
+            output_field=models.BigIntegerField()
+        )
+
+    @staticmethod
+    def lock_open_account(account_id) -> bool:
+        """Return True if the account is OPEN. On PostgreSQL its record is locked `FOR SHARE`
+        to the end of the transaction: adds do not wait for each other, closing waits for them.
+        """
+        accounts = BankAccount.objects.filter(id=account_id, status=AccountStatusEnum.OPEN.value).values('id')
+        if connection.vendor != 'postgresql':
+            return accounts.exists()
+        sql, params = accounts.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} FOR SHARE', params)
+            return cursor.fetchone() is not None
+
+    def add(self, account_id, slots: int, value) -> bool:
+        """Add `value` to a random slot of OPEN hot account, the account record is shared locked only.
+        Without the slot (hot mode was turned off meanwhile) or if it would pass `MAX_BALANCE`
+        the value goes to the record.
+        """
+        with atomic():
+            if not self.lock_open_account(account_id):
+                return False
+            updated = self.filter(
+                account_id=account_id,
+                slot=random.randrange(slots),
+                balance__lte=MAX_BALANCE - value
+            ).update(balance=F('balance') + value) == 1
+            if not updated:
+                return BankAccount.objects.add_balance(account_id, value)
+            OutboxEvent.objects.record([(LedgerOperationEnum.ADD, account_id, value)])
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, value, 0)})
+        account_status_cache.invalidate(account_id)
+        return True
+
+    def consolidate(self, account_id, slots: int = None) -> int:
+        """Move the slot balances to the account record and return the moved sum.
+        With `slots` the slots are recreated and the account hot mode is set to it, 0 turns it off.
+
+        Lock order is the record, then the slots; adds lock a slot only, so they wait for
+        the consolidation or, when the slots were recreated, fall back to the record.
+        """
+        with atomic():
+            if not BankAccount.objects.select_for_update().filter(id=account_id).exists():
+                return 0
+            moved = sum(self.select_for_update().filter(account_id=account_id).values_list('balance', flat=True))
+            if moved:
+                BankAccount.objects.filter(id=account_id).update(balance=F('balance') + moved)
+            if slots is None:
+                if moved:
+                    self.filter(account_id=account_id).update(balance=0)
+                return moved
+            self.filter(account_id=account_id).delete()
+            self.bulk_create([AccountSlot(account_id=account_id, slot=slot) for slot in range(slots)])
+            BankAccount.objects.filter(id=account_id).update(hot_slots=slots)
+        account_status_cache.invalidate(account_id)
+        return moved
+
+
+class AccountSlot(models.Model):
+    """Balance slot of a hot account. Adds to a hot account go to a random slot
+    instead of the account record, so they do not queue on the record lock.
+    The account balance is the record balance plus the sum of its slots,
+    SlotConsolidationFlow moves the slots back to the record.
+    """
+
+    account = models.ForeignKey(
+        BankAccount,
+        on_delete=models.CASCADE,
+        related_name='slots',
+        verbose_name='Bank account'
+    )
+    slot = models.PositiveSmallIntegerField(
+        verbose_name='Slot'
+    )
+    balance = models.BigIntegerField(
+        default=0,
+        verbose_name='Slot balance, minor units'
+    )
+
+    objects = AccountSlotManager()
+
+    def __str__(self):
+        return f'{self.account_id}[{self.slot}]: {self.balance}'
+
+    class Meta:
+        verbose_name = 'Account slot'
+        verbose_name_plural = 'Account slots'
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'slot'], name='slot_account_slot_uniq'),
+        ]
+
+
+class PendingSettlementManager(models.Manager):
+    """PendingSettlement model Manager."""
+    def enqueue(self, account_ids):
+        """Queue accounts for settlement, already queued accounts are skipped by the database.
+        Call it in the transaction that adds the hold, after the account UPDATE.
+        """
+        self.bulk_create(
+            [PendingSettlement(account_id=pk) for pk in account_ids],
+            batch_size=settings.SUBTRACT_HOLD_CHUNK_SIZE,
+            ignore_conflicts=True
+        )
+
+
+class PendingSettlement(models.Model):
+    """Account with hold added since the last settlement (the dirty-account queue).
+    Drained by QueuedSubtractHoldFlow in the same transaction that settles the account.
+    """
+
+    account = models.OneToOneField(
+        BankAccount,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pending_settlement',
+        verbose_name='Bank account'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created at'
+    )
+
+    objects = PendingSettlementManager()
+
+    def __str__(self):
+        return f'{self.account_id}: {self.created_at}'
+
+    class Meta:
+        verbose_name = 'Pending settlement'
+        verbose_name_plural = 'Pending settlements'
+
+
+class AccountReservationManager(models.Manager):
+    """AccountReservation model Manager. Reserving, capturing and releasing holds."""
+    def reserve(self, account_id, amount, hold_seconds: int = None, hot: bool = False):
+        """Add `amount` to the hold of OPEN account (see `BankAccountManager.add_hold`) and
+        create its reservation. Without `hold_seconds` it is due for capture at once,
+        otherwise it is released after `hold_seconds` unless captured before.
+        Return the reservation or None if the balance does not cover it.
+        """
+        with atomic():
+            if not BankAccount.objects.add_hold(account_id, amount, hot=hot, enqueue=False):
+                return None
+            if hold_seconds is None:
+                return self.create(account_id=account_id, amount=amount, expires_at=timezone.now(),
+                                   capture_on_expiry=True)
+            return self.create(account_id=account_id, amount=amount, capture_on_expiry=False,
+                               expires_at=timezone.now() + timedelta(seconds=hold_seconds))
+
+    def due(self, capture: bool):
+        """Expired reservations to capture (or to release), read by the partial `expires_at` index."""
+        return self.filter(capture_on_expiry=capture, expires_at__lte=timezone.now())
+
+    def finish(self, reservations: list, capture: bool) -> int:
+        """Capture (subtract from the balance and the hold) or release (subtract from the hold)
+        `(id, account_id, amount)` reservations and delete them. Call it in a transaction,
+        after the reservations are locked: the accounts are locked next, in primary key order.
+        Reservations of accounts no longer OPEN are released, not captured.
+        """
+        totals = {}
+        for _, account_id, amount in reservations:
+            totals[account_id] = totals.get(account_id, 0) + amount
+        accounts = BankAccount.objects.select_for_update().filter(id__in=totals).order_by('id')
+        statuses = dict(accounts.values_list('id', 'status'))
+        captured = {pk for pk, status in statuses.items() if capture and status == AccountStatusEnum.OPEN.value}
+        amounts = Case(
+            *[When(id=pk, then=Value(total)) for pk, total in totals.items()],
+            output_field=models.BigIntegerField()
+        )
+        values = {'hold': F('hold') - amounts}
+        if captured:
+            values['balance'] = Case(
+                When(status=AccountStatusEnum.OPEN.value, then=F('balance') - amounts),
+                default=F('balance'),
+                output_field=models.BigIntegerField()
+            )
+        BankAccount.objects.filter(id__in=totals).update(**values)
+        self.filter(id__in=[pk for pk, _, _ in reservations]).delete()
+        OutboxEvent.objects.record([
+            (LedgerOperationEnum.SETTLE if account_id in captured else LedgerOperationEnum.RELEASE, account_id, amount)
+            for _, account_id, amount in reservations
+        ])
+        deltas = {}
+        for pk, total in totals.items():
+            _, balance, hold = deltas.get(statuses[pk], (0, 0, 0))
+            deltas[statuses[pk]] = (0, balance - total if pk in captured else balance, hold - total)
+        AccountRollup.objects.apply(deltas)
+        account_status_cache.invalidate(*totals)
+        return len(reservations)
+
+    def finish_one(self, account_id, reservation_id, capture: bool) -> bool:
+        """Capture or release one reservation of the account. Return False if it is not found."""
+        with atomic():
+            reservation = self.select_for_update().filter(
+                id=reservation_id,
+                account_id=account_id
+            ).values_list('id', 'account_id', 'amount').first()
+            if reservation is None:
+                return False
+            self.finish([reservation], capture=capture)
+        return True
+
+    def capture(self, account_id, reservation_id) -> bool:
+        return self.finish_one(account_id, reservation_id, capture=True)
+
+    def release(self, account_id, reservation_id) -> bool:
+        return self.finish_one(account_id, reservation_id, capture=False)
+
+
+class AccountReservation(models.Model):
+    """Hold of one subtract (reservation mode), part of the account `hold` until captured
+    or released. Reservations with `capture_on_expiry` are captured by the settlement once
+    expired, the others are captured by the client or released by the expiry sweep.
+    Lock order: the reservation, then the account.
+    """
+
+    account = models.ForeignKey(
+        BankAccount,
+        on_delete=models.CASCADE,
+        related_name='reservations',
+        verbose_name='Bank account'
+    )
+    amount = models.BigIntegerField(
+        verbose_name='Reserved amount, minor units'
+    )
+    expires_at = models.DateTimeField(
+        verbose_name='Expires at'
+    )
+    capture_on_expiry = models.BooleanField(
+        verbose_name='Captured (not released) on expiry'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created at'
+    )
+
+    objects = AccountReservationManager()
+
+    def __str__(self):
+        return f'{self.id} {self.account_id}: {self.amount} until {self.expires_at}'
+
+    class Meta:
+        verbose_name = 'Account reservation'
+        verbose_name_plural = 'Account reservations'
+        indexes = [
+            # Settlement and expiry sweep: only their own reservations, walked in `expires_at` order.
+            models.Index(fields=['expires_at'], name='reservation_capture_idx', condition=Q(capture_on_expiry=True)),
+            models.Index(fields=['expires_at'], name='reservation_release_idx', condition=Q(capture_on_expiry=False)),
+        ]
+
+
+class AccountLedgerEntryManager(models.Manager):
+    """AccountLedgerEntry model Manager. Appending operations and deriving account state."""
+    def state(self, account: BankAccount) -> tuple:
+        """Return `(balance, hold)` of the account: latest snapshot plus the entries after it."""
+        return self.state_with_position(account)[:2]
+
+    def state_with_position(self, account: BankAccount, upto_id: int = None) -> tuple:
+        """Return `(balance, hold, last_entry_id)` of the latest snapshot plus
+        the entries after it, up to `upto_id` if given. Without snapshots the
+        BankAccount record fields are the base.
+        """
+        snapshots = AccountSnapshot.objects.filter(account_id=account.id)
+        if upto_id is not None:
+            snapshots = snapshots.filter(last_entry_id__lte=upto_id)
+        snapshot = snapshots.order_by('-last_entry_id').first()
+        if snapshot is None:
+            balance, hold, last_entry_id = account.balance, account.hold, 0
+        else:
+            balance, hold, last_entry_id = snapshot.balance, snapshot.hold, snapshot.last_entry_id
+
+        tail = self.filter(account_id=account.id, id__gt=last_entry_id)
+        if upto_id is not None:
+            tail = tail.filter(id__lte=upto_id)
+        totals = tail.aggregate(
+            added=Sum('amount', filter=Q(operation=LedgerOperationEnum.ADD.value)),
+            held=Sum('amount', filter=Q(operation=LedgerOperationEnum.HOLD.value)),
+            settled=Sum('amount', filter=Q(operation=LedgerOperationEnum.SETTLE.value)),
+            last_entry_id=Max('id')
+        )
+        added, held, settled = (int(totals[key] or 0) for key in ('added', 'held', 'settled'))
+        return (
+            balance + added - settled,
+            hold + held - settled,
+            totals['last_entry_id'] or last_entry_id
+        )
+
+    def append_add(self, account_id, value) -> bool:
+        """Append `ADD` entry for OPEN account. A plain INSERT, the account record is not locked."""
+        if not BankAccount.objects.filter(id=account_id, status=AccountStatusEnum.OPEN.value).exists():
+            return False
+        with atomic():
+            self.create(account_id=account_id, operation=LedgerOperationEnum.ADD.value, amount=value)
+            OutboxEvent.objects.record([(LedgerOperationEnum.ADD, account_id, value)])
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, value, 0)})
+        account_status_cache.invalidate(account_id)
+        return True
+
+    def append_hold(self, account_id, value) -> bool:
+        """Append `HOLD` entry if the derived balance covers the new hold.
+        Holds of one account are serialized by the account record lock.
+        """
+        with atomic():
+            account = BankAccount.objects.select_for_update().filter(
+                id=account_id,
+                status=AccountStatusEnum.OPEN.value
+            ).first()
+            if account is None:
+                return False
+            balance, hold = self.state(account)
+            if balance < hold + value:
+                return False
+            self.create(account_id=account_id, operation=LedgerOperationEnum.HOLD.value, amount=value)
+            OutboxEvent.objects.record([(LedgerOperationEnum.HOLD, account_id, value)])
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, 0, value)})
+            account_status_cache.invalidate(account_id)
+        return True
+
+    def append_settle(self, account_id) -> bool:
+        """Append `SETTLE` entry for the whole derived hold of OPEN account."""
+        with atomic():
+            account = BankAccount.objects.select_for_update().filter(
+                id=account_id,
+                status=AccountStatusEnum.OPEN.value
+            ).first()
+            if account is None:
+                return False
+            _, hold = self.state(account)
+            if hold <= 0:
+                return False
+            self.create(account_id=account_id, operation=LedgerOperationEnum.SETTLE.value, amount=hold)
+            OutboxEvent.objects.record([(LedgerOperationEnum.SETTLE, account_id, hold)])
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (0, -hold, -hold)})
+            account_status_cache.invalidate(account_id)
+        return True
+
+
+class AccountLedgerEntry(models.Model):
+    """Append-only ledger of account operations.
+    `ADD` increases balance, `HOLD` increases hold,
+    `SETTLE` decreases both balance and hold by `amount`.
+    """
+
+    account = models.ForeignKey(
+        BankAccount,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name='Bank account'
+    )
+    operation = models.CharField(
+        max_length=7,
+        choices=LedgerOperationEnum.as_choices(),
+        verbose_name='Operation'
+    )
+    amount = models.BigIntegerField(
+        verbose_name='Operation amount, minor units'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created at'
+    )
+
+    objects = AccountLedgerEntryManager()
+
+    def __str__(self):
+        return f'{self.account_id}: {self.operation} {self.amount}'
+
+    class Meta:
+        verbose_name = 'Ledger entry'
+        verbose_name_plural = 'Ledger entries'
+        indexes = [
+            # Ledger tail aggregation reads `operation` and `amount` from the index only.
+            models.Index(fields=['account', 'id'], name='ledger_account_id_idx', include=['operation', 'amount']),
+        ]
+
+
+class AccountSnapshot(models.Model):
+    """Account balance and hold compacted from the ledger up to `last_entry_id`."""
+
+    account = models.ForeignKey(
+        BankAccount,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        verbose_name='Bank account'
+    )
+    balance = models.BigIntegerField(
+        verbose_name='Account balance, minor units'
+    )
+    hold = models.BigIntegerField(
+        verbose_name='Account hold bankroll (cash), minor units'
+    )
+    last_entry_id = models.BigIntegerField(
+        db_index=True,
+        verbose_name='Last compacted ledger entry id'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created at'
+    )
+
+    def __str__(self):
+        return f'{self.account_id}: {self.balance}, {self.hold} at {self.last_entry_id}'
+
+    class Meta:
+        verbose_name = 'Account snapshot'
+        verbose_name_plural = 'Account snapshots'
+        indexes = [
+            models.Index(
+                fields=['account', '-last_entry_id'],
+                name='snapshot_account_last_idx',
+                include=['balance', 'hold']
+            ),
+        ]
+
+
+class IdempotencyRecord(models.Model):
+    """Result of a mutation request made with `Idempotency-Key` header, replayed on duplicates."""
+
+    key = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Idempotency key'
+    )
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name='Request fingerprint'
+    )
+    status_code = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Response status code'
+    )
+    response = models.JSONField(
+        default=dict,
+        verbose_name='Response body'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Created at'
+    )
+
+    def __str__(self):
+        return f'{self.key}: {self.status_code}'
+
+    class Meta:
+        verbose_name = 'Idempotency record'
+        verbose_name_plural = 'Idempotency records'
+
+
+class OutboxEventManager(models.Manager):
+    """OutboxEvent model Manager."""
+    def record(self, events):
+        """Write `(operation, account_id, amount)` events in order. Call it in the
+        transaction of the change, after the account record is locked or updated.
+        """
+        if not settings.ACCOUNT_EVENTS_ENABLED:
+            return
+        self.bulk_create(
+            [OutboxEvent(account_id=pk, operation=operation.value, amount=amount) for operation, pk, amount in events],
+            batch_size=settings.ACCOUNT_BATCH_WRITE_SIZE
+        )
+
+
+class OutboxEvent(models.Model):
+    """Account change (the transactional outbox), written in the transaction of the change
+    and deleted by OutboxRelayFlow once published to Redis Streams.
+    `ADD` and `HOLD` carry the added value, `SETTLE` the settled hold and `RELEASE` the released one.
+    """
+
+    account_id = models.UUIDField(
+        verbose_name='Bank account id'
+    )
+    operation = models.CharField(
+        max_length=7,
+        choices=LedgerOperationEnum.as_choices(),
+        verbose_name='Operation'
+    )
+    amount = models.BigIntegerField(
+        verbose_name='Operation amount, minor units'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Created at'
+    )
+
+    objects = OutboxEventManager()
+
+    def __str__(self):
+        return f'{self.id} {self.account_id}: {self.operation} {self.amount}'
+
+    def as_message(self) -> dict:
+        """Stream entry fields."""
+        return {
+            'event_id': self.id,
+            'account_id': str(self.account_id),
+            'operation': self.operation,
+            'amount': format_minor(self.amount),
+            'created_at': self.created_at.isoformat()
+        }
+
+    class Meta:
+        verbose_name = 'Outbox event'
+        verbose_name_plural = 'Outbox events'
+
+
+class AccountRollupManager(models.Manager):
+    """AccountRollup model Manager. Applying deltas and reading the totals."""
+    def by_status(self, rows) -> dict:
+        """`{status: (accounts, balance, hold)}` of aggregated rows for every status,
+        sums as int (PostgreSQL sums bigint as numeric).
+        """
+        totals = {status.value: (0, 0, 0) for status in AccountStatusEnum}
+        for row in rows:
+            totals[row['status']] = (row['accounts'], int(row['balance'] or 0), int(row['hold'] or 0))
+        return totals
+
+    def apply(self, deltas: dict):
+        """Add `{status: (accounts, balance, hold)}` deltas to one random shard row of
+        every status. Call it in the transaction of the change, after the account records.
+        """
+        if not settings.ACCOUNT_ROLLUP_ENABLED:
+            return
+        shard = random.randrange(settings.ACCOUNT_ROLLUP_SHARDS)
+        for status in sorted(deltas):
+            accounts, balance, hold = deltas[status]
+            if not (accounts or balance or hold):
+                continue
+            row = self.filter(status=status, shard=shard)
+            values = {'accounts': F('accounts') + accounts, 'balance': F('balance') + balance, 'hold': F('hold') + hold}
+            if not row.update(**values):
+                self.bulk_create([AccountRollup(status=status, shard=shard)], ignore_conflicts=True)
+                row.update(**values)
+
+    def change(self, before, after):
+        """Apply the change of an account record from `before` to `after` `(status, balance, hold)`,
+        None for a created or deleted record.
+        """
+        deltas = {}
+        for state, sign in ((before, -1), (after, 1)):
+            if state is not None:
+                status, balance, hold = state[0], int(state[1]), int(state[2])
+                accounts_delta, balance_delta, hold_delta = deltas.get(status, (0, 0, 0))
+                deltas[status] = (accounts_delta + sign, balance_delta + sign * balance, hold_delta + sign * hold)
+        self.apply(deltas)
+
+    def totals(self) -> dict:
+        """`{status: (accounts, balance, hold)}` summed over the shard rows."""
+        return self.by_status(self.values('status').annotate(
+            accounts=Sum('accounts'),
+            balance=Sum('balance'),
+            hold=Sum('hold')
+        ).order_by())
+
+    def recompute(self) -> dict:
+        """`{status: (accounts, balance, hold)}` by a full aggregation of the accounts, in one
+        statement. In ledger mode account records hold the compacted state, the entries
+        after the compaction watermark are added, otherwise the slots of hot accounts.
+        """
+        accounts = BankAccount.objects.all()
+        balance, hold = F('balance'), F('hold')
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            watermark = Subquery(AccountSnapshot.objects.order_by('-last_entry_id').values('last_entry_id')[:1])
+            tail = AccountLedgerEntry.objects.filter(
+                account_id=OuterRef('id'),
+                id__gt=Coalesce(watermark, 0)
+            ).order_by().values('account_id')
+            sums = {
+                name: Coalesce(Subquery(
+                    tail.filter(operation=operation.value).annotate(total=Sum('amount')).values('total')
+                ), Value(0), output_field=models.BigIntegerField())
+                for name, operation in (
+                    ('added', LedgerOperationEnum.ADD),
+                    ('held', LedgerOperationEnum.HOLD),
+                    ('settled', LedgerOperationEnum.SETTLE)
+                )
+            }
+            accounts = accounts.annotate(**sums)
+            balance, hold = balance + F('added') - F('settled'), hold + F('held') - F('settled')
+        else:
+            accounts = accounts.annotate(slot_balance=AccountSlot.objects.balance_expression())
+            balance = balance + F('slot_balance')
+        return self.by_status(accounts.values('status').annotate(
+            accounts=Count('id'),
+            balance=Sum(balance),
+            hold=Sum(hold)
+        ).order_by())
+
+
+class AccountRollup(models.Model):
+    """Account count, balance and hold totals of a status, the `stats` action source.
+    Updated by deltas in the transactions of the changes, spread over
+    `ACCOUNT_ROLLUP_SHARDS` rows per status so writers do not queue on one row.
+    RollupReconcileFlow checks the totals against a full recomputation.
+    """
+
+    status = models.CharField(
+        max_length=5,
+        choices=AccountStatusEnum.as_choices(),
+        verbose_name='Account status'
+    )
+    shard = models.PositiveSmallIntegerField(
+        verbose_name='Shard'
+    )
+    accounts = models.BigIntegerField(
+        default=0,
+        verbose_name='Accounts count'
+    )
+    balance = models.BigIntegerField(
+        default=0,
+        verbose_name='Balance total, minor units'
+    )
+    hold = models.BigIntegerField(
+        default=0,
+        verbose_name='Hold total, minor units'
+    )
+
+    objects = AccountRollupManager()
+
+    def __str__(self):
+        return f'{self.status}[{self.shard}]: {self.accounts}, {self.balance}, {self.hold}'
+
+    class Meta:
+        verbose_name = 'Account rollup'
+        verbose_name_plural = 'Account rollups'
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'shard'], name='rollup_status_shard_uniq'),
+        ]
+
 
+def account_deleted(sender, instance: BankAccount, **kwargs):
+    """`post_delete` receiver: subtract the deleted account from the totals rollup."""
+    AccountRollup.objects.change((instance.status, instance.balance, instance.hold), None)
@@ -0,0 +1,57 @@
+import re
+from decimal import Decimal
+
+from django.conf import settings
+
+# Amounts are integers of minor units, i.e. cents for 2 decimal places
+DECIMAL_PLACES = settings.ACCOUNT_CURRENCY_DECIMAL_PLACES
+MINOR_UNITS = 10 ** DECIMAL_PLACES
+# One minor unit as a decimal amount, the smallest operation value
+SMALLEST_AMOUNT = Decimal(1).scaleb(-DECIMAL_PLACES)
+# Digits of an API amount: the largest one, 10**16 - 1 cents, fits BigIntegerField
+# with room for 900 more of them in a balance
+MAX_DIGITS = 16
+INTEGER_DIGITS = MAX_DIGITS - DECIMAL_PLACES
+# Digits of a stored balance, any 18 digits number fits BigIntegerField
+BALANCE_INTEGER_DIGITS = 18 - DECIMAL_PLACES
+# The largest balance in minor units, adds over it are refused
+MAX_BALANCE = 10 ** 18 - 1
+
+
+def amount_re(integer_digits: int):
+    """Pattern of a non-negative decimal string, integer and fraction digits are the groups."""
+    if not DECIMAL_PLACES:
+        return re.compile(rf'([0-9]{{1,{integer_digits}}})()\Z')
+    return re.compile(rf'([0-9]{{1,{integer_digits}}})(?:\.([0-9]{{1,{DECIMAL_PLACES}}}))?\Z')
+
+
+AMOUNT_RE = amount_re(INTEGER_DIGITS)
+BALANCE_RE = amount_re(BALANCE_INTEGER_DIGITS)
+
+
+def to_minor(value) -> int:
+    """Exact minor units of a decimal amount, ValueError if it has more decimal places."""
+    minor = Decimal(value).scaleb(DECIMAL_PLACES)
+    if minor != minor.to_integral_value():
+        raise ValueError(f'{value} has more than {DECIMAL_PLACES} decimal places')
+    return int(minor)
+
+
+def parse_minor(text: str, pattern=AMOUNT_RE):
+    """Minor units of a non-negative decimal string of at most `MAX_DIGITS` digits
+    (or matching `pattern`), by integer arithmetic only. None if the string does not match.
+    """
+    match = pattern.match(text)
+    if match is None:
+        return None
+    units, fraction = match.groups()
+    return int(units) * MINOR_UNITS + int((fraction or '').ljust(DECIMAL_PLACES, '0') or 0)
+
+
+def format_minor(minor: int) -> str:
+    """Decimal string of minor units, `12345` -> `'123.45'`."""
+    sign = '-' if minor < 0 else ''
+    units, fraction = divmod(abs(int(minor)), MINOR_UNITS)
+    if not DECIMAL_PLACES:
+        return f'{sign}{units}'
+    return f'{sign}{units}.{fraction:0{DECIMAL_PLACES}d}'
@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class BankAccountCursorPagination(CursorPagination):
+    """Keyset pagination over the UUID primary key.
+    Every page is `WHERE id > <cursor> ORDER BY id LIMIT <page_size>`,
+    so its cost does not depend on the page depth.
+    """
+    ordering = 'id'
+    page_size = settings.ACCOUNT_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.ACCOUNT_LIST_MAX_PAGE_SIZE
@@ -0,0 +1,26 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer on top of optional `orjson`.
+    Compact output is byte-identical to JSONRenderer. Indented or ASCII-only
+    output, unsupported data and missing `orjson` fall back to JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super(ORJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default)
+        except orjson.JSONEncodeError:
+            return super(ORJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        # Same escaping of line/paragraph separators as JSONRenderer
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
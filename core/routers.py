@@ -0,0 +1,114 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_from_replica(pk=None, sticky: bool = False):
+    """Route reads of the block to a replica, unless the account `pk` was written
+    recently or the client is `sticky` (its own recent write), see `ReplicaRouter`.
+    """
+    use_replica = bool(settings.DATABASE_REPLICAS) and not sticky and not (
+        pk is not None and replica_router.is_sticky(pk)
+    )
+    token = _replica_reads.set(use_replica)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter(object):
+    """Database router: reads inside `read_from_replica()` go to a random replica
+    lagging no more than `DATABASE_REPLICA_MAX_LAG` seconds, everything else goes
+    to the primary (`default`). Replicas are replicated by PostgreSQL, not migrated.
+
+    Read-your-writes: accounts written in the last `DATABASE_REPLICA_STICKY_SECONDS`
+    are marked in the cache and read from the primary.
+    """
+    key_prefix = 'replica:sticky'
+    # alias -> (checked at, lag), shared by the router instances of the process
+    lags = {}
+
+    @property
+    def cache(self):
+        return caches[settings.DATABASE_REPLICA_CACHE_ALIAS]
+
+    def sticky_key(self, pk) -> str:
+        return f'{self.key_prefix}:{pk}'
+
+    def stick(self, pks):
+        """Mark written accounts, call after commit."""
+        if settings.DATABASE_REPLICAS and pks:
+            self.cache.set_many({self.sticky_key(pk): 1 for pk in pks}, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+    def is_sticky(self, pk) -> bool:
+        return self.cache.get(self.sticky_key(pk)) is not None
+
+    @staticmethod
+    def measure_lag(alias: str) -> float:
+        """Replay lag of the replica in seconds, 0 when it replayed all it received."""
+        conn = connections[alias]
+        if conn.vendor != 'postgresql':
+            return 0.0
+        conn.ensure_connection()
+        if conn.pg_version >= 100000:
+            received, replayed = 'pg_last_wal_receive_lsn()', 'pg_last_wal_replay_lsn()'
+        else:
+            received, replayed = 'pg_last_xlog_receive_location()', 'pg_last_xlog_replay_location()'
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'SELECT CASE WHEN {received} = {replayed} THEN 0 '
+                f'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+            )
+            lag = cursor.fetchone()[0]
+        return float(lag or 0)
+
+    def lag(self, alias: str) -> float:
+        """Replay lag checked at most every `DATABASE_REPLICA_LAG_CHECK_INTERVAL` seconds,
+        an unreachable replica counts as lagging forever.
+        """
+        checked_at, lag = self.lags.get(alias, (None, None))
+        if checked_at is None or time.monotonic() - checked_at >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            try:
+                lag = self.measure_lag(alias)
+            except DatabaseError as e:
+                logger.warning(f'Replica {alias} is unavailable: {e}')
+                lag = float('inf')
+            self.lags[alias] = (time.monotonic(), lag)
+        return lag
+
+    def choose_replica(self):
+        """Random replica within the allowed lag, None falls back to the primary."""
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self.lag(alias) <= settings.DATABASE_REPLICA_MAX_LAG
+        ]
+        return random.choice(replicas) if replicas else None
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return self.choose_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+replica_router = ReplicaRouter()
@@ -1,18 +1,61 @@
-from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import ErrorDetail, ValidationError
+from rest_framework.settings import api_settings
 
-from core.enums import AccountStatusEnum
-from core.models import BankAccount
+from core.cache import account_status_cache
+from core.enums import AccountStatusEnum, BankAccountOperationsEnum, LedgerOperationEnum
+from core.mixins import ValuesRepresentationMixin
+from core.money import DECIMAL_PLACES, MAX_BALANCE, MAX_DIGITS, SMALLEST_AMOUNT, format_minor, parse_minor, to_minor
+from core.models import (
+    AccountLedgerEntry,
+    AccountReservation,
+    AccountRollup,
+    AccountSlot,
+    BankAccount,
+    OutboxEvent,
+    PendingSettlement
+)
+
+ACCOUNT_CLOSED_MESSAGE = "You can't do anything with this account, because its status is `CLOSE`"
+NOT_ENOUGH_MONEY_MESSAGE = "Don't have enough money for this operation"
+BALANCE_LIMIT_MESSAGE = 'The balance would exceed its limit'
+ACCOUNT_NOT_FOUND_MESSAGE = 'Account not found'
+RESERVATION_NOT_FOUND_MESSAGE = 'Reservation not found'
+RESERVATIONS_DISABLED_MESSAGE = '`hold_seconds` needs hold reservations enabled'
+
+
+class MoneyField(serializers.DecimalField):
+    """Amount of integer minor units (see `core.money`), a decimal string in the API.
+    Input with more than `ACCOUNT_CURRENCY_DECIMAL_PLACES` decimal places is rejected,
+    `min_value` is a decimal amount too.
+    """
+    def __init__(self, min_value=None, **kwargs):
+        kwargs.setdefault('max_digits', MAX_DIGITS)
+        kwargs.setdefault('decimal_places', DECIMAL_PLACES)
+        super(MoneyField, self).__init__(**kwargs)
+        self.min_minor = None if min_value is None else to_minor(min_value)
+        self.min_value_text = None if min_value is None else format_minor(self.min_minor)
+
+    def to_internal_value(self, data) -> int:
+        # plain non-negative decimal strings are parsed by integer arithmetic
+        minor = parse_minor(data) if isinstance(data, str) else None
+        if minor is None:
+            minor = to_minor(super(MoneyField, self).to_internal_value(data))
+        if self.min_minor is not None and minor < self.min_minor:
+            self.fail('min_value', min_value=self.min_value_text)
+        return minor
+
+    def to_representation(self, value) -> str:
+        return format_minor(value)
 
 
 # TODO: may be it's not necessary
-class BankAccountForListSerializer(serializers.ModelSerializer):
+class BankAccountForListSerializer(ValuesRepresentationMixin, serializers.ModelSerializer):
     """BankAccount serializer for List representation"""
-    balance = serializers.DecimalField(
-        max_digits=8,
-        decimal_places=2,
-        read_only=True
-    )
+    balance = MoneyField(read_only=True)
 
     def get_balance(self, obj):
         if obj.hold > 0:
@@ -27,25 +70,33 @@ class BankAccountForListSerializer(serializers.ModelSerializer):
 class BankAccountValidateStatusSerializer(serializers.Serializer):
     def validate(self, attrs):
         if self.instance.status == AccountStatusEnum.CLOSE.value:
-            raise ValidationError("You can't do anything with this account, because its status is `CLOSE`")
+            raise ValidationError(ACCOUNT_CLOSED_MESSAGE)
         return super(BankAccountValidateStatusSerializer, self).validate(attrs)
 
 
 class BankAccountForAddSerializer(BankAccountValidateStatusSerializer):
     """BankAccount serializer for `add` action."""
-    add_value = serializers.DecimalField(
-        max_digits=8,
-        decimal_places=2,
-        min_value=0.01,
+    add_value = MoneyField(
+        min_value=SMALLEST_AMOUNT,
         required=True,
         write_only=True,
         help_text='The value, that want to add to the balance'
     )
 
     def update(self, instance, validated_data):
-        """Updating instance balance."""
-        instance.balance += validated_data['add_value']
-        instance.save()
+        """Updating instance balance, a slot of hot account.
+        The balance is changed in the database only, `instance` is not refreshed.
+        """
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            added = AccountLedgerEntry.objects.append_add(instance.id, validated_data['add_value'])
+        elif instance.hot_slots:
+            added = AccountSlot.objects.add(instance.id, instance.hot_slots, validated_data['add_value'])
+        else:
+            added = BankAccount.objects.add_balance(instance.id, validated_data['add_value'])
+        if not added:
+            if BankAccount.objects.filter(id=instance.id, status=AccountStatusEnum.OPEN.value).exists():
+                raise ValidationError(BALANCE_LIMIT_MESSAGE)
+            raise ValidationError(ACCOUNT_CLOSED_MESSAGE)
         return instance
 
     def create(self, validated_data):
@@ -54,28 +105,195 @@ class BankAccountForAddSerializer(BankAccountValidateStatusSerializer):
 
 
 class BankAccountForSubtractSerializer(BankAccountValidateStatusSerializer):
-    """BankAccount serializer for `subtract` action."""
-    sub_value = serializers.DecimalField(
-        max_digits=8,
-        decimal_places=2,
-        min_value=0.01,
+    """BankAccount serializer for `subtract` action. In reservation mode the
+    representation holds the created reservation.
+    """
+    sub_value = MoneyField(
+        min_value=SMALLEST_AMOUNT,
         required=True,
         write_only=True,
         help_text='The value, you want to subtract from the balance'
     )
+    hold_seconds = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.ACCOUNT_RESERVATION_MAX_SECONDS,
+        required=False,
+        write_only=True,
+        help_text='Keep the hold for capture or release, released after this many seconds'
+    )
+    reservation = None
 
     def update(self, instance, validated_data):
-        """Updating instance hold."""
-        instance.hold += validated_data
-        instance.save()
+        """Updating instance hold.
+        `validate` checks the loaded instance, the conditional UPDATE
+        re-checks status and balance against the current record
+        (hot account: against the locked record and its slots).
+        """
+        hot = bool(instance.hot_slots)
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            held = AccountLedgerEntry.objects.append_hold(instance.id, validated_data['sub_value'])
+        elif settings.ACCOUNT_RESERVATIONS_ENABLED:
+            self.reservation = AccountReservation.objects.reserve(
+                instance.id,
+                validated_data['sub_value'],
+                hold_seconds=validated_data.get('hold_seconds'),
+                hot=hot
+            )
+            held = self.reservation is not None
+        else:
+            held = BankAccount.objects.add_hold(instance.id, validated_data['sub_value'], hot=hot)
+        if not held:
+            raise ValidationError(NOT_ENOUGH_MONEY_MESSAGE)
         return instance
 
     def validate(self, attrs):
         attrs = super(BankAccountForSubtractSerializer, self).validate(attrs)
-        if self.instance.balance < self.instance.hold + attrs['sub_value']:
-            raise ValidationError("Don't have enough money for this operation")
+        if 'hold_seconds' in attrs and (settings.ACCOUNT_LEDGER_ENABLED or not settings.ACCOUNT_RESERVATIONS_ENABLED):
+            raise ValidationError(RESERVATIONS_DISABLED_MESSAGE)
+        balance, hold = self.instance.current_state()
+        if balance < hold + attrs['sub_value']:
+            raise ValidationError(NOT_ENOUGH_MONEY_MESSAGE)
         return attrs
 
+    def to_representation(self, instance):
+        data = super(BankAccountForSubtractSerializer, self).to_representation(instance)
+        if self.reservation is not None:
+            data['reservation'] = {
+                'id': self.reservation.id,
+                'amount': format_minor(self.reservation.amount),
+                'expires_at': self.reservation.expires_at.isoformat(),
+                'capture_on_expiry': self.reservation.capture_on_expiry
+            }
+        return data
+
 
 class BankAccountForStatusSerializer(BankAccountForListSerializer):
-    pass
+    """BankAccount serializer for `status` action. Reads the actual state,
+    which in ledger mode is the latest snapshot plus the ledger tail.
+    """
+    def to_representation(self, instance):
+        instance.balance, instance.hold = instance.current_state()
+        return super(BankAccountForStatusSerializer, self).to_representation(instance)
+
+
+class BankAccountBatchSerializer(serializers.ListSerializer):
+    """List serializer for `batch` action. Applies all items in one transaction."""
+    operations = {
+        'add': BankAccountOperationsEnum.ADD,
+        'subtract': BankAccountOperationsEnum.SUB
+    }
+
+    def to_internal_value(self, data):
+        """The size limit is checked before any item is validated."""
+        if isinstance(data, list) and len(data) > settings.ACCOUNT_BATCH_MAX_ITEMS:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f'Ensure this list has no more than {settings.ACCOUNT_BATCH_MAX_ITEMS} items'
+            ]}, code='max_length')
+        return super(BankAccountBatchSerializer, self).to_internal_value(data)
+
+    @staticmethod
+    def item_result(operation: BankAccountOperationsEnum, error: str = None) -> dict:
+        """Item result in the view response envelope."""
+        if error is None:
+            return {'status': status.HTTP_200_OK, 'result': True, 'addition': operation.value, 'description': {}}
+        return {
+            'status': status.HTTP_400_BAD_REQUEST,
+            'result': False,
+            'addition': operation.value,
+            'description': {api_settings.NON_FIELD_ERRORS_KEY: [ErrorDetail(error, code='invalid')]}
+        }
+
+    def apply(self, account: BankAccount, item: dict, state: list) -> str:
+        """Apply item to the `[balance, hold]` state of locked account, return error message or None."""
+        if account is None:
+            return ACCOUNT_NOT_FOUND_MESSAGE
+        if account.status == AccountStatusEnum.CLOSE.value:
+            return ACCOUNT_CLOSED_MESSAGE
+        if item['op'] == 'add':
+            if state[0] > MAX_BALANCE - item['value']:
+                return BALANCE_LIMIT_MESSAGE
+            state[0] += item['value']
+        elif state[0] < state[1] + item['value']:
+            return NOT_ENOUGH_MONEY_MESSAGE
+        else:
+            state[1] += item['value']
+        return None
+
+    def create(self, validated_data):
+        """Lock affected accounts by one `SELECT ... FOR UPDATE` in primary key order,
+        apply items in the request order and write all changes in bulk.
+        Slots of hot accounts are counted in the balance and left as they are,
+        the record gets the rest. In reservation mode every subtract creates
+        a reservation due for capture. Return item results in the request order.
+        """
+        ledger = settings.ACCOUNT_LEDGER_ENABLED
+        reservations = not ledger and settings.ACCOUNT_RESERVATIONS_ENABLED
+        ids = sorted({item['id'] for item in validated_data})
+        results = []
+        with atomic():
+            accounts = {
+                account.id: account
+                for account in BankAccount.objects.select_for_update().filter(id__in=ids).order_by('id')
+            }
+            slots = {} if ledger else AccountSlot.objects.balances(
+                [pk for pk, account in accounts.items() if account.hot_slots]
+            )
+            states = {
+                pk: list(account.current_state() if ledger else (account.balance + slots.get(pk, 0), account.hold))
+                for pk, account in accounts.items()
+            }
+            entries, events = [], []
+            for item in validated_data:
+                error = self.apply(accounts.get(item['id']), item, states.get(item['id']))
+                results.append(self.item_result(self.operations[item['op']], error))
+                if error is None:
+                    operation = LedgerOperationEnum.ADD if item['op'] == 'add' else LedgerOperationEnum.HOLD
+                    events.append((operation, item['id'], item['value']))
+                    if ledger:
+                        entries.append(AccountLedgerEntry(
+                            account_id=item['id'],
+                            operation=operation.value,
+                            amount=item['value']
+                        ))
+            OutboxEvent.objects.record(events)
+            AccountRollup.objects.apply({AccountStatusEnum.OPEN.value: (
+                0,
+                sum(value for operation, _, value in events if operation == LedgerOperationEnum.ADD),
+                sum(value for operation, _, value in events if operation == LedgerOperationEnum.HOLD)
+            )})
+            if ledger:
+                AccountLedgerEntry.objects.bulk_create(entries, batch_size=settings.ACCOUNT_BATCH_WRITE_SIZE)
+                changed_ids = {entry.account_id for entry in entries}
+            else:
+                changed = []
+                for pk, (balance, hold) in states.items():
+                    account = accounts[pk]
+                    balance -= slots.get(pk, 0)
+                    if (balance, hold) != (account.balance, account.hold):
+                        account.balance, account.hold = balance, hold
+                        changed.append(account)
+                BankAccount.objects.bulk_update(changed, ['balance', 'hold'], batch_size=settings.ACCOUNT_BATCH_WRITE_SIZE)
+                if reservations:
+                    now = timezone.now()
+                    AccountReservation.objects.bulk_create([
+                        AccountReservation(account_id=pk, amount=value, expires_at=now, capture_on_expiry=True)
+                        for operation, pk, value in events if operation == LedgerOperationEnum.HOLD
+                    ], batch_size=settings.ACCOUNT_BATCH_WRITE_SIZE)
+                else:
+                    PendingSettlement.objects.enqueue([account.id for account in changed if account.hold > 0])
+                changed_ids = {account.id for account in changed}
+            account_status_cache.invalidate(*changed_ids)
+        return results
+
+
+class BankAccountBatchItemSerializer(serializers.Serializer):
+    """Item of `batch` action: operation `op` with `value` on account `id`."""
+    id = serializers.UUIDField(required=True)
+    op = serializers.ChoiceField(choices=tuple(BankAccountBatchSerializer.operations), required=True)
+    value = MoneyField(
+        min_value=SMALLEST_AMOUNT,
+        required=True
+    )
+
+    class Meta:
+        list_serializer_class = BankAccountBatchSerializer
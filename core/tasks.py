@@ -1,24 +1,189 @@
 import logging
+from datetime import timedelta
 
+from celery import chord, shared_task
 from celery.task import PeriodicTask
 from celery.schedules import crontab
+from django.conf import settings
+from django.db import DatabaseError
 
-from .flows import SubtractHoldFlow
+from .locks import CacheLock
+from .flows import (
+    BulkSubtractHoldFlow,
+    IdempotencyPurgeFlow,
+    LedgerCompactionFlow,
+    LedgerSubtractHoldFlow,
+    QueuedSubtractHoldFlow,
+    ReservationCaptureFlow,
+    ReservationExpiryFlow,
+    RollupReconcileFlow,
+    SlotConsolidationFlow
+)
 
 logger = logging.getLogger(__name__)
 
 
+@shared_task(
+    bind=True,
+    max_retries=settings.SUBTRACT_HOLD_PARTITION_RETRIES,
+    default_retry_delay=settings.SUBTRACT_HOLD_PARTITION_RETRY_DELAY
+)
+def settle_hold_partition(self, lower, upper):
+    """Settle holds in one `[lower, upper)` UUID key range.
+    Safe to retry: settled records have zero hold and are not selected again.
+    """
+    logger.debug(f'Start Celery task: settle_hold_partition [{lower}, {upper})')
+    try:
+        report = BulkSubtractHoldFlow(lower=lower, upper=upper).run()
+    except DatabaseError as e:
+        logger.warning(f'Retry partition [{lower}, {upper}) after error: {e}')
+        raise self.retry(exc=e)
+    return report.settled
+
+
+@shared_task
+def aggregate_settled_holds(counts, lock_token=None):
+    """Chord callback: total settled records of all partitions.
+    Releases the single-runner lock held by the run since the fan-out.
+    """
+    try:
+        total = sum(counts)
+        logger.debug(f'Finish partitioned settlement: settled {total} records in {len(counts)} partitions')
+        return total
+    finally:
+        release_settlement_lock(lock_token)
+
+
+@shared_task
+def release_settlement_lock(lock_token):
+    """Chord error callback: release the single-runner lock of a failed partitioned run."""
+    if lock_token:
+        CacheLock(SubtractHoldTask.lock_name, settings.SUBTRACT_HOLD_LOCK_TIMEOUT, token=lock_token).release()
+
+
 class SubtractHoldTask(PeriodicTask):
-    """Subtract hold from balance every 10 minutes."""
-    run_every = crontab(minute=10)
+    """Subtract hold from balance every `SUBTRACT_HOLD_INTERVAL` seconds (10 minutes by default).
+    With `SUBTRACT_HOLD_QUEUE_ENABLED` only the accounts queued since the last run
+    are settled, within the run budget. In reservation mode the due reservations
+    are captured. Otherwise the table is scanned, with
+    `SUBTRACT_HOLD_PARTITIONS` > 1 fanned out as a chord of `settle_hold_partition`
+    tasks over disjoint key ranges.
+    Runs hold a single-runner lock until they finish, a fanned out run until its
+    chord callback or error callback, and a run finding it taken is skipped. The
+    lock expires after `SUBTRACT_HOLD_LOCK_TIMEOUT` only if the holder dies. Runs
+    not started within the interval expire, so a busy worker does not pile them up.
+    """
+    run_every = timedelta(seconds=settings.SUBTRACT_HOLD_INTERVAL)
+    expires = settings.SUBTRACT_HOLD_INTERVAL
+    lock_name = 'subtract-hold'
 
     def run(self, *args, **kwargs):
         logger.debug('Start Celery task: SubtractHoldTask')
+        lock = CacheLock(self.lock_name, settings.SUBTRACT_HOLD_LOCK_TIMEOUT)
+        if not lock.acquire():
+            logger.debug('SubtractHoldTask is already running, skip.')
+            return
+        release = True
         try:
-            service = SubtractHoldFlow()
-            service.run()
+            partitions = settings.SUBTRACT_HOLD_PARTITIONS
+            if settings.ACCOUNT_LEDGER_ENABLED:
+                report = LedgerSubtractHoldFlow().run()
+                logger.debug(f'SubtractHoldTask {report}')
+            elif settings.ACCOUNT_RESERVATIONS_ENABLED:
+                report = ReservationCaptureFlow().run()
+                logger.debug(f'SubtractHoldTask {report}')
+            elif settings.SUBTRACT_HOLD_QUEUE_ENABLED:
+                report = QueuedSubtractHoldFlow().run()
+                logger.debug(f'SubtractHoldTask {report}')
+            elif partitions > 1:
+                header = [
+                    settle_hold_partition.s(lower, upper)
+                    for lower, upper in BulkSubtractHoldFlow.partitions(partitions)
+                ]
+                callback = aggregate_settled_holds.s(lock_token=lock.token)
+                chord(header)(callback.on_error(release_settlement_lock.si(lock.token)))
+                release = False
+            else:
+                service = BulkSubtractHoldFlow()
+                report = service.run()
+                logger.debug(f'SubtractHoldTask {report}')
         except BaseException as e:
             logger.error(f'Get unexpected error during celery task: {e}')
+        finally:
+            if release:
+                lock.release()
         logger.debug('Finish Celery task: SubtractHoldTask')
 
 
+class LedgerCompactionTask(PeriodicTask):
+    """Roll ledger entries into account snapshots (ledger mode only)."""
+    run_every = timedelta(seconds=settings.ACCOUNT_LEDGER_COMPACTION_INTERVAL)
+
+    def run(self, *args, **kwargs):
+        if not settings.ACCOUNT_LEDGER_ENABLED:
+            return
+        logger.debug('Start Celery task: LedgerCompactionTask')
+        try:
+            LedgerCompactionFlow().run()
+        except BaseException as e:
+            logger.error(f'Get unexpected error during celery task: {e}')
+        logger.debug('Finish Celery task: LedgerCompactionTask')
+
+
+class RollupReconcileTask(PeriodicTask):
+    """Check the account totals rollup against a full recomputation."""
+    run_every = timedelta(seconds=settings.ACCOUNT_ROLLUP_RECONCILE_INTERVAL)
+
+    def run(self, *args, **kwargs):
+        if not settings.ACCOUNT_ROLLUP_ENABLED:
+            return
+        logger.debug('Start Celery task: RollupReconcileTask')
+        try:
+            RollupReconcileFlow().run()
+        except BaseException as e:
+            logger.error(f'Get unexpected error during celery task: {e}')
+        logger.debug('Finish Celery task: RollupReconcileTask')
+
+
+class SlotConsolidationTask(PeriodicTask):
+    """Move the balance slots of hot accounts back to the account records."""
+    run_every = timedelta(seconds=settings.ACCOUNT_HOT_SLOTS_CONSOLIDATE_INTERVAL)
+
+    def run(self, *args, **kwargs):
+        if settings.ACCOUNT_LEDGER_ENABLED:
+            return
+        logger.debug('Start Celery task: SlotConsolidationTask')
+        try:
+            SlotConsolidationFlow().run()
+        except BaseException as e:
+            logger.error(f'Get unexpected error during celery task: {e}')
+        logger.debug('Finish Celery task: SlotConsolidationTask')
+
+
+class ReservationExpiryTask(PeriodicTask):
+    """Release expired hold reservations (reservation mode only)."""
+    run_every = timedelta(seconds=settings.ACCOUNT_RESERVATION_SWEEP_INTERVAL)
+
+    def run(self, *args, **kwargs):
+        if settings.ACCOUNT_LEDGER_ENABLED or not settings.ACCOUNT_RESERVATIONS_ENABLED:
+            return
+        logger.debug('Start Celery task: ReservationExpiryTask')
+        try:
+            report = ReservationExpiryFlow().run()
+            logger.debug(f'ReservationExpiryTask {report}')
+        except BaseException as e:
+            logger.error(f'Get unexpected error during celery task: {e}')
+        logger.debug('Finish Celery task: ReservationExpiryTask')
+
+
+class IdempotencyPurgeTask(PeriodicTask):
+    """Delete expired idempotency records every hour."""
+    run_every = crontab(minute=0)
+
+    def run(self, *args, **kwargs):
+        logger.debug('Start Celery task: IdempotencyPurgeTask')
+        try:
+            IdempotencyPurgeFlow().run()
+        except BaseException as e:
+            logger.error(f'Get unexpected error during celery task: {e}')
+        logger.debug('Finish Celery task: IdempotencyPurgeTask')
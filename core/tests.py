@@ -1,15 +1,69 @@
+import asyncio
+import importlib
+import io
 import json
+import os
+import random
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, OperationalError, connection
+from redis import ConnectionError as RedisConnectionError
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIRequestFactory
 
-from .enums import BankAccountOperationsEnum
+from .enums import BankAccountOperationsEnum, AccountStatusEnum
 from .views import BankAccountViewSet
-from .models import BankAccount
-from .flows import SubtractHoldFlow
+from .async_views import run_view
+from .cache import account_status_cache
+from .db import check_connections
+from .metrics import metrics
+from .money import MAX_BALANCE, SMALLEST_AMOUNT, format_minor, parse_minor, to_minor
+from .renderers import ORJSONRenderer
+from .transfer import read_rows
+from .routers import ReplicaRouter, read_from_replica, replica_router
+from .serializers import BankAccountBatchItemSerializer, BankAccountForListSerializer, BankAccountForStatusSerializer
+from .models import (
+    AccountLedgerEntry,
+    AccountReservation,
+    AccountRollup,
+    AccountSlot,
+    AccountSnapshot,
+    BankAccount,
+    IdempotencyRecord,
+    OutboxEvent,
+    PendingSettlement
+)
+from .flows import (
+    SubtractHoldFlow,
+    BulkSubtractHoldFlow,
+    IdempotencyPurgeFlow,
+    LedgerCompactionFlow,
+    AccountExportFlow,
+    AccountImportFlow,
+    LedgerSubtractHoldFlow,
+    OutboxRelayFlow,
+    QueuedSubtractHoldFlow,
+    ReservationCaptureFlow,
+    ReservationExpiryFlow,
+    RollupReconcileFlow,
+    SlotConsolidationFlow
+)
+from .locks import CacheLock
+from .throttling import SEMAPHORE_SCRIPT, TOKEN_BUCKET_SCRIPT, rate_limiter
+from .tasks import settle_hold_partition, SubtractHoldTask
+from .management.commands.benchmark_suite import Command as BenchmarkSuiteCommand
+from BankSubscriberAccount.celery import app as celery_app
 
 
 class BankAccountViewSetTestCase(APITestCase):
@@ -29,26 +83,26 @@ class BankAccountViewSetTestCase(APITestCase):
         """Setting up the test data and stuff: `factory`, `view`, `uris`"""
         self.model_1 = BankAccount.objects.create(
             owner_name='Петров Иван Сергеевич',
-            balance=1700,
-            hold=300,
+            balance=170000,
+            hold=30000,
             status='OPEN'
         )
         self.model_2 = BankAccount.objects.create(
             owner_name='Kazitsky Jason',
-            balance=200,
-            hold=200,
+            balance=20000,
+            hold=20000,
             status='OPEN'
         )
         self.model_3 = BankAccount.objects.create(
             owner_name='Пархоментко Антон Александрович',
-            balance=10,
-            hold=300,
+            balance=1000,
+            hold=30000,
             status='OPEN'
         )
         self.model_4 = BankAccount.objects.create(
             owner_name='Петечкин Петр Измаилович',
-            balance=9999,
-            hold=1,
+            balance=999900,
+            hold=100,
             status='CLOSE'
         )
         self.factory = APIRequestFactory()
@@ -226,6 +280,648 @@ class BankAccountViewSetTestCase(APITestCase):
             response.data,
             f'Excepted {response_true}, got {response.data} instead'
         )
+        self.model_1.refresh_from_db()
+        self.assertEqual((180000, 30000), (self.model_1.balance, self.model_1.hold))
+
+    def test_correct_subtract(self):
+        """Testing correct `subtract` operation adds the value to hold"""
+        model_uuid = self.model_1.id
+        uri = self.get_uri('subtract', model_uuid)
+
+        self.view = BankAccountViewSet.as_view(
+            {
+                'post': 'subtract'
+            }
+        )
+        response = self.factory_post(uri, {self.sub_value_key: '150.50'}, model_uuid)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.model_1.refresh_from_db()
+        self.assertEqual((170000, 45050), (self.model_1.balance, self.model_1.hold))
+
+    def test_changed_after_validation_sub(self):
+        """Testing `subtract` rejected by the conditional update after the record changed"""
+        model_uuid = self.model_2.id
+        BankAccount.objects.filter(id=model_uuid).update(balance=100000)
+        uri = self.get_uri('subtract', model_uuid)
+
+        self.view = BankAccountViewSet.as_view(
+            {
+                'post': 'subtract'
+            }
+        )
+        with mock.patch.object(BankAccountViewSet, 'get_object', return_value=BankAccount(
+            id=model_uuid, balance=100000, hold=0, status=AccountStatusEnum.OPEN.value
+        )):
+            response = self.factory_post(uri, {self.sub_value_key: 900}, model_uuid)
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual(
+            {'non_field_errors': [ErrorDetail(string="Don't have enough money for this operation", code='invalid')]},
+            response.data['description']
+        )
+        self.model_2.refresh_from_db()
+        self.assertEqual((100000, 20000), (self.model_2.balance, self.model_2.hold))
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class BankAccountConcurrencyTestCase(TransactionTestCase):
+    """Stress testing parallel `add` and `subtract` on one account."""
+    operations = 2000
+
+    workers = 16
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=0,
+            hold=0,
+            status='OPEN'
+        )
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data: dict) -> int:
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{self.account.id}/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        return view(request, pk=self.account.id).status_code
+
+    def run_operations(self, operations: list) -> list:
+        try:
+            return [(action_name, self.post(action_name, data)) for action_name, data in operations]
+        finally:
+            connection.close()
+
+    def test_parallel_add_subtract(self):
+        """Testing final balance and hold are exact after parallel requests"""
+        operations = [('add', {'add_value': 1}), ('subtract', {'sub_value': 1})] * (self.operations // 2)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = [
+                result
+                for results in executor.map(
+                    self.run_operations,
+                    [operations[i::self.workers] for i in range(self.workers)]
+                )
+                for result in results
+            ]
+
+        added = [code for action_name, code in results if action_name == 'add']
+        subtracted = [code for action_name, code in results if action_name == 'subtract']
+        self.account.refresh_from_db()
+        self.assertEqual([status.HTTP_200_OK] * len(added), added)
+        self.assertEqual(len(added) * 100, self.account.balance)
+        self.assertEqual(subtracted.count(status.HTTP_200_OK) * 100, self.account.hold)
+        self.assertLessEqual(self.account.hold, self.account.balance)
+
+
+class BankAccountBatchTestCase(TestCase):
+    """Testcase class for `batch` action."""
+
+    def setUp(self) -> None:
+        self.model_1 = BankAccount.objects.create(
+            owner_name='Петров Иван Сергеевич',
+            balance=170000,
+            hold=30000,
+            status='OPEN'
+        )
+        self.model_2 = BankAccount.objects.create(
+            owner_name='Петечкин Петр Измаилович',
+            balance=999900,
+            hold=100,
+            status='CLOSE'
+        )
+        self.factory = APIRequestFactory()
+        self.view = BankAccountViewSet.as_view({'post': 'batch'})
+
+    def post(self, data):
+        request = self.factory.post('/account/batch/', data=json.dumps(data), content_type='application/json')
+        return self.view(request)
+
+    def test_batch(self):
+        """Testing items applied in order with per-item results"""
+        response = self.post([
+            {'id': str(self.model_1.id), 'op': 'add', 'value': 100},
+            {'id': str(self.model_1.id), 'op': 'subtract', 'value': 1500},
+            {'id': str(self.model_1.id), 'op': 'subtract', 'value': 1},
+            {'id': str(self.model_2.id), 'op': 'add', 'value': 1},
+            {'id': str(uuid.uuid4()), 'op': 'add', 'value': 1},
+        ])
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertFalse(response.data['result'])
+        self.assertEqual(BankAccountOperationsEnum.BATCH.value, response.data['addition'])
+        self.assertEqual(
+            [
+                (True, BankAccountOperationsEnum.ADD.value, {}),
+                (True, BankAccountOperationsEnum.SUB.value, {}),
+                (False, BankAccountOperationsEnum.SUB.value, "Don't have enough money for this operation"),
+                (False, BankAccountOperationsEnum.ADD.value, "You can't do anything with this account, because its status is `CLOSE`"),
+                (False, BankAccountOperationsEnum.ADD.value, 'Account not found'),
+            ],
+            [
+                (item['result'], item['addition'], item['description'].get('non_field_errors', [{}])[0])
+                for item in response.data['description']
+            ]
+        )
+        self.model_1.refresh_from_db()
+        self.model_2.refresh_from_db()
+        self.assertEqual((180000, 180000), (self.model_1.balance, self.model_1.hold))
+        self.assertEqual((999900, 100), (self.model_2.balance, self.model_2.hold))
+
+    def test_batch_validation(self):
+        """Testing invalid items reject the whole batch"""
+        response = self.post([
+            {'id': str(self.model_1.id), 'op': 'add', 'value': 100},
+            {'id': str(self.model_1.id), 'op': 'multiply', 'value': 2},
+        ])
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual({}, response.data['description'][0])
+        self.assertIn('op', response.data['description'][1])
+        self.model_1.refresh_from_db()
+        self.assertEqual(170000, self.model_1.balance)
+
+    @override_settings(ACCOUNT_BATCH_MAX_ITEMS=1)
+    def test_batch_max_items(self):
+        """Testing batch size limit"""
+        with mock.patch.object(BankAccountBatchItemSerializer, 'run_validation') as item_validation:
+            response = self.post([{'id': str(self.model_1.id), 'op': 'add', 'value': 1}] * 2)
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('no more than 1 items', str(response.data['description']))
+        item_validation.assert_not_called()
+
+    @override_settings(ACCOUNT_LEDGER_ENABLED=True)
+    def test_batch_ledger(self):
+        """Testing batch appends ledger entries in ledger mode"""
+        response = self.post([
+            {'id': str(self.model_1.id), 'op': 'add', 'value': 100},
+            {'id': str(self.model_1.id), 'op': 'subtract', 'value': 1500},
+        ])
+
+        self.assertTrue(response.data['result'])
+        self.assertEqual(2, AccountLedgerEntry.objects.count())
+        self.assertEqual((180000, 180000), self.model_1.current_state())
+
+
+class BankAccountListTestCase(TestCase):
+    """Testcase class for cursor paginated and streamed `list` action."""
+
+    def setUp(self) -> None:
+        for i in range(25):
+            BankAccount.objects.create(owner_name=f'Owner {i}', balance=i, hold=0, status='OPEN')
+        self.factory = APIRequestFactory()
+        self.view = BankAccountViewSet.as_view({'get': 'list'})
+
+    def get(self, uri: str):
+        return self.view(self.factory.get(uri))
+
+    def test_cursor_pages(self):
+        """Testing pages walk all accounts in primary key order without repeats"""
+        ids = []
+        uri = '/account/?page_size=10'
+        pages = 0
+        while uri:
+            response = self.get(uri)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            ids.extend(item['id'] for item in response.data['results'])
+            uri = response.data['next']
+            pages += 1
+
+        self.assertEqual(3, pages)
+        self.assertEqual(sorted(str(pk) for pk in BankAccount.objects.values_list('id', flat=True)), ids)
+
+    def test_stream(self):
+        """Testing NDJSON stream holds every account once"""
+        response = self.get('/account/?stream=true')
+
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        accounts = [json.loads(line) for line in lines]
+        self.assertEqual(25, len(accounts))
+        self.assertEqual(
+            {'id', 'owner_name', 'balance', 'status'},
+            set(accounts[0])
+        )
+        self.assertEqual(
+            sorted(str(pk) for pk in BankAccount.objects.values_list('id', flat=True)),
+            [account['id'] for account in accounts]
+        )
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AccountStatusCacheTestCase(TestCase):
+    """Testcase class for read-through `status` cache, locmem cache stands in for Redis."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=20000,
+            hold=5000,
+            status='OPEN'
+        )
+        self.factory = APIRequestFactory()
+        account_status_cache.cache.clear()
+        metrics.series.clear()
+
+    def lookups(self, result: str) -> int:
+        return metrics.series.get(('cache', (account_status_cache.metrics_name, result)), {}).get('count', 0)
+
+    def get_status(self, pk: str = None):
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        pk = pk or str(self.account.id)
+        return view(self.factory.get(f'/account/{pk}/status/'), pk=pk).data
+
+    def post(self, action_name: str, data: dict):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{self.account.id}/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            return view(request, pk=str(self.account.id))
+
+    def test_pk_normalized(self):
+        """Testing the upper case id reads the payload invalidated by writes, invalid ids are 404"""
+        upper = str(self.account.id).upper()
+        self.assertEqual('200.00', self.get_status(upper)['description']['balance'])
+
+        self.post('add', {'add_value': 5})
+        self.assertEqual('205.00', self.get_status(upper)['description']['balance'])
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        response = view(self.factory.get('/account/not-a-uuid/status/'), pk='not-a-uuid')
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_read_through(self):
+        """Testing second read is served from cache without queries"""
+        first = self.get_status()
+        with self.assertNumQueries(0):
+            second = self.get_status()
+
+        self.assertEqual(first, second)
+        self.assertEqual((1, 1), (self.lookups('hit'), self.lookups('miss')))
+        self.assertIn('bank_cache_lookups_total{cache="account_status",result="hit",', metrics.render())
+
+    def test_invalidated_by_writes(self):
+        """Testing add, subtract and settlement invalidate the cached payload"""
+        self.get_status()
+
+        self.post('add', {'add_value': 100})
+        self.assertEqual('300.00', self.get_status()['description']['balance'])
+
+        self.post('subtract', {'sub_value': 25})
+        self.get_status()
+        with self.captureOnCommitCallbacks(execute=True):
+            BulkSubtractHoldFlow().run()
+        self.assertEqual('225.00', self.get_status()['description']['balance'])
+        self.assertEqual(0, self.lookups('hit'))
+
+    def test_stale_read_not_served(self):
+        """Testing payload read before a write is not served after it"""
+        payload, version = account_status_cache.get(self.account.id)
+        account_status_cache.invalidate_now([self.account.id])
+        account_status_cache.set(self.account.id, {'balance': 'stale'}, version)
+
+        self.assertEqual(None, account_status_cache.get(self.account.id)[0])
+
+    def test_expired_version_not_reused(self):
+        """Testing a version key recreated after expiry does not match payloads of the expired one"""
+        account_status_cache.invalidate_now([self.account.id])
+        _, version = account_status_cache.get(self.account.id)
+        account_status_cache.set(self.account.id, {'balance': 'stale'}, version)
+        account_status_cache.cache.delete(account_status_cache.version_key(self.account.id))
+        account_status_cache.invalidate_now([self.account.id])
+
+        self.assertEqual(None, account_status_cache.get(self.account.id)[0])
+
+
+class ValuesRepresentationTestCase(TestCase):
+    """Testcase class for fast serialization path: output must match the serializers."""
+
+    def setUp(self) -> None:
+        BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=170000, hold=30000, status='OPEN')
+        BankAccount.objects.create(owner_name='Line\u2028separator "quoted"', balance=-50, hold=0, status='CLOSE')
+        BankAccount.objects.create(owner_name='Kazitsky Jason', balance=999999, hold=100, status='OPEN')
+        self.factory = APIRequestFactory()
+
+    def test_represent(self):
+        """Testing `.values()` rows render to the same bytes as serializer data"""
+        renderer = JSONRenderer()
+        for serializer_class in (BankAccountForListSerializer, BankAccountForStatusSerializer):
+            rows = BankAccount.objects.order_by('id').values(*serializer_class.value_fields())
+            for instance, row in zip(BankAccount.objects.order_by('id'), rows):
+                self.assertEqual(
+                    renderer.render(serializer_class(instance).data),
+                    renderer.render(serializer_class.represent(row))
+                )
+
+    def test_list_response(self):
+        """Testing list response renders the same as the serializer based list"""
+        view = BankAccountViewSet.as_view({'get': 'list'})
+        response = view(self.factory.get('/account/'))
+        expected = BankAccountForListSerializer(BankAccount.objects.order_by('id'), many=True).data
+
+        self.assertEqual(JSONRenderer().render(expected), JSONRenderer().render(response.data['results']))
+
+    def test_status_without_validation(self):
+        """Testing status payload is read without loading the model instance"""
+        account = BankAccount.objects.get(owner_name='Kazitsky Jason')
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        with mock.patch.object(BankAccountViewSet, 'get_object') as get_object:
+            response = view(self.factory.get(f'/account/{account.id}/status/'), pk=str(account.id))
+
+        get_object.assert_not_called()
+        self.assertEqual(dict(BankAccountForStatusSerializer(account).data), response.data['description'])
+        self.assertEqual(status.HTTP_404_NOT_FOUND, view(self.factory.get('/'), pk='not-uuid').status_code)
+
+    def test_orjson_renderer(self):
+        """Testing orjson renderer output is byte-identical to JSONRenderer"""
+        view = BankAccountViewSet.as_view({'get': 'list'})
+        data = view(self.factory.get('/account/')).data
+
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+        self.assertEqual(b'', ORJSONRenderer().render(None))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    ACCOUNT_IDEMPOTENCY_CACHE_ALIAS=''
+)
+class IdempotencyTestCase(TestCase):
+    """Testcase class for `Idempotency-Key` header of mutation actions."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=20000,
+            hold=0,
+            status='OPEN'
+        )
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data: dict, key: str):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{self.account.id}/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json',
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+        return view(request, pk=str(self.account.id))
+
+    def test_replay(self):
+        """Testing duplicate requests replay the first result without touching the account"""
+        first = self.post('add', {'add_value': 100}, 'key-1')
+        with self.assertNumQueries(1):
+            second = self.post('add', {'add_value': 100}, 'key-1')
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.status_code, second.status_code)
+        self.assertEqual('true', second['Idempotent-Replayed'])
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.account.refresh_from_db()
+        self.assertEqual(30000, self.account.balance)
+
+    def test_replay_rejection(self):
+        """Testing rejected result is replayed even after the account changed"""
+        first = self.post('subtract', {'sub_value': 500}, 'key-2')
+        BankAccount.objects.filter(id=self.account.id).update(balance=100000)
+        second = self.post('subtract', {'sub_value': 500}, 'key-2')
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, second.status_code)
+        self.assertEqual(first.data, second.data)
+        self.account.refresh_from_db()
+        self.assertEqual(0, self.account.hold)
+
+    def test_key_reused_with_other_request(self):
+        """Testing key reuse with a different body is rejected"""
+        self.post('add', {'add_value': 100}, 'key-3')
+
+        self.assertEqual(status.HTTP_422_UNPROCESSABLE_ENTITY, self.post('add', {'add_value': 1}, 'key-3').status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post('add', {'add_value': 1}, 'k' * 256).status_code)
+
+    @override_settings(ACCOUNT_IDEMPOTENCY_CACHE_ALIAS='default')
+    def test_cache_front(self):
+        """Testing stored results are replayed from cache"""
+        self.post('add', {'add_value': 100}, 'key-4')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('add', {'add_value': 100}, 'key-5')
+        with self.assertNumQueries(0):
+            response = self.post('add', {'add_value': 100}, 'key-5')
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_purge(self):
+        """Testing expired records are purged"""
+        self.post('add', {'add_value': 100}, 'old')
+        self.post('add', {'add_value': 100}, 'new')
+        IdempotencyRecord.objects.filter(key='old').update(
+            created_at=timezone.now() - timedelta(seconds=IdempotencyPurgeFlow.ttl + 1)
+        )
+
+        self.assertEqual(1, IdempotencyPurgeFlow().run())
+        self.assertEqual(['new'], list(IdempotencyRecord.objects.values_list('key', flat=True)))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AsyncAccountApiTestCase(TransactionTestCase):
+    """Testcase class for async account endpoints. Actions run in database pool
+    threads, so the data is committed (TransactionTestCase).
+    """
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=20000,
+            hold=0,
+            status='OPEN'
+        )
+        self.client = AsyncClient()
+        self.base_uri = f'/api/async/account/{self.account.id}'
+
+    async def test_actions(self):
+        """Testing add, subtract, status and list through the async endpoints"""
+        add = await self.client.post(f'{self.base_uri}/add/', {'add_value': 100}, content_type='application/json')
+        sub = await self.client.post(f'{self.base_uri}/subtract/', {'sub_value': 50}, content_type='application/json')
+        account_status = await self.client.get(f'{self.base_uri}/status/')
+        accounts = await self.client.get('/api/async/account/')
+
+        self.assertEqual((status.HTTP_200_OK, status.HTTP_200_OK), (add.status_code, sub.status_code))
+        self.assertEqual('300.00', account_status.json()['description']['balance'])
+        self.assertEqual([str(self.account.id)], [item['id'] for item in accounts.json()['results']])
+
+    async def test_concurrent_requests(self):
+        """Testing concurrent requests are all served, in parallel through the middleware"""
+        responses = await asyncio.gather(*(self.client.get(f'{self.base_uri}/status/') for _ in range(20)))
+        self.assertEqual([status.HTTP_200_OK] * 20, [response.status_code for response in responses])
+
+        def slow_view(*args):
+            time.sleep(0.5)
+            return run_view(*args)
+
+        with mock.patch('core.async_views.run_view', slow_view):
+            started = time.monotonic()
+            responses = await asyncio.gather(*(self.client.get(f'{self.base_uri}/status/') for _ in range(4)))
+            seconds = time.monotonic() - started
+        self.assertEqual([status.HTTP_200_OK] * 4, [response.status_code for response in responses])
+        # 2 seconds and more if the requests are served one by one
+        self.assertLess(seconds, 1.5)
+
+    async def test_stream_not_available(self):
+        """Testing streaming list is rejected by the async endpoint"""
+        response = await self.client.get('/api/async/account/?stream=true')
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MetricsTestCase(APITestCase):
+    """Testcase class for request and flow metrics, locmem cache stands in for Redis."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=200,
+            hold=50,
+            status='OPEN'
+        )
+        metrics.series.clear()
+        metrics.cache.clear()
+
+    def test_request_metrics(self):
+        """Testing requests are counted per endpoint with their queries"""
+        for _ in range(2):
+            self.client.get(f'/api/account/{self.account.id}/status/')
+        response = self.client.get('/metrics')
+        labels = f'endpoint="account_viewset-status",process="{metrics.process}"'
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn(f'bank_http_request_duration_seconds_count{{{labels}}} 2', text)
+        self.assertIn(f'bank_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        queries = float(text.split(f'bank_http_request_db_queries_total{{{labels}}} ')[1].split()[0])
+        self.assertGreaterEqual(queries, 1)
+
+    @override_settings(ACCOUNT_EVENTS_ENABLED=False, ACCOUNT_ROLLUP_ENABLED=False)
+    def test_flow_metrics(self):
+        """Testing flow run is recorded with rows affected by its writes"""
+        BankAccount.objects.create(owner_name='Test Name', balance=100, hold=10, status='OPEN')
+        BulkSubtractHoldFlow().run()
+        labels = f'flow="BulkSubtractHoldFlow",process="{metrics.process}"'
+
+        text = metrics.render()
+        self.assertIn(f'bank_flow_run_duration_seconds_count{{{labels}}} 1', text)
+        self.assertIn(f'bank_flow_run_rows_total{{{labels}}} 2', text)
+
+    def test_queued_flow_metrics(self):
+        """Testing queued settlement run is recorded under its own flow name"""
+        BankAccount.objects.create(owner_name='Test Name', balance=100, hold=10, status='OPEN')
+        QueuedSubtractHoldFlow().run()
+        labels = f'flow="QueuedSubtractHoldFlow",process="{metrics.process}"'
+
+        self.assertIn(f'bank_flow_run_duration_seconds_count{{{labels}}} 1', metrics.render())
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=1e-9)
+    def test_slow_request_log(self):
+        """Testing slow request is logged with its SQL"""
+        with self.assertLogs('core.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/account/{self.account.id}/status/')
+
+        self.assertIn('account_viewset-status', logs.output[0])
+        self.assertIn('core_bankaccount', logs.output[0])
+        self.assertNotIn(self.account.id.hex, logs.output[0].replace('-', ''))
+
+
+class DatabaseConnectionTestCase(TransactionTestCase):
+    """Testcase class for the health check of persistent connections."""
+
+    @override_settings(DATABASE_CONN_HEALTH_CHECKS=True)
+    def test_unusable_connection_closed(self):
+        """Testing only unusable connection is closed"""
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'close') as close:
+            check_connections()
+            self.assertFalse(close.called)
+
+            with mock.patch.object(connection, 'is_usable', return_value=False):
+                check_connections()
+            self.assertTrue(close.called)
+
+    def test_disabled(self):
+        """Testing connections are not checked by default"""
+        connection.ensure_connection()
+        with mock.patch.object(connection, 'is_usable', return_value=False) as is_usable:
+            check_connections()
+
+        self.assertFalse(is_usable.called)
+        self.assertIsNotNone(connection.connection)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    DATABASE_REPLICAS=['replica_1']
+)
+class ReplicaRouterTestCase(TestCase):
+    """Testcase class for routing reads to replicas."""
+
+    def setUp(self) -> None:
+        ReplicaRouter.lags.clear()
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=10000, status='OPEN')
+        self.view = BankAccountViewSet.as_view({'get': 'status', 'post': 'add'})
+        self.factory = APIRequestFactory()
+
+    def tearDown(self) -> None:
+        ReplicaRouter.lags.clear()
+
+    @mock.patch.object(ReplicaRouter, 'measure_lag', return_value=0)
+    def test_reads_routed(self, measure_lag):
+        """Testing only reads inside `read_from_replica` go to the replica"""
+        self.assertIsNone(replica_router.db_for_read(BankAccount))
+        with read_from_replica(pk=self.account.id):
+            self.assertEqual('replica_1', replica_router.db_for_read(BankAccount))
+            self.assertEqual('default', replica_router.db_for_write(BankAccount))
+        with read_from_replica(sticky=True):
+            self.assertIsNone(replica_router.db_for_read(BankAccount))
+        self.assertFalse(replica_router.allow_migrate('replica_1', 'core'))
+
+    @mock.patch.object(ReplicaRouter, 'measure_lag', return_value=0)
+    def test_written_account_sticky(self, measure_lag):
+        """Testing an account written in the sticky window is read from the primary"""
+        with self.captureOnCommitCallbacks(execute=True):
+            account_status_cache.invalidate(self.account.id)
+        with read_from_replica(pk=self.account.id):
+            self.assertIsNone(replica_router.db_for_read(BankAccount))
+        with read_from_replica(pk=uuid.uuid4()):
+            self.assertEqual('replica_1', replica_router.db_for_read(BankAccount))
+
+    def test_lagging_replica(self):
+        """Testing lagging and unavailable replicas fall back to the primary"""
+        with mock.patch.object(ReplicaRouter, 'measure_lag', return_value=5), read_from_replica():
+            self.assertIsNone(replica_router.db_for_read(BankAccount))
+
+        ReplicaRouter.lags.clear()
+        with mock.patch.object(ReplicaRouter, 'measure_lag', side_effect=DatabaseError), read_from_replica():
+            self.assertIsNone(replica_router.db_for_read(BankAccount))
+
+    def test_sticky_cookie(self):
+        """Testing the client is read from the primary after its own write"""
+        request = self.factory.post(f'/account/{self.account.id}/add/', {'add_value': 10}, format='json')
+        response = self.view(request, pk=str(self.account.id))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertIn(BankAccountViewSet.sticky_cookie, response.cookies)
+
+        request = self.factory.get(f'/account/{self.account.id}/status/')
+        request.COOKIES[BankAccountViewSet.sticky_cookie] = '1'
+        with mock.patch.object(ReplicaRouter, 'measure_lag') as measure_lag:
+            response = self.view(request, pk=str(self.account.id))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual('110.00', response.data['description']['balance'])
+        self.assertFalse(measure_lag.called)
 
 
 class SubtractHoldFlowTestCase(TestCase):
@@ -234,6 +930,9 @@ class SubtractHoldFlowTestCase(TestCase):
                                'Expected balance, hold: {true_balance}, {true_hold} \n' \
                                'Got: {balance}, {hold} instead.'
 
+    def get_flow(self):
+        return SubtractHoldFlow()
+
     def setUp(self) -> None:
         self.model_1 = BankAccount.objects.create(
             owner_name='Петров Иван Сергеевич',
@@ -269,7 +968,7 @@ class SubtractHoldFlowTestCase(TestCase):
 
     def test_flow(self):
         """Testing flow"""
-        flow = SubtractHoldFlow()
+        flow = self.get_flow()
         flow.run()
 
         self.update_models()
@@ -318,3 +1017,1114 @@ class SubtractHoldFlowTestCase(TestCase):
             )
         )
 
+
+class BulkSubtractHoldFlowTestCase(SubtractHoldFlowTestCase):
+    """Testcase class for set-based settlement: same results as the per-row flow."""
+    chunk_size = 2
+
+    def get_flow(self):
+        return BulkSubtractHoldFlow(chunk_size=self.chunk_size)
+
+    def test_report(self):
+        """Testing settled records count and chunk timings"""
+        report = self.get_flow().run()
+
+        self.assertEqual(3, report.settled)
+        self.assertEqual([2, 1], [rows for rows, _ in report.chunks])
+        self.assertTrue(all(seconds >= 0 for _, seconds in report.chunks))
+
+    def test_same_as_per_row_flow(self):
+        """Testing bulk flow against per-row flow on the same records"""
+        for i in range(10):
+            BankAccount.objects.create(owner_name=f'Owner {i}', balance=i * 10, hold=i, status='OPEN')
+        initial = {a.id: (a.balance, a.hold, a.status) for a in BankAccount.objects.all()}
+
+        SubtractHoldFlow().run()
+        expected = {a.id: (a.balance, a.hold) for a in BankAccount.objects.all()}
+
+        for pk, (balance, hold, account_status) in initial.items():
+            BankAccount.objects.filter(id=pk).update(balance=balance, hold=hold, status=account_status)
+        self.get_flow().run()
+        got = {a.id: (a.balance, a.hold) for a in BankAccount.objects.all()}
+
+        self.assertEqual(expected, got)
+
+
+class QueuedSubtractHoldFlowTestCase(BulkSubtractHoldFlowTestCase):
+    """Testcase class for settlement of queued accounts: same results as the per-row flow."""
+
+    def get_flow(self):
+        return QueuedSubtractHoldFlow(chunk_size=self.chunk_size)
+
+    def setUp(self) -> None:
+        super(QueuedSubtractHoldFlowTestCase, self).setUp()
+        QueuedSubtractHoldFlow.seconds_per_row = None
+
+    def test_run_budget(self):
+        """Testing a run stops at the row budget and the rest stays queued"""
+        report = QueuedSubtractHoldFlow(chunk_size=10, max_rows=2).run()
+
+        self.assertEqual(2, report.settled)
+        self.assertEqual(1, PendingSettlement.objects.count())
+        self.assertEqual(1, BankAccount.objects.not_zero_hold().count())
+
+    def test_adaptive_chunk_size(self):
+        """Testing chunk size follows the measured time per row within the bounds"""
+        flow = QueuedSubtractHoldFlow(chunk_size=1000, chunk_seconds=0.5)
+        self.assertEqual(1000, flow.next_chunk_size())
+
+        for seconds_per_row, expected in ((0.001, 500), (1, flow.min_chunk_size), (1e-6, 1000)):
+            QueuedSubtractHoldFlow.seconds_per_row = seconds_per_row
+            self.assertEqual(expected, flow.next_chunk_size())
+
+        QueuedSubtractHoldFlow.seconds_per_row = None
+        flow.measure(100, 0.2)
+        flow.measure(100, 0.4)
+        self.assertAlmostEqual(0.003, QueuedSubtractHoldFlow.seconds_per_row)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_single_runner(self):
+        """Testing the task is skipped while another run holds the lock"""
+        with CacheLock(SubtractHoldTask.lock_name, 60) as acquired:
+            self.assertTrue(acquired)
+            self.assertFalse(CacheLock(SubtractHoldTask.lock_name, 60).acquire())
+            SubtractHoldTask().run()
+            self.assertEqual(3, BankAccount.objects.not_zero_hold().count())
+
+        SubtractHoldTask().run()
+        self.assertEqual(0, BankAccount.objects.not_zero_hold().count())
+
+    def test_only_queued_settled(self):
+        """Testing accounts out of the queue are not scanned and the queue is drained"""
+        BankAccount.objects.filter(id=self.model_1.id).update(hold=0)
+        PendingSettlement.objects.all().delete()
+        BankAccount.objects.filter(id=self.model_1.id).update(hold=300)
+        self.assertTrue(BankAccount.objects.add_hold(self.model_2.id, 0))
+
+        report = self.get_flow().run()
+        self.update_models()
+
+        self.assertEqual(1, report.settled)
+        self.assertEqual((0, 0), (self.model_2.balance, self.model_2.hold))
+        self.assertEqual(300, self.model_1.hold)
+        self.assertFalse(PendingSettlement.objects.exists())
+
+    def test_subtract_and_batch_enqueue(self):
+        """Testing subtract and batch subtract queue the account"""
+        PendingSettlement.objects.all().delete()
+        BankAccount.objects.add_hold(self.model_1.id, 100)
+        serializer = BankAccountBatchItemSerializer(
+            data=[
+                {'id': str(self.model_2.id), 'op': 'add', 'value': '100.00'},
+                {'id': str(self.model_2.id), 'op': 'subtract', 'value': '10.00'}
+            ],
+            many=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertEqual(
+            {self.model_1.id, self.model_2.id},
+            set(PendingSettlement.objects.values_list('account_id', flat=True))
+        )
+
+    def test_crash_mid_run(self):
+        """Testing a failed chunk stays queued and is settled exactly once by the next run"""
+        settle_chunk = QueuedSubtractHoldFlow.settle_chunk
+        calls = []
+
+        def crashing_settle_chunk(flow, qs):
+            calls.append(1)
+            rows = settle_chunk(flow, qs)
+            if len(calls) == 2:
+                raise OperationalError('worker lost')
+            return rows
+
+        with mock.patch.object(QueuedSubtractHoldFlow, 'settle_chunk', crashing_settle_chunk):
+            with self.assertRaises(OperationalError):
+                self.get_flow().run()
+        self.assertEqual(1, PendingSettlement.objects.count())
+
+        self.get_flow().run()
+        self.test_flow()
+        self.assertFalse(PendingSettlement.objects.exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PartitionedSubtractHoldTestCase(TestCase):
+    """Testcase class for partitioned settlement, Celery runs in eager mode."""
+
+    def setUp(self) -> None:
+        self.always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        for i in range(80):
+            BankAccount.objects.create(owner_name=f'Owner {i}', balance=100, hold=i % 5, status='OPEN')
+
+    def tearDown(self) -> None:
+        celery_app.conf.task_always_eager = self.always_eager
+
+    def test_partitions_disjoint(self):
+        """Testing partitions cover the key space without overlaps"""
+        partitions = BulkSubtractHoldFlow.partitions(8)
+
+        self.assertEqual(8, len(partitions))
+        self.assertIsNone(partitions[0][0])
+        self.assertIsNone(partitions[-1][1])
+        for (_, upper), (lower, _) in zip(partitions, partitions[1:]):
+            self.assertEqual(upper, lower)
+        counts = [
+            BulkSubtractHoldFlow(lower=lower, upper=upper).get_queryset().count()
+            for lower, upper in partitions
+        ]
+        self.assertEqual(BankAccount.objects.not_zero_hold().count(), sum(counts))
+
+    def test_chord(self):
+        """Testing fanned out settlement settles all records"""
+        with self.settings(SUBTRACT_HOLD_PARTITIONS=4, SUBTRACT_HOLD_QUEUE_ENABLED=False):
+            SubtractHoldTask().run()
+
+        self.assertFalse(BankAccount.objects.not_zero_hold().exists())
+        self.assertEqual(
+            sorted(100 - i % 5 for i in range(80)),
+            sorted(BankAccount.objects.values_list('balance', flat=True))
+        )
+
+    def test_lock_held_until_callback(self):
+        """Testing the lock of a fanned out run is released by the chord callback or its error callback"""
+        with self.settings(SUBTRACT_HOLD_PARTITIONS=4, SUBTRACT_HOLD_QUEUE_ENABLED=False):
+            for complete in (True, False):
+                with mock.patch('core.tasks.chord') as dispatched:
+                    SubtractHoldTask().run()
+                self.assertFalse(CacheLock(SubtractHoldTask.lock_name, 60).acquire())
+
+                callback = dispatched.return_value.call_args[0][0]
+                if complete:
+                    self.assertEqual(3, callback.apply(args=([1, 2],)).get())
+                else:
+                    celery_app.signature(callback.options['link_error'][0]).apply()
+                with CacheLock(SubtractHoldTask.lock_name, 60) as acquired:
+                    self.assertTrue(acquired)
+
+    def test_failed_partition_retried_alone(self):
+        """Testing a failed partition is retried without running other partitions"""
+        settle_chunk = BulkSubtractHoldFlow.settle_chunk
+        calls = []
+
+        def flaky_settle_chunk(flow, qs):
+            calls.append(flow.lower)
+            if len(calls) == 1:
+                raise OperationalError('connection lost')
+            return settle_chunk(flow, qs)
+
+        lower, upper = BulkSubtractHoldFlow.partitions(4)[1]
+        held = BankAccount.objects.not_zero_hold().count()
+        in_partition = BulkSubtractHoldFlow(lower=lower, upper=upper).get_queryset().count()
+        with mock.patch.object(BulkSubtractHoldFlow, 'settle_chunk', flaky_settle_chunk):
+            settle_hold_partition.apply(args=(lower, upper))
+
+        self.assertEqual([lower, lower], calls)
+        self.assertEqual(0, BulkSubtractHoldFlow(lower=lower, upper=upper).get_queryset().count())
+        self.assertEqual(held - in_partition, BankAccount.objects.not_zero_hold().count())
+
+
+@override_settings(ACCOUNT_LEDGER_ENABLED=True)
+class LedgerSubtractHoldFlowTestCase(SubtractHoldFlowTestCase):
+    """Testcase class for ledger mode settlement: same results as the per-row flow."""
+
+    def get_flow(self):
+        return LedgerSubtractHoldFlow()
+
+    def update_models(self):
+        """Read the derived state instead of the record fields."""
+        super(LedgerSubtractHoldFlowTestCase, self).update_models()
+        for model in (self.model_1, self.model_2, self.model_3, self.model_4):
+            model.balance, model.hold = model.current_state()
+
+
+@override_settings(ACCOUNT_LEDGER_ENABLED=True)
+class LedgerTestCase(TestCase):
+    """Testcase class for ledger mode operations and compaction."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(
+            owner_name='Kazitsky Jason',
+            balance=20000,
+            hold=5000,
+            status='OPEN'
+        )
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data: dict):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{self.account.id}/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        return view(request, pk=self.account.id)
+
+    def get_status(self):
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        request = self.factory.get(f'/account/{self.account.id}/status/')
+        return view(request, pk=self.account.id).data['description']
+
+    def test_operations_append_entries(self):
+        """Testing add/subtract append entries and leave the record untouched"""
+        self.post('add', {'add_value': 100})
+        self.post('subtract', {'sub_value': 30})
+
+        self.assertEqual(
+            [('ADD', 10000), ('HOLD', 3000)],
+            list(AccountLedgerEntry.objects.order_by('id').values_list('operation', 'amount'))
+        )
+        self.account.refresh_from_db()
+        self.assertEqual((20000, 5000), (self.account.balance, self.account.hold))
+        self.assertEqual((30000, 8000), self.account.current_state())
+        self.assertEqual('300.00', self.get_status()['balance'])
+
+    def test_subtract_checks_derived_balance(self):
+        """Testing `subtract` is rejected by the derived balance, not the record fields"""
+        self.post('add', {'add_value': 100})
+
+        self.assertEqual(status.HTTP_200_OK, self.post('subtract', {'sub_value': 250}).status_code)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.post('subtract', {'sub_value': 1}).status_code)
+        self.assertEqual((30000, 30000), self.account.current_state())
+
+    def test_compaction(self):
+        """Testing compaction snapshots the state and the tail starts after it"""
+        self.post('add', {'add_value': 100})
+        self.post('subtract', {'sub_value': 30})
+
+        self.assertEqual(1, LedgerCompactionFlow(lag=0).run())
+        self.assertEqual(0, LedgerCompactionFlow(lag=0).run())
+
+        snapshot = AccountSnapshot.objects.get(account=self.account)
+        self.assertEqual((30000, 8000), (snapshot.balance, snapshot.hold))
+        self.assertEqual(AccountLedgerEntry.objects.latest('id').id, snapshot.last_entry_id)
+        self.account.refresh_from_db()
+        self.assertEqual((30000, 8000), (self.account.balance, self.account.hold))
+
+        self.post('add', {'add_value': 1})
+        self.assertEqual((30100, 8000), self.account.current_state())
+
+    def test_compaction_interrupted(self):
+        """Testing a compaction failing after the first account leaves no snapshot behind the watermark"""
+        other = BankAccount.objects.create(owner_name='Test Name', balance=10000, status='OPEN')
+        self.post('subtract', {'sub_value': 30})
+        self.assertTrue(AccountLedgerEntry.objects.append_hold(other.id, 2000))
+        create, created = AccountSnapshot.objects.create, []
+
+        def create_once(**kwargs):
+            if created:
+                raise DatabaseError('Connection lost')
+            created.append(create(**kwargs))
+            return created[-1]
+
+        with mock.patch.object(AccountSnapshot.objects, 'create', side_effect=create_once):
+            with self.assertRaises(DatabaseError):
+                LedgerCompactionFlow(lag=0).run()
+        self.assertFalse(AccountSnapshot.objects.exists())
+
+        LedgerSubtractHoldFlow().run()
+        self.assertEqual((12000, 0), self.account.current_state())
+        self.assertEqual((8000, 0), BankAccount.objects.get(id=other.id).current_state())
+
+    def test_compaction_lag(self):
+        """Testing fresh entries are not compacted"""
+        self.post('add', {'add_value': 100})
+
+        self.assertEqual(0, LedgerCompactionFlow(lag=60).run())
+        self.assertFalse(AccountSnapshot.objects.exists())
+
+
+class StreamsStandIn(object):
+    """Local stand-in of the Redis Streams commands used by the relay."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.streams = {}
+        self.pending = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self.pending.append((name, fields))
+
+    def execute(self):
+        pending, self.pending = self.pending, []
+        if self.fail:
+            raise ConnectionError('Redis is unavailable')
+        for name, fields in pending:
+            self.streams.setdefault(name, []).append(fields)
+
+
+class OutboxTestCase(TestCase):
+    """Testcase class for the account change events outbox and relay."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=20000, status='OPEN')
+        self.other = BankAccount.objects.create(owner_name='Иванов Петр Сергеевич', balance=10000, status='OPEN')
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data, pk=None):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(f'/account/{action_name}/', data=json.dumps(data), content_type='application/json')
+        return view(request, pk=str(pk)) if pk else view(request)
+
+    def events(self) -> list:
+        return list(OutboxEvent.objects.order_by('id').values_list('account_id', 'operation', 'amount'))
+
+    def test_mutations_recorded(self):
+        """Testing add, subtract, batch and settlement write events in order"""
+        self.post('add', {'add_value': 50}, self.account.id)
+        self.post('subtract', {'sub_value': 30}, self.account.id)
+        self.post('subtract', {'sub_value': 1000}, self.account.id)
+        self.post('batch', [
+            {'id': str(self.other.id), 'op': 'subtract', 'value': 10},
+            {'id': str(self.other.id), 'op': 'subtract', 'value': 1000},
+        ])
+        QueuedSubtractHoldFlow().run()
+
+        self.assertEqual([
+            (self.account.id, 'ADD', 5000),
+            (self.account.id, 'HOLD', 3000),
+            (self.other.id, 'HOLD', 1000),
+            *sorted([(self.account.id, 'SETTLE', 3000), (self.other.id, 'SETTLE', 1000)]),
+        ], self.events())
+
+    def test_settlement_flows_recorded(self):
+        """Testing per-row and bulk settlement record the settled holds"""
+        BankAccount.objects.filter(id=self.account.id).update(hold=20)
+        SubtractHoldFlow().run()
+        BankAccount.objects.filter(id=self.other.id).update(hold=5)
+        BulkSubtractHoldFlow(chunk_size=1).run()
+
+        self.assertEqual([(self.account.id, 'SETTLE', 20), (self.other.id, 'SETTLE', 5)], self.events())
+
+    @override_settings(ACCOUNT_EVENTS_ENABLED=False)
+    def test_disabled(self):
+        """Testing nothing is recorded with events disabled"""
+        self.post('add', {'add_value': 50}, self.account.id)
+
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay(self):
+        """Testing the relay publishes in order, partitioned by account, and empties the outbox"""
+        for value in (1, 2, 3):
+            self.post('add', {'add_value': value}, self.account.id)
+            self.post('add', {'add_value': value}, self.other.id)
+        ids = list(OutboxEvent.objects.order_by('id').values_list('id', flat=True))
+        client = StreamsStandIn()
+
+        with override_settings(ACCOUNT_EVENTS_STREAM_PARTITIONS=4):
+            self.assertEqual(6, OutboxRelayFlow(client=client, batch_size=4).run())
+
+        self.assertFalse(OutboxEvent.objects.exists())
+        published = [fields for stream in client.streams.values() for fields in stream]
+        self.assertEqual(sorted(ids), sorted(fields['event_id'] for fields in published))
+        for account in (self.account, self.other):
+            published = {
+                name: [fields['amount'] for fields in stream if fields['account_id'] == str(account.id)]
+                for name, stream in client.streams.items()
+            }
+            with override_settings(ACCOUNT_EVENTS_STREAM_PARTITIONS=4):
+                name = OutboxRelayFlow.stream(account.id)
+            self.assertEqual(['1.00', '2.00', '3.00'], published.pop(name))
+            self.assertFalse(any(published.values()))
+
+    def test_relay_failure(self):
+        """Testing events stay in the outbox when publishing fails"""
+        self.post('add', {'add_value': 50}, self.account.id)
+
+        with self.assertRaises(ConnectionError):
+            OutboxRelayFlow(client=StreamsStandIn(fail=True)).run()
+
+        self.assertEqual(1, OutboxEvent.objects.count())
+
+
+class AccountTransferTestCase(TestCase):
+    """Testcase class for bulk import and export of accounts."""
+    csv_text = (
+        'id,owner_name,balance,hold,status\r\n'
+        'a0000000-0000-4000-8000-000000000001,"Петров, Иван",100.50,10,OPEN\r\n'
+        ',Иванов Петр,0,,CLOSE\r\n'
+    )
+
+    def import_text(self, text: str, file_format: str = 'csv', **kwargs) -> int:
+        return AccountImportFlow(read_rows(io.StringIO(text, newline=''), file_format), **kwargs).run()
+
+    def test_import(self):
+        """Testing imported fields, generated ids and settlement queue"""
+        self.assertEqual(2, self.import_text(self.csv_text, batch_size=1))
+
+        account = BankAccount.objects.get(id='a0000000-0000-4000-8000-000000000001')
+        self.assertEqual(('Петров, Иван', 10050, 1000, 'OPEN'),
+                         (account.owner_name, account.balance, account.hold, account.status))
+        self.assertTrue(BankAccount.objects.filter(owner_name='Иванов Петр', hold=0, status='CLOSE').exists())
+        self.assertEqual([account.id], list(PendingSettlement.objects.values_list('account_id', flat=True)))
+
+    def test_invalid_row(self):
+        """Testing an invalid row imports nothing and reports its line"""
+        for row, error in (
+            (',Name,1,0,LOCKED', 'status'),
+            (',Name,1,-1,OPEN', 'hold'),
+            (',Name,1.005,0,OPEN', 'balance'),
+            (',Name,10000000000000000,0,OPEN', 'balance'),
+            (',,1,0,OPEN', 'owner_name'),
+            ('bad-id,Name,1,0,OPEN', 'badly formed'),
+        ):
+            with self.assertRaisesMessage(ValidationError, 'Line 4') as raised:
+                self.import_text(self.csv_text + row, batch_size=1)
+            self.assertIn(error, raised.exception.messages[0])
+        self.assertFalse(BankAccount.objects.exists())
+
+    def test_round_trip(self):
+        """Testing exported accounts import back unchanged in both formats"""
+        self.import_text(self.csv_text)
+        expected = list(BankAccount.objects.order_by('id').values_list('id', 'owner_name', 'balance', 'hold', 'status'))
+
+        for file_format in ('csv', 'ndjson'):
+            output = io.StringIO()
+            self.assertEqual(2, AccountExportFlow(file_format, chunk_size=1).run(output))
+            BankAccount.objects.all().delete()
+            self.import_text(output.getvalue(), file_format)
+            got = list(BankAccount.objects.order_by('id').values_list('id', 'owner_name', 'balance', 'hold', 'status'))
+            self.assertEqual(expected, got)
+
+    def test_commands(self):
+        """Testing import and export management commands"""
+        path = f'/tmp/accounts-{uuid.uuid4()}.csv'
+        self.addCleanup(os.remove, path)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write(self.csv_text)
+        call_command('import_accounts', path, stdout=io.StringIO())
+        self.assertEqual(2, BankAccount.objects.count())
+        with self.assertRaisesMessage(Exception, 'already exists'):
+            call_command('import_accounts', path, stdout=io.StringIO())
+
+        call_command('export_accounts', path, '--format', 'ndjson', stdout=io.StringIO())
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(2, len(f.readlines()))
+
+    def test_api_admin_only(self):
+        """Testing import and export endpoints are admin only and stream the data"""
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get('/api/account/export/').status_code)
+        self.assertEqual(
+            status.HTTP_403_FORBIDDEN,
+            self.client.post('/api/account/import/', self.csv_text, content_type='text/csv').status_code
+        )
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.post('/api/account/import/', self.csv_text, content_type='text/csv')
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        self.assertEqual(2, response.json()['imported'])
+        response = self.client.post('/api/account/import/', self.csv_text, content_type='text/csv')
+        self.assertEqual(status.HTTP_409_CONFLICT, response.status_code)
+
+        response = self.client.get('/api/account/export/', {'output': 'ndjson'})
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(['Иванов Петр', 'Петров, Иван'], sorted(row['owner_name'] for row in rows))
+
+
+class AccountRollupTestCase(TestCase):
+    """Testcase class for the account totals rollup and the `stats` action."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=20000, status='OPEN')
+        self.closed = BankAccount.objects.create(owner_name='Иванов Петр Сергеевич', balance=1050, status='CLOSE')
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data, pk=None):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(f'/account/{action_name}/', data=json.dumps(data), content_type='application/json')
+        return view(request, pk=str(pk)) if pk else view(request)
+
+    def get_stats(self) -> dict:
+        response = BankAccountViewSet.as_view({'get': 'stats'})(self.factory.get('/account/stats/'))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.data['description']
+
+    def mutate(self):
+        self.post('add', {'add_value': 50}, self.account.id)
+        self.post('subtract', {'sub_value': 30}, self.account.id)
+        self.post('batch', [
+            {'id': str(self.account.id), 'op': 'add', 'value': '0.25'},
+            {'id': str(self.account.id), 'op': 'subtract', 'value': 20},
+            {'id': str(self.closed.id), 'op': 'add', 'value': 1},
+        ])
+
+    def test_stats(self):
+        """Testing totals follow add, subtract, batch and settlement in constant queries"""
+        self.mutate()
+        with self.assertNumQueries(1):
+            stats = self.get_stats()
+
+        self.assertEqual({
+            'accounts': 2,
+            'balance': '260.75',
+            'hold': '50.00',
+            'by_status': {
+                'OPEN': {'accounts': 1, 'balance': '250.25', 'hold': '50.00'},
+                'CLOSE': {'accounts': 1, 'balance': '10.50', 'hold': '0.00'},
+            }
+        }, stats)
+
+        QueuedSubtractHoldFlow().run()
+        self.assertEqual(('210.75', '0.00'), (self.get_stats()['balance'], self.get_stats()['hold']))
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_records_changed(self):
+        """Testing saved, imported and deleted accounts are counted"""
+        self.closed.status = 'OPEN'
+        self.closed.save()
+        AccountImportFlow(read_rows(io.StringIO('owner_name,balance,hold,status\nImported,5,1,OPEN\n'), 'csv')).run()
+        self.account.delete()
+
+        self.assertEqual({'accounts': 2, 'balance': '15.50', 'hold': '1.00'},
+                         {key: self.get_stats()[key] for key in ('accounts', 'balance', 'hold')})
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+        self.assertEqual({}, RollupReconcileFlow().run())
+
+    def test_import_applied_once(self):
+        """Testing a multi-batch import applies the summed deltas once"""
+        text = 'owner_name,balance,hold,status\nFirst,5,1,OPEN\nSecond,2,0,OPEN\nThird,1,0,CLOSE\n'
+        with mock.patch.object(AccountRollup.objects, 'apply', wraps=AccountRollup.objects.apply) as apply:
+            AccountImportFlow(read_rows(io.StringIO(text), 'csv'), batch_size=1).run()
+
+        apply.assert_called_once_with({'OPEN': (2, 700, 100), 'CLOSE': (1, 100, 0)})
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_reconcile(self):
+        """Testing reconciliation rewrites totals drifted by changes past the models"""
+        BankAccount.objects.filter(id=self.account.id).update(balance=100000)
+        self.mutate()
+
+        drift = RollupReconcileFlow().run()
+
+        self.assertEqual({'OPEN': (0, 80000, 0)}, drift)
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+        self.assertEqual({}, RollupReconcileFlow().run())
+        self.assertEqual('1050.25', self.get_stats()['by_status']['OPEN']['balance'])
+
+    @override_settings(ACCOUNT_LEDGER_ENABLED=True)
+    def test_ledger_mode(self):
+        """Testing totals match the derived ledger state before and after compaction"""
+        self.mutate()
+        expected = AccountRollup.objects.totals()
+
+        self.assertEqual(expected, AccountRollup.objects.recompute())
+        LedgerSubtractHoldFlow().run()
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+        LedgerCompactionFlow(lag=0).run()
+        self.assertEqual({}, RollupReconcileFlow().run())
+        self.assertEqual(('210.75', '0.00'), (self.get_stats()['balance'], self.get_stats()['hold']))
+
+
+class HotAccountTestCase(TestCase):
+    """Testcase class for hot accounts with balance slots."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=20000, status='OPEN')
+        call_command('hot_account', str(self.account.id), slots=4, stdout=io.StringIO())
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data, pk=None):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(f'/account/{action_name}/', data=json.dumps(data), content_type='application/json')
+        return view(request, pk=str(pk)) if pk else view(request)
+
+    def get_status(self) -> dict:
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        return view(self.factory.get(f'/account/{self.account.id}/status/'), pk=str(self.account.id)).data
+
+    def test_add(self):
+        """Testing adds go to the slots, status and list count them"""
+        for _ in range(20):
+            response = self.post('add', {'add_value': 1}, self.account.id)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        self.assertEqual(20000, BankAccount.objects.get(id=self.account.id).balance)
+        self.assertEqual(2000, AccountSlot.objects.balance(self.account.id))
+        self.assertEqual('220.00', self.get_status()['description']['balance'])
+        response = BankAccountViewSet.as_view({'get': 'list'})(self.factory.get('/account/'))
+        self.assertEqual('220.00', response.data['results'][0]['balance'])
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_add_closed(self):
+        """Testing a closed hot account is not credited"""
+        BankAccount.objects.filter(id=self.account.id).update(status=AccountStatusEnum.CLOSE.value)
+
+        self.assertFalse(AccountSlot.objects.add(self.account.id, 4, 100))
+        self.assertEqual(0, AccountSlot.objects.balance(self.account.id))
+        self.assertFalse(OutboxEvent.objects.filter(operation='ADD').exists())
+
+    def test_subtract(self):
+        """Testing the hold availability counts the slots"""
+        BankAccount.objects.filter(id=self.account.id).update(balance=0)
+        self.post('add', {'add_value': 100}, self.account.id)
+
+        response = self.post('subtract', {'sub_value': 60}, self.account.id)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        response = self.post('subtract', {'sub_value': 50}, self.account.id)
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        account = BankAccount.objects.get(id=self.account.id)
+        self.assertEqual((10000, 6000), account.current_state())
+        self.assertFalse(BankAccount.objects.add_hold(self.account.id, 4001, hot=True))
+        self.assertTrue(BankAccount.objects.add_hold(self.account.id, 4000, hot=True))
+
+    def test_batch(self):
+        """Testing batch counts the slots and leaves them as they are"""
+        BankAccount.objects.filter(id=self.account.id).update(balance=0)
+        self.post('add', {'add_value': 100}, self.account.id)
+
+        response = self.post('batch', [
+            {'id': str(self.account.id), 'op': 'add', 'value': 10},
+            {'id': str(self.account.id), 'op': 'subtract', 'value': 110},
+            {'id': str(self.account.id), 'op': 'subtract', 'value': 1},
+        ])
+
+        self.assertEqual([True, True, False], [item['result'] for item in response.data['description']])
+        account = BankAccount.objects.get(id=self.account.id)
+        self.assertEqual((1000, 11000), (account.balance, account.hold))
+        self.assertEqual((11000, 11000), account.current_state())
+
+    def test_consolidate(self):
+        """Testing consolidation moves the slots to the record, turning off routes adds to the record"""
+        self.post('add', {'add_value': 20}, self.account.id)
+        self.post('add', {'add_value': 30}, self.account.id)
+
+        self.assertEqual(1, SlotConsolidationFlow().run())
+        self.assertEqual(0, SlotConsolidationFlow().run())
+        self.assertEqual(25000, BankAccount.objects.get(id=self.account.id).balance)
+        self.assertEqual('250.00', self.get_status()['description']['balance'])
+
+        self.post('add', {'add_value': 5}, self.account.id)
+        call_command('hot_account', str(self.account.id), slots=0, stdout=io.StringIO())
+        account = BankAccount.objects.get(id=self.account.id)
+        self.assertEqual((25500, 0), (account.balance, account.hot_slots))
+        self.assertFalse(AccountSlot.objects.filter(account_id=self.account.id).exists())
+        # an add that read the account before the mode was turned off
+        self.assertTrue(AccountSlot.objects.add(self.account.id, 4, 100))
+        self.assertEqual(25600, BankAccount.objects.get(id=self.account.id).balance)
+        self.assertEqual({}, RollupReconcileFlow().run())
+
+    def test_export(self):
+        """Testing export counts the slots"""
+        self.post('add', {'add_value': 5}, self.account.id)
+        output = io.StringIO()
+
+        AccountExportFlow('ndjson').run(output)
+
+        self.assertEqual('205.00', json.loads(output.getvalue())['balance'])
+
+
+@override_settings(ACCOUNT_RESERVATIONS_ENABLED=True)
+class ReservationTestCase(TestCase):
+    """Testcase class for hold reservations."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=20000, status='OPEN')
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data=None, url_path: str = None, **kwargs):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{url_path or action_name}/',
+            data=json.dumps(data or {}),
+            content_type='application/json'
+        )
+        return view(request, **kwargs)
+
+    def subtract(self, data: dict):
+        return self.post('subtract', data, pk=str(self.account.id))
+
+    def finish(self, action_name: str, reservation_id: int):
+        return self.post(action_name, pk=str(self.account.id), reservation_id=str(reservation_id))
+
+    def state(self) -> tuple:
+        return BankAccount.objects.filter(id=self.account.id).values_list('balance', 'hold').get()
+
+    def test_settlement_captures_due(self):
+        """Testing subtract reserves the hold and the settlement captures due reservations only"""
+        response = self.subtract({'sub_value': 50})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        reservation = response.data['description']['reservation']
+        self.assertEqual(('50.00', True), (reservation['amount'], reservation['capture_on_expiry']))
+        self.subtract({'sub_value': 30, 'hold_seconds': 60})
+        self.assertEqual((20000, 8000), self.state())
+        self.assertFalse(PendingSettlement.objects.exists())
+
+        self.assertEqual(1, ReservationCaptureFlow().run().settled)
+        self.assertEqual((15000, 3000), self.state())
+        self.assertEqual(0, ReservationExpiryFlow().run().settled)
+        self.assertEqual([3000], list(AccountReservation.objects.values_list('amount', flat=True)))
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_capture_and_release(self):
+        """Testing reservations captured and released by the client"""
+        ids = [
+            self.subtract({'sub_value': value, 'hold_seconds': 60}).data['description']['reservation']['id']
+            for value in (50, 30)
+        ]
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, self.subtract({'sub_value': 150}).status_code)
+
+        response = self.finish('release', ids[0])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(BankAccountOperationsEnum.RELEASE.value, response.data['addition'])
+        self.assertEqual((20000, 3000), self.state())
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.finish('capture', ids[0]).status_code)
+        self.assertEqual(status.HTTP_200_OK, self.finish('capture', ids[1]).status_code)
+        self.assertEqual((17000, 0), self.state())
+        self.assertEqual(
+            [('HOLD', 5000), ('HOLD', 3000), ('RELEASE', 5000), ('SETTLE', 3000)],
+            list(OutboxEvent.objects.order_by('id').values_list('operation', 'amount'))
+        )
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_closed_account_released(self):
+        """Testing reservations of an account closed after reserving are released, not captured"""
+        self.subtract({'sub_value': 50})
+        self.account.refresh_from_db()
+        self.account.status = AccountStatusEnum.CLOSE.value
+        self.account.save()
+
+        self.assertEqual(1, ReservationCaptureFlow().run().settled)
+        self.assertEqual((20000, 0), self.state())
+        self.assertFalse(AccountReservation.objects.exists())
+        self.assertEqual('RELEASE', OutboxEvent.objects.latest('id').operation)
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+    def test_expiry(self):
+        """Testing expired reservations are released by the sweep, in chunks"""
+        for _ in range(5):
+            self.subtract({'sub_value': 10, 'hold_seconds': 60})
+        AccountReservation.objects.filter(
+            id__in=AccountReservation.objects.order_by('id').values('id')[:3]
+        ).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        report = ReservationExpiryFlow(chunk_size=2).run()
+        self.assertEqual((3, 2), (report.settled, len(report.chunks)))
+        self.assertEqual((20000, 2000), self.state())
+        self.assertEqual(2, AccountReservation.objects.count())
+
+    def test_batch(self):
+        """Testing batch subtracts create reservations due for capture"""
+        response = self.post('batch', [
+            {'id': str(self.account.id), 'op': 'subtract', 'value': 20},
+            {'id': str(self.account.id), 'op': 'subtract', 'value': 30},
+        ])
+        self.assertTrue(response.data['result'])
+        self.assertEqual(5000, sum(AccountReservation.objects.due(True).values_list('amount', flat=True)))
+
+        self.assertEqual(2, ReservationCaptureFlow().run().settled)
+        self.assertEqual((15000, 0), self.state())
+
+    @override_settings(ACCOUNT_RESERVATIONS_ENABLED=False)
+    def test_disabled(self):
+        """Testing `hold_seconds` is rejected without reservation mode"""
+        response = self.subtract({'sub_value': 10, 'hold_seconds': 60})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertEqual((20000, 0), self.state())
+
+
+class MoneyTestCase(TestCase):
+    """Testcase class for integer minor units amounts and the API precision boundary."""
+    largest = '99999999999999.99'
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Kazitsky Jason', balance=0, status='OPEN')
+        self.factory = APIRequestFactory()
+
+    def post(self, action_name: str, data: dict):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(
+            f'/account/{self.account.id}/{action_name}/',
+            data=json.dumps(data),
+            content_type='application/json'
+        )
+        return view(request, pk=str(self.account.id))
+
+    def test_conversions(self):
+        """Testing exact conversions between decimal amounts and minor units"""
+        self.assertEqual(10050, to_minor('100.50'))
+        self.assertEqual(1, to_minor(SMALLEST_AMOUNT))
+        with self.assertRaises(ValueError):
+            to_minor('1.005')
+        self.assertEqual((10050, 100, None, None), tuple(parse_minor(text) for text in ('100.5', '1', '-1', '1e3')))
+        self.assertEqual(['0.00', '-0.50', '100.05'], [format_minor(minor) for minor in (0, -50, 10005)])
+
+    def test_precision_boundary(self):
+        """Testing amounts beyond the currency precision or below one minor unit are rejected"""
+        for value, error in (('0.001', 'decimal places'), ('0.00', 'greater than or equal to 0.01'),
+                             ('100000000000000', 'digits')):
+            response = self.post('add', {'add_value': value})
+            self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+            self.assertIn(error, str(response.data['description']['add_value'][0]))
+        self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': 0.1}).status_code)
+        self.account.refresh_from_db()
+        self.assertEqual(10, self.account.balance)
+
+    def test_large_values(self):
+        """Testing balances far past the former 9999.99 cap stay exact through every path"""
+        for _ in range(3):
+            self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': self.largest}).status_code)
+        for _ in range(2):
+            self.assertEqual(status.HTTP_200_OK, self.post('subtract', {'sub_value': self.largest}).status_code)
+        QueuedSubtractHoldFlow().run()
+        for _ in range(2):
+            self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': self.largest}).status_code)
+
+        self.account.refresh_from_db()
+        self.assertEqual((29999999999999997, 0), (self.account.balance, self.account.hold))
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        response = view(self.factory.get(f'/account/{self.account.id}/status/'), pk=str(self.account.id))
+        self.assertEqual('299999999999999.97', response.data['description']['balance'])
+        response = BankAccountViewSet.as_view({'get': 'stats'})(self.factory.get('/account/stats/'))
+        self.assertEqual('299999999999999.97', response.data['description']['balance'])
+        output = io.StringIO()
+        AccountExportFlow('ndjson').run(output)
+        self.assertEqual('299999999999999.97', json.loads(output.getvalue())['balance'])
+        BankAccount.objects.all().delete()
+        AccountImportFlow(read_rows(io.StringIO(output.getvalue()), 'ndjson')).run()
+        self.assertEqual([29999999999999997], list(BankAccount.objects.values_list('balance', flat=True)))
+
+    def test_balance_limit(self):
+        """Testing adds past the largest balance are refused with 400, by the API and the batch"""
+        BankAccount.objects.filter(id=self.account.id).update(balance=MAX_BALANCE - 100)
+        self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': '1.00'}).status_code)
+        response = self.post('add', {'add_value': '0.01'})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+        self.assertIn('limit', str(response.data['description']['non_field_errors'][0]))
+
+        request = self.factory.post(
+            '/account/batch/',
+            data=json.dumps([{'id': str(self.account.id), 'op': 'add', 'value': '0.01'}]),
+            content_type='application/json'
+        )
+        response = BankAccountViewSet.as_view({'post': 'batch'})(request)
+        self.assertFalse(response.data['result'])
+        self.account.refresh_from_db()
+        self.assertEqual(MAX_BALANCE, self.account.balance)
+
+    @override_settings(ACCOUNT_CURRENCY_DECIMAL_PLACES=1)
+    def test_migration_decimal_places(self):
+        """Testing the conversion to minor units refuses to round away the cents"""
+        migration = importlib.import_module('core.migrations.0009_money_minor_units')
+        with self.assertRaises(ImproperlyConfigured):
+            migration.check_decimal_places(None, None)
+
+
+class RedisStandIn(object):
+    """Local stand-in of the Redis scripts and commands used by the rate limiter."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.buckets = {}
+        self.semaphores = {}
+
+    def register_script(self, script: str):
+        implementation = {TOKEN_BUCKET_SCRIPT: self.token_bucket, SEMAPHORE_SCRIPT: self.semaphore}[script]
+
+        def call(keys, args, client=None):
+            if self.fail:
+                raise RedisConnectionError('Redis is unavailable')
+            return implementation(keys, *args)
+        return call
+
+    def token_bucket(self, keys, now, *args):
+        tokens, wait = [], 0
+        for key, rate, burst, cost in zip(keys, args[::3], args[1::3], args[2::3]):
+            available, at = self.buckets.get(key, (burst, now))
+            tokens.append(min(burst, available + max(0, now - at) * rate))
+            wait = max(wait, (cost - tokens[-1]) / rate if tokens[-1] < cost else 0)
+        taken = 0 if wait else 1
+        for key, available, cost in zip(keys, tokens, args[2::3]):
+            self.buckets[key] = (available - cost * taken, now)
+        return [taken, str(wait)]
+
+    def semaphore(self, keys, limit, now, timeout, token):
+        key = keys[0]
+        slots = {t: at for t, at in self.semaphores.get(key, {}).items() if at > now - timeout}
+        self.semaphores[key] = slots
+        if len(slots) >= limit:
+            return 0
+        slots[token] = now
+        return 1
+
+    def zrem(self, key, token):
+        self.semaphores.get(key, {}).pop(token, None)
+
+
+@override_settings(
+    ACCOUNT_THROTTLE_ENABLED=True,
+    ACCOUNT_THROTTLE_ACCOUNT_RATE=0.001,
+    ACCOUNT_THROTTLE_ACCOUNT_BURST=2,
+    ACCOUNT_THROTTLE_CLIENT_RATE=0.001,
+    ACCOUNT_THROTTLE_CLIENT_BURST=5,
+    ACCOUNT_THROTTLE_READ_RATE=0.001,
+    ACCOUNT_THROTTLE_READ_BURST=100
+)
+class AdmissionControlTestCase(TestCase):
+    """Testcase class for the mutation and read budgets and the in-flight cap."""
+
+    def setUp(self) -> None:
+        self.account = BankAccount.objects.create(owner_name='Петров Иван Сергеевич', balance=20000, status='OPEN')
+        self.other = BankAccount.objects.create(owner_name='Иванов Петр Сергеевич', balance=10000, status='OPEN')
+        self.factory = APIRequestFactory()
+        self.redis = RedisStandIn()
+        rate_limiter.client = self.redis
+        self.addCleanup(setattr, rate_limiter, '_client', None)
+
+    def post(self, action_name: str, data, pk=None):
+        view = BankAccountViewSet.as_view({'post': action_name})
+        request = self.factory.post(f'/account/{action_name}/', data=json.dumps(data), content_type='application/json')
+        return view(request, pk=str(pk)) if pk else view(request)
+
+    def get_status(self, pk):
+        view = BankAccountViewSet.as_view({'get': 'status'})
+        return view(self.factory.get(f'/account/{pk}/status/'), pk=str(pk))
+
+    def test_account_budget(self):
+        """Testing the per account budget refuses with 429 and `Retry-After`, reads keep their budget"""
+        for value in (10, 20):
+            self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': value}, self.account.id).status_code)
+        with self.assertNumQueries(0):
+            response = self.post('subtract', {'sub_value': 10}, self.account.id)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual('1000', response['Retry-After'])
+
+        self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': 10}, self.other.id).status_code)
+        self.assertEqual(status.HTTP_200_OK, self.get_status(self.account.id).status_code)
+        self.assertEqual((23000, 0), BankAccount.objects.get(id=self.account.id).current_state())
+
+    def test_client_budget(self):
+        """Testing the per client budget, batch costs one token per item"""
+        items = [{'id': str(self.other.id), 'op': 'add', 'value': 1}] * 4
+        self.assertEqual(status.HTTP_200_OK, self.post('batch', items).status_code)
+        self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': 1}, self.account.id).status_code)
+        response = self.post('add', {'add_value': 1}, self.account.id)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+
+    def test_refused_takes_no_tokens(self):
+        """Testing a request refused by the client budget keeps the account budget"""
+        items = [{'id': str(self.other.id), 'op': 'add', 'value': 1}] * 5
+        self.assertEqual(status.HTTP_200_OK, self.post('batch', items).status_code)
+        response = self.post('add', {'add_value': 1}, self.account.id)
+
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual(2, self.redis.buckets[f'throttle:account:{self.account.id}'][0])
+
+    def test_forwarded_for_spoofed(self):
+        """Testing the client bucket is keyed on the hop of the proxy, not the forged addresses"""
+        view = BankAccountViewSet.as_view({'post': 'batch'})
+        items = [{'id': str(self.other.id), 'op': 'add', 'value': 1}] * 3
+        for forged in ('10.0.0.1', '10.0.0.2'):
+            request = self.factory.post(
+                '/account/batch/',
+                data=json.dumps(items),
+                content_type='application/json',
+                HTTP_X_FORWARDED_FOR=f'{forged}, 192.0.2.7'
+            )
+            response = view(request)
+
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertIn('throttle:client:192.0.2.7', self.redis.buckets)
+
+    @override_settings(ACCOUNT_MUTATION_CONCURRENCY=1, ACCOUNT_MUTATION_RETRY_AFTER=2)
+    def test_concurrency_cap(self):
+        """Testing mutations over the in-flight cap are shed before the database, reads are not"""
+        token = rate_limiter.acquire('mutations', 1, 30)
+        with self.assertNumQueries(0):
+            response = self.post('add', {'add_value': 1}, self.account.id)
+        self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, response.status_code)
+        self.assertEqual('2', response['Retry-After'])
+        self.assertEqual(status.HTTP_200_OK, self.get_status(self.account.id).status_code)
+
+        rate_limiter.release('mutations', token)
+        self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': 1}, self.account.id).status_code)
+        self.assertEqual({}, self.redis.semaphores['throttle:mutations'])
+
+    @override_settings(ACCOUNT_MUTATION_CONCURRENCY=1)
+    def test_redis_unavailable(self):
+        """Testing requests are let through when Redis fails"""
+        self.redis.fail = True
+        for _ in range(3):
+            self.assertEqual(status.HTTP_200_OK, self.post('add', {'add_value': 1}, self.account.id).status_code)
+
+
+class ProcessProfileTestCase(TestCase):
+    """Testcase class for the slim process profiles."""
+
+    def test_startup(self):
+        """Testing the api and worker profiles start with their apps only"""
+        output = io.StringIO()
+        call_command('benchmark_startup', repeat=1, runs='api:web,worker:worker', stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith('web (api profile):'))
+        self.assertIn('4 apps, 3 middleware', lines[0])
+        self.assertTrue(lines[1].startswith('worker (worker profile):'))
+        self.assertIn('1 apps, 0 middleware', lines[1])
+
+
+class QueryPlanTestCase(TestCase):
+    """Testcase class for the query plans of the hot queries."""
+
+    def test_explain_queries(self):
+        """Testing every hot query is planned for the account with hold"""
+        account = BankAccount.objects.create(owner_name='Kazitsky Jason', balance=20000, hold=5000, status='OPEN')
+        BankAccount.objects.create(owner_name='Test Name', balance=100, status='OPEN')
+        output = io.StringIO()
+        call_command('explain_queries', no_analyze=True, stdout=output)
+
+        text = output.getvalue()
+        self.assertTrue(text.startswith(f'2 accounts, account {account.id}'))
+        for name in ('hold settlement chunk', 'account list page', 'account status', 'ledger snapshot', 'ledger tail'):
+            self.assertIn(f'\n{name}\n', text)
+
+    def test_no_accounts(self):
+        """Testing an empty database is reported as a command error"""
+        with self.assertRaises(CommandError):
+            call_command('explain_queries', no_analyze=True, stdout=io.StringIO())
+
+
+class BenchmarkCommandsTestCase(TransactionTestCase):
+    """Testcase class for the seeded data generation and the benchmark report."""
+
+    def generate(self, seed: int) -> list:
+        call_command('generate_accounts', count=50, seed=seed, batch_size=20, stdout=io.StringIO())
+        return list(BankAccount.objects.order_by('id').values_list('id', 'balance', 'hold', 'status'))
+
+    def test_generate_accounts(self):
+        """Testing the same seed generates the same population, its holds queued for settlement"""
+        accounts = self.generate(seed=1)
+        held = {pk for pk, _, hold, account_status in accounts if hold and account_status == 'OPEN'}
+        self.assertEqual(50, len(accounts))
+        self.assertEqual(held, set(PendingSettlement.objects.values_list('account_id', flat=True)))
+        self.assertEqual(AccountRollup.objects.recompute(), AccountRollup.objects.totals())
+
+        BankAccount.objects.all().delete()
+        self.assertEqual(accounts, self.generate(seed=1))
+        BankAccount.objects.all().delete()
+        self.assertNotEqual(accounts, self.generate(seed=2))
+
+    def test_benchmark_suite(self):
+        """Testing the same seed samples the same accounts and the report has every result"""
+        self.generate(seed=1)
+        command = BenchmarkSuiteCommand()
+        self.assertEqual(command.sample_ids(10, random.Random(3)), command.sample_ids(10, random.Random(3)))
+
+        output = io.StringIO()
+        call_command('benchmark_suite', requests=5, operations=4, workers=1, seed=3, label='test', stdout=output)
+        report = json.loads(output.getvalue())
+
+        self.assertEqual(('test', 3, 50), (report['label'], report['seed'], report['accounts']))
+        self.assertEqual({'status', 'list', 'add_subtract', 'settlement'}, set(report['results']))
+        for name in ('status', 'list', 'add_subtract'):
+            self.assertEqual(0, report['results'][name]['errors'])
+            self.assertIn('p99_ms', report['results'][name])
+        self.assertEqual('QueuedSubtractHoldFlow', report['results']['settlement']['flow'])
+        self.assertFalse(BankAccount.objects.not_zero_hold().exists())
@@ -0,0 +1,220 @@
+import logging
+import math
+import time
+import uuid
+
+import redis
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+# KEYS bucket hashes; ARGV now (seconds), then rate (tokens per second), burst (bucket size)
+# and cost of every bucket. Tokens are taken from all buckets or, if any is short, from none.
+# Returns `{taken, seconds to wait}`, the wait as a string (Lua numbers are returned as integers).
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens, wait = {}, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst, cost = tonumber(ARGV[i * 3 - 1]), tonumber(ARGV[i * 3]), tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'at')
+    local at = tonumber(state[2]) or now
+    tokens[i] = math.min(burst, (tonumber(state[1]) or burst) + math.max(0, now - at) * rate)
+    if tokens[i] < cost then
+        wait = math.max(wait, (cost - tokens[i]) / rate)
+    end
+end
+local taken = wait == 0 and 1 or 0
+for i, key in ipairs(KEYS) do
+    local rate, burst, cost = tonumber(ARGV[i * 3 - 1]), tonumber(ARGV[i * 3]), tonumber(ARGV[i * 3 + 1])
+    redis.call('HMSET', key, 'tokens', tokens[i] - cost * taken, 'at', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {taken, tostring(wait)}
+"""
+
+# KEYS[1] sorted set of in-flight tokens scored by start time; ARGV limit, now, timeout, token.
+# Entries older than `timeout` (workers died before the release) are dropped first.
+SEMAPHORE_SCRIPT = """
+local limit, now, timeout = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(timeout))
+return 1
+"""
+
+
+class RateLimiter(object):
+    """Token buckets and a concurrency semaphore shared by all workers in Redis,
+    each check is one script call. Redis errors let the request through (fail open),
+    as the account API must not go down with its limiter.
+    """
+    key_prefix = 'throttle'
+
+    def __init__(self):
+        self._client = None
+        self.token_bucket = None
+        self.semaphore = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self.client = redis.Redis.from_url(
+                settings.ACCOUNT_THROTTLE_REDIS_URL,
+                socket_timeout=settings.ACCOUNT_THROTTLE_REDIS_TIMEOUT,
+                socket_connect_timeout=settings.ACCOUNT_THROTTLE_REDIS_TIMEOUT
+            )
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+        self.token_bucket = client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.semaphore = client.register_script(SEMAPHORE_SCRIPT)
+
+    def key(self, name: str) -> str:
+        return f'{self.key_prefix}:{name}'
+
+    def take(self, buckets: list) -> float:
+        """Take `cost` tokens from every bucket of `(name, rate, burst, cost)`, refilled by
+        `rate` tokens per second up to `burst`, or none if any is short. Return 0 if taken,
+        otherwise seconds until they are available.
+        """
+        keys, args = [], [time.time()]
+        for name, rate, burst, cost in buckets:
+            keys.append(self.key(name))
+            args.extend((rate, burst, min(cost, burst)))
+        client = self.client
+        try:
+            taken, wait = self.token_bucket(keys=keys, args=args, client=client)
+        except redis.RedisError as e:
+            logger.warning(f'Rate limiter is unavailable, buckets {", ".join(keys)} are not checked: {e}')
+            return 0
+        return 0 if int(taken) else float(wait)
+
+    def acquire(self, name: str, limit: int, timeout: float):
+        """Take one of `limit` slots of semaphore `name` for at most `timeout` seconds.
+        Return the slot token to release or None if all slots are taken.
+        """
+        token = uuid.uuid4().hex
+        client = self.client
+        try:
+            acquired = self.semaphore(keys=[self.key(name)], args=[limit, time.time(), timeout, token], client=client)
+        except redis.RedisError as e:
+            logger.warning(f'Rate limiter is unavailable, semaphore {name} is not checked: {e}')
+            return ''
+        return token if int(acquired) else None
+
+    def release(self, name: str, token: str):
+        if not token:
+            return
+        try:
+            self.client.zrem(self.key(name), token)
+        except redis.RedisError as e:
+            logger.warning(f'Rate limiter is unavailable, semaphore {name} slot expires by timeout: {e}')
+
+
+rate_limiter = RateLimiter()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Throttle by the Redis token buckets of `get_buckets`, checked together:
+    the request is refused if any bucket is out of tokens and then takes from none.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_buckets(self, request, view) -> list:
+        """`(name, rate, burst, cost)` of the buckets to take from, rate 0 is unlimited."""
+        raise NotImplementedError('.get_buckets() must be overridden')
+
+    def allow_request(self, request, view) -> bool:
+        buckets = [bucket for bucket in self.get_buckets(request, view) if bucket[1] > 0]
+        self.wait_seconds = (rate_limiter.take(buckets) or None) if buckets else None
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AccountMutationThrottle(TokenBucketThrottle):
+    """Mutation budget per account and per client. A batch costs one token per item."""
+
+    def get_buckets(self, request, view) -> list:
+        buckets = []
+        if (view.lookup_url_kwarg or view.lookup_field) in view.kwargs:
+            buckets.append((
+                f'account:{view.get_account_pk()}',
+                settings.ACCOUNT_THROTTLE_ACCOUNT_RATE,
+                settings.ACCOUNT_THROTTLE_ACCOUNT_BURST,
+                1
+            ))
+        cost = len(request.data) if isinstance(request.data, list) and request.data else 1
+        buckets.append((
+            f'client:{self.get_ident(request)}',
+            settings.ACCOUNT_THROTTLE_CLIENT_RATE,
+            settings.ACCOUNT_THROTTLE_CLIENT_BURST,
+            cost
+        ))
+        return buckets
+
+
+class AccountReadThrottle(TokenBucketThrottle):
+    """Read budget per client, separate from the mutation budgets."""
+
+    def get_buckets(self, request, view) -> list:
+        return [(
+            f'read:{self.get_ident(request)}',
+            settings.ACCOUNT_THROTTLE_READ_RATE,
+            settings.ACCOUNT_THROTTLE_READ_BURST,
+            1
+        )]
+
+
+class AdmissionControlMixin:
+    """Admission control of view set actions: `mutation_actions` take the mutation
+    budgets and one of `ACCOUNT_MUTATION_CONCURRENCY` in-flight slots over all
+    workers, `read_actions` take the read budget only, so reads are not shed by
+    a write storm. Refused requests get 429 with `Retry-After`.
+
+    Authentication of these actions is lazy (they allow any user), so a request is
+    shed before it takes a database connection.
+    """
+    mutation_actions = ()
+    read_actions = ()
+    concurrency_name = 'mutations'
+
+    def perform_authentication(self, request):
+        if not settings.ACCOUNT_THROTTLE_ENABLED or self.action not in self.mutation_actions + self.read_actions:
+            super().perform_authentication(request)
+
+    def get_throttles(self):
+        if settings.ACCOUNT_THROTTLE_ENABLED:
+            if self.action in self.mutation_actions:
+                return [AccountMutationThrottle()]
+            if self.action in self.read_actions:
+                return [AccountReadThrottle()]
+        return super().get_throttles()
+
+    def initial(self, request, *args, **kwargs):
+        self.concurrency_token = None
+        super().initial(request, *args, **kwargs)
+        limit = settings.ACCOUNT_MUTATION_CONCURRENCY
+        if settings.ACCOUNT_THROTTLE_ENABLED and limit and self.action in self.mutation_actions:
+            self.concurrency_token = rate_limiter.acquire(
+                self.concurrency_name,
+                limit,
+                settings.ACCOUNT_MUTATION_SLOT_TIMEOUT
+            )
+            if self.concurrency_token is None:
+                raise Throttled(wait=math.ceil(settings.ACCOUNT_MUTATION_RETRY_AFTER))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        rate_limiter.release(self.concurrency_name, getattr(self, 'concurrency_token', None))
+        self.concurrency_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
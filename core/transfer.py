@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+import re
+import uuid
+
+from django.core.exceptions import ValidationError
+
+from core.enums import AccountStatusEnum
+from core.models import BankAccount
+from core.money import BALANCE_INTEGER_DIGITS, BALANCE_RE, DECIMAL_PLACES, format_minor, parse_minor
+
+# Columns of imported and exported accounts, in the CSV header order
+COLUMNS = ('id', 'owner_name', 'balance', 'hold', 'status')
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z')
+
+
+def format_by_name(name: str, default: str = 'csv') -> str:
+    """File format by the file name extension."""
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return extension if extension in FORMATS else default
+
+
+def read_rows(lines, file_format: str):
+    """Yield `(line, row)` of CSV (with header) or NDJSON text lines, `id` is optional."""
+    if file_format == 'csv':
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        for values in reader:
+            yield reader.line_num, dict(zip(header, values))
+        return
+    for line, text in enumerate(lines, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            raise ValidationError(f'Line {line}: invalid JSON, {e}')
+        if not isinstance(row, dict):
+            raise ValidationError(f'Line {line}: expected an object')
+        yield line, row
+
+
+class AccountRowCleaner(object):
+    """Validate imported rows by the BankAccount field rules: owner name length,
+    non-negative amounts of the API precision and status choices.
+    Amounts are returned as integer minor units.
+    """
+    amount_rule = (
+        f'a non-negative number with at most {BALANCE_INTEGER_DIGITS} integer digits '
+        f'and {DECIMAL_PLACES} decimal places'
+    )
+
+    def __init__(self):
+        self.owner_name_length = BankAccount._meta.get_field('owner_name').max_length
+        self.statuses = {status.value for status in AccountStatusEnum}
+
+    def amount(self, row: dict, name: str) -> int:
+        value = row.get(name)
+        if value is None or value == '':
+            return 0
+        minor = parse_minor(str(value), BALANCE_RE)
+        if minor is None:
+            raise ValueError(f'`{name}` should be {self.amount_rule}')
+        return minor
+
+    @staticmethod
+    def uuid(value) -> str:
+        """Canonical UUID string, the common lowercase form is checked without parsing."""
+        if not value:
+            return str(uuid.uuid4())
+        value = str(value)
+        if UUID_RE.match(value) is None:
+            value = str(uuid.UUID(value))
+        return value
+
+    def __call__(self, line: int, row: dict) -> tuple:
+        """Return `(id, owner_name, balance, hold, status)` or raise ValidationError."""
+        try:
+            pk = self.uuid(row.get('id'))
+            owner_name = row.get('owner_name') or ''
+            if not isinstance(owner_name, str) or not 0 < len(owner_name) <= self.owner_name_length:
+                raise ValueError(f'`owner_name` should be 1 to {self.owner_name_length} characters')
+            status = row.get('status')
+            if not isinstance(status, str) or status not in self.statuses:
+                raise ValueError(f'`status` should be one of {", ".join(sorted(self.statuses))}')
+            return pk, owner_name, self.amount(row, 'balance'), self.amount(row, 'hold'), status
+        except ValueError as e:
+            raise ValidationError(f'Line {line}: {e}')
+
+
+def csv_header() -> str:
+    return ','.join(COLUMNS) + '\r\n'
+
+
+def render_rows(rows: list, file_format: str) -> str:
+    """Render `(id, owner_name, balance, hold, status)` rows, amounts in minor units,
+    as CSV (without header) or NDJSON lines.
+    """
+    if file_format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            (pk, owner_name, format_minor(balance), format_minor(hold), status)
+            for pk, owner_name, balance, hold, status in rows
+        )
+        return buffer.getvalue()
+    return ''.join(
+        json.dumps({'id': str(pk), 'owner_name': owner_name, 'balance': format_minor(balance),
+                    'hold': format_minor(hold), 'status': status}, ensure_ascii=False) + '\n'
+        for pk, owner_name, balance, hold, status in rows
+    )
@@ -1,5 +1,7 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
+from core import async_views
 from core.views import BankAccountViewSet
 
 
@@ -9,5 +11,9 @@ router = DefaultRouter()
 router.register('account', BankAccountViewSet, basename='account_viewset')
 
 urlpatterns = [
-
+    # Async variant of the account API, served by ASGI workers
+    path('async/account/', async_views.account_list, name='async_account_list'),
+    path('async/account/<str:pk>/add/', async_views.account_add, name='async_account_add'),
+    path('async/account/<str:pk>/subtract/', async_views.account_subtract, name='async_account_subtract'),
+    path('async/account/<str:pk>/status/', async_views.account_status, name='async_account_status'),
 ] + router.urls
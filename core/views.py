@@ -1,62 +1,221 @@
-from copy import deepcopy
+import codecs
+import uuid
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import status
 from rest_framework import mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.permissions import IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
+from core.cache import account_status_cache
 from core.enums import BankAccountOperationsEnum
+from core.flows import AccountExportFlow, AccountImportFlow
+from core.idempotency import idempotency_store
+from core.metrics import metrics
 from core.mixins import GetSerializerClassMixin
-from core.models import BankAccount
+from core.models import AccountReservation, AccountRollup, AccountSlot, BankAccount
+from core.money import format_minor
+from core.pagination import BankAccountCursorPagination
+from core.renderers import ORJSONRenderer
+from core.routers import read_from_replica
+from core.throttling import AdmissionControlMixin
+from core.transfer import CONTENT_TYPES, FORMATS, read_rows
 from core.serializers import (
     BankAccountForListSerializer,
     BankAccountForAddSerializer,
     BankAccountForSubtractSerializer,
-    BankAccountForStatusSerializer
+    BankAccountForStatusSerializer,
+    BankAccountBatchItemSerializer,
+    RESERVATION_NOT_FOUND_MESSAGE
 )
 
 
 # TODO: May be shouldn't use ListModelMixin
-class BankAccountViewSet(GetSerializerClassMixin,
+class BankAccountViewSet(AdmissionControlMixin,
+                         GetSerializerClassMixin,
                          mixins.ListModelMixin,
                          GenericViewSet):
     """Bank account view set. Provided `default list` action
+        (cursor paginated, `?stream=true` streams all accounts as NDJSON)
         and custom actions:
             add - adding cash to account balance
             subtract - adding subtract sum to account hold
+                (both accept `Idempotency-Key` header)
+            capture/release - finish a hold reservation (reservation mode)
             status - get account balance and status
+            batch - apply a list of `add`/`subtract` operations
+            stats - accounts count, balance and hold totals by status
+            import/export - stream accounts in and out as CSV or NDJSON (admin only)
+        Mutations and reads are admitted by separate Redis budgets, see `AdmissionControlMixin`.
     """
     queryset = BankAccount.objects.all()
     serializer_class = BankAccountForListSerializer
+    pagination_class = BankAccountCursorPagination
+    if settings.ACCOUNT_API_ORJSON:
+        renderer_classes = [ORJSONRenderer] + api_settings.DEFAULT_RENDERER_CLASSES[1:]
     default_response_message = {
         'status': status.HTTP_200_OK,
         'result': True,
         'addition': '',
         'description': {}
     }
+    # set on writes, reads of the client go to the primary while the replicas catch up
+    sticky_cookie = 'replica_sticky'
+    mutation_actions = ('add', 'subtract', 'batch', 'capture', 'release')
+    read_actions = ('status', 'list')
     serializer_action_classes = {
         'list': BankAccountForListSerializer,
         'add': BankAccountForAddSerializer,
         'subtract': BankAccountForSubtractSerializer,
-        'status': BankAccountForStatusSerializer
+        'status': BankAccountForStatusSerializer,
+        'batch': BankAccountBatchItemSerializer
     }
 
-    def get_response_data(self, request: Request, operation: BankAccountOperationsEnum):
-        """Return the default response message with filled addition"""
-        resp = deepcopy(self.default_response_message)
-        resp['addition'] = operation.value
+    def list(self, request: Request, *args, **kwargs):
+        """Accounts list, serialized from `.values()` rows of the needed columns."""
+        if request.query_params.get('stream', '').lower() in ('true', '1'):
+            return self.stream_list()
+        serializer_class = self.get_serializer_class()
+        queryset = self.values(self.filter_queryset(self.get_queryset()))
+        with read_from_replica(sticky=self.is_sticky_client()):
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response([serializer_class.represent(self.with_slots(row)) for row in page])
+            return Response([serializer_class.represent(self.with_slots(row)) for row in queryset])
+
+    def stream_list(self) -> StreamingHttpResponse:
+        """Stream all accounts as NDJSON, one serialized account per line.
+        Records are read by `.iterator()` chunks, so memory does not grow with the table.
+        """
+        serializer_class = self.get_serializer_class()
+        queryset = self.values(self.filter_queryset(self.get_queryset()).order_by('id'))
+        renderer = self.get_renderers()[0]
+        sticky = self.is_sticky_client()
+
+        def lines():
+            with read_from_replica(sticky=sticky):
+                for row in queryset.iterator(chunk_size=settings.ACCOUNT_LIST_STREAM_CHUNK_SIZE):
+                    yield renderer.render(serializer_class.represent(self.with_slots(row))) + b'\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    def values(self, queryset):
+        """`.values()` rows of the serializer columns and the slots sum of hot accounts."""
+        return queryset.annotate(slot_balance=AccountSlot.objects.balance_expression()).values(
+            *self.get_serializer_class().value_fields(),
+            'slot_balance'
+        )
+
+    @staticmethod
+    def with_slots(row: dict) -> dict:
+        """Add the slots of hot account to the balance of `.values()` row."""
+        if row['slot_balance']:
+            row['balance'] += row['slot_balance']
+        return row
+
+    def get_account_pk(self) -> str:
+        """Account id of the URL in the canonical `str(UUID)` form the writers use for
+        the status cache, replica stickiness and throttle keys. 404 if it is not a UUID.
+        """
+        try:
+            return str(uuid.UUID(str(self.kwargs[self.lookup_url_kwarg or self.lookup_field])))
+        except ValueError:
+            raise Http404
+
+    def is_sticky_client(self) -> bool:
+        return self.sticky_cookie in self.request.COOKIES
+
+    def stick_client(self, response: Response) -> Response:
+        """Mark the client as just written, see `core.routers.ReplicaRouter`."""
+        if settings.DATABASE_REPLICAS and response.status_code < 400:
+            response.set_cookie(self.sticky_cookie, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS)
+        return response
+
+    def build_response(self, operation: BankAccountOperationsEnum) -> dict:
+        """Return the default response message with filled addition."""
+        return {**self.default_response_message, 'addition': operation.value, 'description': {}}
+
+    def get_response_data(self, request: Request, operation: BankAccountOperationsEnum, commit: bool = False):
+        """Return the default response message with filled addition.
+        :param commit: save the valid serializer (mutation actions).
+        """
+        resp = self.build_response(operation)
         instance = self.get_object()
         serializer = self.get_serializer(instance, data=request.data, partial=True)
+        errors = None
         if not serializer.is_valid():
+            errors = serializer.errors
+        elif commit:
+            try:
+                serializer.save()
+            except ValidationError as e:
+                errors = {api_settings.NON_FIELD_ERRORS_KEY: e.detail}
+        if errors:
             resp['result'] = False
-            resp['description'] = serializer.errors
+            resp['description'] = errors
             resp['status'] = status.HTTP_400_BAD_REQUEST
         else:
             resp['description'] = serializer.data
         return resp
 
+    def get_mutation_response(self, request: Request, operation: BankAccountOperationsEnum) -> Response:
+        """Apply mutation action. With `Idempotency-Key` header the first result is
+        stored and replayed on duplicates without touching the account.
+        """
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            resp_data = self.get_response_data(request, operation, commit=True)
+            return self.stick_client(Response(data=resp_data, status=resp_data['status']))
+
+        resp_data = self.build_response(operation)
+        resp_data['result'] = False
+        if not key or len(key) > settings.ACCOUNT_IDEMPOTENCY_KEY_MAX_LENGTH:
+            resp_data['status'] = status.HTTP_400_BAD_REQUEST
+            resp_data['description'] = {
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    f'Idempotency-Key must be 1 to {settings.ACCOUNT_IDEMPOTENCY_KEY_MAX_LENGTH} characters'
+                ]
+            }
+            return Response(data=resp_data, status=resp_data['status'])
+
+        pk = self.get_account_pk()
+        fingerprint = idempotency_store.fingerprint(self.action, pk, request.data)
+        stored_fingerprint, status_code, stored_data, replayed = idempotency_store.execute(
+            key,
+            fingerprint,
+            lambda: self.get_response_data(request, operation, commit=True)
+        )
+        if stored_fingerprint != fingerprint:
+            resp_data['status'] = status.HTTP_422_UNPROCESSABLE_ENTITY
+            resp_data['description'] = {
+                api_settings.NON_FIELD_ERRORS_KEY: ['Idempotency-Key was already used with a different request']
+            }
+            return Response(data=resp_data, status=resp_data['status'])
+        headers = {'Idempotent-Replayed': 'true'} if replayed else None
+        return self.stick_client(Response(data=stored_data, status=status_code, headers=headers))
+
+    def get_status_payload(self) -> dict:
+        """Account status without the input validation pass. Read from `.values()`
+        of the needed columns, or through the serializer in ledger mode.
+        Reads go to a replica unless the account or the client wrote recently.
+        """
+        pk = self.get_account_pk()
+        with read_from_replica(pk=pk, sticky=self.is_sticky_client()):
+            if settings.ACCOUNT_LEDGER_ENABLED:
+                return self.get_serializer(self.get_object()).data
+            queryset = self.values(self.filter_queryset(self.get_queryset()))
+            row = get_object_or_404(queryset, **{self.lookup_field: pk})
+            return self.get_serializer_class().represent(self.with_slots(row))
+
     @action(
         methods=['post'],
         detail=True,
@@ -64,8 +223,7 @@ class BankAccountViewSet(GetSerializerClassMixin,
         serializer_class=BankAccountForAddSerializer
     )
     def add(self, request: Request, *args, **kwargs):
-        resp_data = self.get_response_data(request, BankAccountOperationsEnum.ADD)
-        return Response(data=resp_data, status=resp_data['status'])
+        return self.get_mutation_response(request, BankAccountOperationsEnum.ADD)
 
     @action(
         methods=['post'],
@@ -74,8 +232,34 @@ class BankAccountViewSet(GetSerializerClassMixin,
         serializer_class=BankAccountForSubtractSerializer
     )
     def subtract(self, request: Request, *args, **kwargs):
-        resp_data = self.get_response_data(request, BankAccountOperationsEnum.SUB)
-        return Response(data=resp_data, status=resp_data['status'])
+        return self.get_mutation_response(request, BankAccountOperationsEnum.SUB)
+
+    @action(
+        methods=['post'],
+        detail=True,
+        url_path=r'reservations/(?P<reservation_id>[0-9]+)/capture'
+    )
+    def capture(self, request: Request, *args, **kwargs):
+        """Subtract the reserved amount from the balance and the hold."""
+        return self.get_reservation_response(AccountReservation.objects.capture, BankAccountOperationsEnum.CAPTURE)
+
+    @action(
+        methods=['post'],
+        detail=True,
+        url_path=r'reservations/(?P<reservation_id>[0-9]+)/release'
+    )
+    def release(self, request: Request, *args, **kwargs):
+        """Subtract the reserved amount from the hold, the balance is available again."""
+        return self.get_reservation_response(AccountReservation.objects.release, BankAccountOperationsEnum.RELEASE)
+
+    def get_reservation_response(self, finish, operation: BankAccountOperationsEnum) -> Response:
+        """Finish reservation `reservation_id` of the account, 404 if it is not (or no longer) there."""
+        resp_data = self.build_response(operation)
+        if not finish(self.get_object().id, self.kwargs['reservation_id']):
+            resp_data['result'] = False
+            resp_data['status'] = status.HTTP_404_NOT_FOUND
+            resp_data['description'] = {api_settings.NON_FIELD_ERRORS_KEY: [RESERVATION_NOT_FOUND_MESSAGE]}
+        return self.stick_client(Response(data=resp_data, status=resp_data['status']))
 
     @action(
         methods=['get'],
@@ -84,6 +268,102 @@ class BankAccountViewSet(GetSerializerClassMixin,
         serializer_class=BankAccountForStatusSerializer
     )
     def status(self, request: Request, *args, **kwargs):
-        resp_data = self.get_response_data(request, BankAccountOperationsEnum.STATUS)
+        """Account status, read through `account_status_cache`."""
+        pk = self.get_account_pk()
+        payload, version = account_status_cache.get(pk)
+        if payload is None:
+            payload = self.get_status_payload()
+            account_status_cache.set(pk, payload, version)
+        resp_data = self.build_response(BankAccountOperationsEnum.STATUS)
+        resp_data['description'] = payload
+        return Response(data=resp_data, status=resp_data['status'])
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='batch',
+        serializer_class=BankAccountBatchItemSerializer
+    )
+    def batch(self, request: Request, *args, **kwargs):
+        """Apply a list of `{id, op, value}` items. `description` holds
+        the item results in the request order.
+        """
+        resp_data = self.build_response(BankAccountOperationsEnum.BATCH)
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            resp_data['result'] = False
+            resp_data['description'] = serializer.errors
+            resp_data['status'] = status.HTTP_400_BAD_REQUEST
+        else:
+            results = serializer.save()
+            resp_data['result'] = all(item['result'] for item in results)
+            resp_data['description'] = results
+        return self.stick_client(Response(data=resp_data, status=resp_data['status']))
+
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='stats'
+    )
+    def stats(self, request: Request, *args, **kwargs):
+        """Totals read from the AccountRollup rows, independent of the accounts count.
+        Recomputed from the accounts if the rollup is disabled.
+        """
+        if settings.ACCOUNT_ROLLUP_ENABLED:
+            totals = AccountRollup.objects.totals()
+        else:
+            totals = AccountRollup.objects.recompute()
+        resp_data = self.build_response(BankAccountOperationsEnum.STATS)
+        resp_data['description'] = {
+            'accounts': sum(accounts for accounts, _, _ in totals.values()),
+            'balance': format_minor(sum(balance for _, balance, _ in totals.values())),
+            'hold': format_minor(sum(hold for _, _, hold in totals.values())),
+            'by_status': {
+                account_status: {'accounts': accounts, 'balance': format_minor(balance), 'hold': format_minor(hold)}
+                for account_status, (accounts, balance, hold) in totals.items()
+            }
+        }
         return Response(data=resp_data, status=resp_data['status'])
 
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='import',
+        permission_classes=[IsAdminUser]
+    )
+    def import_accounts(self, request: Request, *args, **kwargs):
+        """Create accounts from the request body, CSV (`text/csv`) or NDJSON
+        (`application/x-ndjson`), read line by line, see `AccountImportFlow`.
+        """
+        file_format = 'ndjson' if request.content_type.startswith(CONTENT_TYPES['ndjson']) else 'csv'
+        lines = codecs.iterdecode(request._request, 'utf-8')
+        try:
+            imported = AccountImportFlow(read_rows(lines, file_format)).run()
+        except DjangoValidationError as e:
+            return Response({'imported': 0, 'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            return Response({'imported': 0, 'error': 'Account already exists'}, status=status.HTTP_409_CONFLICT)
+        return Response({'imported': imported}, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='export',
+        permission_classes=[IsAdminUser]
+    )
+    def export_accounts(self, request: Request, *args, **kwargs):
+        """Stream all accounts, `?output=csv` (default) or `?output=ndjson`."""
+        file_format = request.query_params.get('output', 'csv')
+        if file_format not in FORMATS:
+            return Response({'error': f'output should be one of {", ".join(FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(
+            (chunk.encode() for chunk in AccountExportFlow(file_format).chunks()),
+            content_type=CONTENT_TYPES[file_format]
+        )
+
+
+def metrics_view(request):
+    """Request and flow metrics of all processes in Prometheus text format."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')